@@ -0,0 +1,668 @@
+# Conexão com o banco SQLite (um arquivo por empresa) e criação versionada do esquema
+import hashlib
+import hmac
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from flask import has_request_context, request
+
+from materiais_canonicos import vincular_historico
+
+DB_FILE = os.environ.get('DB_FILE', 'dados_notas_fiscais.db')
+
+# Cada empresa grava no próprio arquivo, então a ingestão de uma unidade não disputa o lock
+# de escrita nem cresce a tabela das outras. A empresa padrão (matriz) continua em DB_FILE;
+# as demais ficam em EMPRESAS_DIR/<empresa>.db. Só empresas listadas em EMPRESAS são aceitas.
+EMPRESA_PADRAO = os.environ.get('EMPRESA_PADRAO', 'matriz')
+EMPRESAS = list(dict.fromkeys([EMPRESA_PADRAO] + [e.strip() for e in os.environ.get('EMPRESAS', '').split(',') if e.strip()]))
+EMPRESAS_DIR = os.environ.get('EMPRESAS_DIR', 'empresas')
+
+# A empresa de uma requisição nunca é escolhida pelo cliente: vem de um token assinado com
+# EMPRESAS_SEGREDO, que o proxy de autenticação coloca no cabeçalho X-Empresa-Token de toda
+# requisição do usuário ("empresa:expira:assinatura", ver assinar_empresa). Sem segredo
+# configurado, toda requisição usa a empresa padrão.
+SEGREDO_EMPRESAS = os.environ.get('EMPRESAS_SEGREDO', '')
+CABECALHO_EMPRESA = 'X-Empresa-Token'
+
+# Conexões ociosas mantidas por empresa e comandos preparados em cache por conexão
+TAMANHO_POOL = int(os.environ.get('BANCO_TAMANHO_POOL', 8))
+CACHE_COMANDOS = int(os.environ.get('BANCO_CACHE_COMANDOS', 256))
+# Limite padrão do SQLite para bancos anexados a uma conexão
+LIMITE_ATTACH = 10
+
+
+class EmpresaDesconhecida(LookupError):
+    pass
+
+
+class EmpresaNaoAutenticada(PermissionError):
+    pass
+
+
+def caminho_banco(empresa):
+    if empresa == EMPRESA_PADRAO:
+        return DB_FILE
+    return os.path.join(EMPRESAS_DIR, f"{empresa}.db")
+
+
+def _assinatura(empresa, expira):
+    return hmac.new(SEGREDO_EMPRESAS.encode(), f"{empresa}:{expira}".encode(), hashlib.sha256).hexdigest()
+
+
+def assinar_empresa(empresa, validade_segundos=3600):
+    # Usado pelo proxy de autenticação (ou por scripts) para gerar o X-Empresa-Token
+    if not SEGREDO_EMPRESAS:
+        raise RuntimeError("EMPRESAS_SEGREDO não configurado.")
+    expira = int(time.time()) + validade_segundos
+    return f"{empresa}:{expira}:{_assinatura(empresa, expira)}"
+
+
+def empresa_autenticada():
+    # Empresa do token assinado da requisição; None quando não há segredo configurado
+    if not SEGREDO_EMPRESAS:
+        return None
+    token = request.headers.get(CABECALHO_EMPRESA, '')
+    try:
+        empresa, expira, assinatura = token.rsplit(':', 2)
+        expira = int(expira)
+    except ValueError:
+        raise EmpresaNaoAutenticada("Token de empresa ausente ou inválido.")
+    if not hmac.compare_digest(assinatura, _assinatura(empresa, expira)):
+        raise EmpresaNaoAutenticada("Token de empresa ausente ou inválido.")
+    if expira < time.time():
+        raise EmpresaNaoAutenticada("Token de empresa expirado.")
+    return empresa
+
+
+def empresa_atual():
+    # Em uma requisição, a empresa do token assinado (ou a padrão, sem segredo configurado);
+    # fora dela, a empresa padrão
+    if not has_request_context():
+        return EMPRESA_PADRAO
+    empresa = empresa_autenticada() or EMPRESA_PADRAO
+    if empresa not in EMPRESAS:
+        raise EmpresaDesconhecida(f"Empresa desconhecida: {empresa}")
+    return empresa
+
+
+class ConexaoReutilizavel(sqlite3.Connection):
+    # close() devolve a conexão ao pool da empresa em vez de fechá-la, preservando o cache de
+    # comandos preparados entre requisições. Transação esquecida aberta é desfeita antes.
+    empresa = None
+    emprestada = False
+
+    def close(self):
+        if not self.emprestada:
+            return
+        self.emprestada = False
+        try:
+            if self.in_transaction:
+                self.rollback()
+            self.isolation_level = ''
+            _pool(self.empresa).put_nowait(self)
+        except (queue.Full, sqlite3.Error):
+            super().close()
+
+
+_pools = {}
+_trava_pools = threading.Lock()
+_bancos_preparados = set()
+
+
+def _pool(empresa):
+    with _trava_pools:
+        if empresa not in _pools:
+            _pools[empresa] = queue.LifoQueue(maxsize=TAMANHO_POOL)
+        return _pools[empresa]
+
+
+def conectar(empresa=None):
+    empresa = empresa or empresa_atual()
+    try:
+        conexao = _pool(empresa).get_nowait()
+    except queue.Empty:
+        if empresa not in _bancos_preparados:
+            preparar_banco(empresa)
+        # check_same_thread=False: a conexão volta ao pool e pode ser usada por outra thread depois
+        conexao = sqlite3.connect(caminho_banco(empresa), timeout=30, check_same_thread=False,
+                                  cached_statements=CACHE_COMANDOS, factory=ConexaoReutilizavel)
+        conexao.empresa = empresa
+        # WAL deixa leitores trabalhando durante uma gravação e reduz fsyncs por commit
+        conexao.execute("PRAGMA journal_mode = WAL")
+        conexao.execute("PRAGMA synchronous = NORMAL")
+    conexao.emprestada = True
+    return conexao
+
+
+def conectar_consolidado(empresas):
+    # Conexão em memória com o banco de cada empresa anexado só para leitura, como e0, e1, ...;
+    # consultas da matriz cruzam as empresas com UNION ALL sem tocar no lock de escrita delas
+    if len(empresas) > LIMITE_ATTACH:
+        raise ValueError(f"No máximo {LIMITE_ATTACH} empresas por conexão consolidada.")
+    conexao = sqlite3.connect(':memory:', uri=True)
+    esquemas = {}
+    for i, empresa in enumerate(empresas):
+        if empresa not in _bancos_preparados:
+            preparar_banco(empresa)
+        caminho = os.path.abspath(caminho_banco(empresa))
+        conexao.execute("ATTACH DATABASE ? AS ?", (f"file:{caminho}?mode=ro", f"e{i}"))
+        esquemas[empresa] = f"e{i}"
+    return conexao, esquemas
+
+
+# Cada migração roda uma única vez; a versão aplicada fica em PRAGMA user_version.
+# Para mudar o esquema, acrescente uma nova função ao final de MIGRACOES.
+def _migracao_001_esquema_inicial(cursor):
+    # Tabela de notas fiscais (sem alteração)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notas_fiscais (
+            id INTEGER PRIMARY KEY, chave_acesso NVARCHAR(255), emissor NVARCHAR(255),
+            cnpj_emissor NVARCHAR(30), data_emissao_nota DATE, codigo_produto NVARCHAR(50), 
+            descricao_produto NVARCHAR(255), ncm_sh NVARCHAR(20), cfop NVARCHAR(20),
+            unidade_medida NVARCHAR(10), quantidade INT, valor_unitario DECIMAL(18, 2),
+            valor_total DECIMAL(18, 2), data_processamento DATE, origem_dados NVARCHAR(50)
+        )
+    ''')
+    
+    # Tabela de produtos (sem alteração)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INTEGER PRIMARY KEY, nome_produto NVARCHAR(255),
+            total_custo DECIMAL(18, 2), data_cadastro DATE
+        )
+    ''')
+
+    # Tabela de associação (sem alteração)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS produto_materias_primas (
+            id INTEGER PRIMARY KEY, produto_id INTEGER, materia_prima_id INTEGER,
+            quantidade_utilizada DECIMAL(18, 2), unidade_medida NVARCHAR(10),
+            FOREIGN KEY (produto_id) REFERENCES produtos(id),
+            FOREIGN KEY (materia_prima_id) REFERENCES notas_fiscais(id)
+        )
+    ''')
+    
+    # Tabela de atributos que criamos no Passo 1 (sem alteração)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS atributos_materias_primas (
+            id INTEGER PRIMARY KEY, descricao_produto NVARCHAR(255) UNIQUE,
+            peso_bruto DECIMAL(18, 3), unidade_medida_padrao NVARCHAR(10)
+        )
+    ''')
+
+    # Regras de custo versionadas (a versão mais recente é a ativa)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS regras_custo (
+            versao INTEGER PRIMARY KEY AUTOINCREMENT, regras TEXT NOT NULL, data_criacao DATE
+        )
+    ''')
+    cursor.execute("SELECT COUNT(*) FROM regras_custo")
+    if cursor.fetchone()[0] == 0:
+        # Regras iniciais gravadas como texto: a migração não acompanha mudanças em REGRAS_PADRAO
+        # Equivalem ao CASE antigo; as conversões de embalagem (CX, G, RL) ficam como modelo opcional
+        regras_iniciais = (
+            '{"politica_preco": "recente", "ultimas_n": 3, "conversoes": ['
+            '{"de": "*", "para": "UN", "divisor": 1}, '
+            '{"de": "*", "para": "MT", "divisor": 1}, '
+            '{"de": "*", "para": "KG", "divisor": 1}, '
+            '{"de": "*", "para": "LT", "divisor": "peso_bruto", "divisor_obrigatorio": true}], '
+            '"rateio": {"frete_percentual": 0, "impostos_percentual": 0}}'
+        )
+        cursor.execute("INSERT INTO regras_custo (regras, data_criacao) VALUES (?, ?)", (regras_iniciais, date.today()))
+
+    # Custos calculados pelo motor de regras, materializados em lote
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS custos_materias_primas (
+            descricao_produto NVARCHAR(255) PRIMARY KEY, custo_por_unidade_padrao DECIMAL(18, 6)
+        )
+    ''')
+
+    # Contadores de versão usados para invalidar os custos derivados
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS controle_versoes (
+            chave NVARCHAR(50) PRIMARY KEY, valor INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO controle_versoes (chave, valor) VALUES ('dados', 1)")
+
+    for tabela in ('notas_fiscais', 'atributos_materias_primas'):
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados';
+                END
+            ''')
+
+    # Estado corrente do custo médio ponderado e camadas FIFO, mantidos pelos triggers abaixo
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estado_custo_medio (
+            descricao_produto NVARCHAR(255) PRIMARY KEY,
+            quantidade_total DECIMAL(18, 6) NOT NULL, valor_total DECIMAL(18, 6) NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS camadas_fifo (
+            id INTEGER PRIMARY KEY, nota_id INTEGER UNIQUE, descricao_produto NVARCHAR(255),
+            data_emissao_nota DATE, quantidade_restante DECIMAL(18, 6) NOT NULL, valor_unitario DECIMAL(18, 6)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_camadas_fifo_abertas
+        ON camadas_fifo (descricao_produto, data_emissao_nota, id) WHERE quantidade_restante > 0
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estado_custos_insert
+        AFTER INSERT ON notas_fiscais
+        WHEN NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL
+        BEGIN
+            INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+            VALUES (NEW.descricao_produto, NEW.quantidade, NEW.quantidade * NEW.valor_unitario)
+            ON CONFLICT(descricao_produto) DO UPDATE SET
+                quantidade_total = quantidade_total + excluded.quantidade_total,
+                valor_total = valor_total + excluded.valor_total;
+
+            INSERT INTO camadas_fifo (nota_id, descricao_produto, data_emissao_nota, quantidade_restante, valor_unitario)
+            VALUES (NEW.id, NEW.descricao_produto, NEW.data_emissao_nota, NEW.quantidade, NEW.valor_unitario);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estado_custos_delete
+        AFTER DELETE ON notas_fiscais
+        WHEN OLD.descricao_produto IS NOT NULL AND OLD.quantidade > 0 AND OLD.valor_unitario IS NOT NULL
+        BEGIN
+            UPDATE estado_custo_medio
+            SET quantidade_total = quantidade_total - OLD.quantidade,
+                valor_total = valor_total - OLD.quantidade * OLD.valor_unitario
+            WHERE descricao_produto = OLD.descricao_produto;
+
+            DELETE FROM camadas_fifo WHERE nota_id = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_estado_custos_update
+        AFTER UPDATE OF descricao_produto, quantidade, valor_unitario, data_emissao_nota ON notas_fiscais
+        BEGIN
+            -- Estorna a nota antiga e aplica a nova (apenas a diferença, em O(1))
+            UPDATE estado_custo_medio
+            SET quantidade_total = quantidade_total - OLD.quantidade,
+                valor_total = valor_total - OLD.quantidade * OLD.valor_unitario
+            WHERE descricao_produto = OLD.descricao_produto
+                AND OLD.descricao_produto IS NOT NULL AND OLD.quantidade > 0 AND OLD.valor_unitario IS NOT NULL;
+
+            INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+            SELECT NEW.descricao_produto, NEW.quantidade, NEW.quantidade * NEW.valor_unitario
+            WHERE NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL
+            ON CONFLICT(descricao_produto) DO UPDATE SET
+                quantidade_total = quantidade_total + excluded.quantidade_total,
+                valor_total = valor_total + excluded.valor_total;
+
+            -- A camada preserva o que já foi consumido dela
+            UPDATE camadas_fifo
+            SET descricao_produto = NEW.descricao_produto,
+                data_emissao_nota = NEW.data_emissao_nota,
+                valor_unitario = NEW.valor_unitario,
+                quantidade_restante = MAX(0, quantidade_restante + NEW.quantidade - COALESCE(OLD.quantidade, 0))
+            WHERE nota_id = OLD.id;
+
+            INSERT OR IGNORE INTO camadas_fifo (nota_id, descricao_produto, data_emissao_nota, quantidade_restante, valor_unitario)
+            SELECT NEW.id, NEW.descricao_produto, NEW.data_emissao_nota, NEW.quantidade, NEW.valor_unitario
+            WHERE NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL;
+
+            DELETE FROM camadas_fifo
+            WHERE nota_id = NEW.id
+                AND NOT (NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL);
+        END
+    ''')
+
+    cursor.execute("SELECT valor FROM controle_versoes WHERE chave = 'estado_custos_inicializado'")
+    if not cursor.fetchone():
+        # Carga única do histórico existente; a partir daqui só há atualizações incrementais
+        cursor.execute("DELETE FROM estado_custo_medio")
+        cursor.execute("DELETE FROM camadas_fifo")
+        cursor.execute('''
+            INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+            SELECT descricao_produto, SUM(quantidade), SUM(quantidade * valor_unitario)
+            FROM notas_fiscais
+            WHERE descricao_produto IS NOT NULL AND quantidade > 0 AND valor_unitario IS NOT NULL
+            GROUP BY descricao_produto
+        ''')
+        cursor.execute('''
+            INSERT INTO camadas_fifo (nota_id, descricao_produto, data_emissao_nota, quantidade_restante, valor_unitario)
+            SELECT id, descricao_produto, data_emissao_nota, quantidade, valor_unitario
+            FROM notas_fiscais
+            WHERE descricao_produto IS NOT NULL AND quantidade > 0 AND valor_unitario IS NOT NULL
+        ''')
+        cursor.execute("INSERT INTO controle_versoes (chave, valor) VALUES ('estado_custos_inicializado', 1)")
+
+    cursor.execute('DROP VIEW IF EXISTS produtos_data_mais_recente')
+    cursor.execute('DROP VIEW IF EXISTS materias_primas_detalhadas')
+
+
+    cursor.execute('''
+        CREATE VIEW materias_primas_detalhadas AS
+        WITH produtos_agrupados AS (
+            SELECT
+                nf.id, nf.data_emissao_nota, nf.codigo_produto, nf.descricao_produto,
+                nf.unidade_medida AS unidade_medida_nf,
+                nf.valor_unitario AS valor_unitario_nf,
+                ROW_NUMBER() OVER(PARTITION BY nf.descricao_produto ORDER BY nf.data_emissao_nota DESC, nf.id ASC) AS rn
+            FROM notas_fiscais nf
+        )
+        SELECT
+            pa.id,
+            pa.data_emissao_nota,
+            pa.codigo_produto,
+            pa.descricao_produto,
+            pa.unidade_medida_nf,
+            pa.valor_unitario_nf,
+            amp.peso_bruto,
+            amp.unidade_medida_padrao,
+            -- O custo vem do motor de regras (regras_custo.py), não mais de um CASE fixo
+            cmp.custo_por_unidade_padrao
+        FROM produtos_agrupados pa
+        LEFT JOIN atributos_materias_primas amp ON pa.descricao_produto = amp.descricao_produto
+        LEFT JOIN custos_materias_primas cmp ON pa.descricao_produto = cmp.descricao_produto
+        WHERE pa.rn = 1
+    ''')
+
+
+def _migracao_002_triggers_carga_em_lote(cursor):
+    # Os triggers de inserção ficam inativos durante cargas em lote, que aplicam
+    # estado e versão uma única vez ao final (ver custeio_estoque.py)
+    cursor.execute("DROP TRIGGER IF EXISTS trg_estado_custos_insert")
+    cursor.execute('''
+        CREATE TRIGGER trg_estado_custos_insert
+        AFTER INSERT ON notas_fiscais
+        WHEN NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM controle_versoes WHERE chave = 'carga_em_lote')
+        BEGIN
+            INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+            VALUES (NEW.descricao_produto, NEW.quantidade, NEW.quantidade * NEW.valor_unitario)
+            ON CONFLICT(descricao_produto) DO UPDATE SET
+                quantidade_total = quantidade_total + excluded.quantidade_total,
+                valor_total = valor_total + excluded.valor_total;
+
+            INSERT INTO camadas_fifo (nota_id, descricao_produto, data_emissao_nota, quantidade_restante, valor_unitario)
+            VALUES (NEW.id, NEW.descricao_produto, NEW.data_emissao_nota, NEW.quantidade, NEW.valor_unitario);
+        END
+    ''')
+
+    cursor.execute("DROP TRIGGER IF EXISTS trg_versao_notas_fiscais_insert")
+    cursor.execute('''
+        CREATE TRIGGER trg_versao_notas_fiscais_insert
+        AFTER INSERT ON notas_fiscais
+        WHEN NOT EXISTS (SELECT 1 FROM controle_versoes WHERE chave = 'carga_em_lote')
+        BEGIN
+            UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados';
+        END
+    ''')
+
+
+def _migracao_003_versao_em_lote_para_atributos_e_correcoes(cursor):
+    # Mapeamentos e correções de preço em lote também invalidam os custos uma única vez,
+    # ao final da transação, em vez de uma vez por linha
+    eventos = [('notas_fiscais', 'UPDATE'), ('notas_fiscais', 'DELETE'),
+               ('atributos_materias_primas', 'INSERT'), ('atributos_materias_primas', 'UPDATE'),
+               ('atributos_materias_primas', 'DELETE')]
+    for tabela, evento in eventos:
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_versao_{tabela}_{evento.lower()}")
+        cursor.execute(f'''
+            CREATE TRIGGER trg_versao_{tabela}_{evento.lower()}
+            AFTER {evento} ON {tabela}
+            WHEN NOT EXISTS (SELECT 1 FROM controle_versoes WHERE chave = 'carga_em_lote')
+            BEGIN
+                UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados';
+            END
+        ''')
+
+
+def _migracao_004_cache_painel(cursor):
+    # Versão própria para o cadastro de produtos: alterar um produto invalida o dashboard,
+    # mas não os custos das matérias-primas
+    cursor.execute("INSERT OR IGNORE INTO controle_versoes (chave, valor) VALUES ('produtos', 1)")
+    for tabela in ('produtos', 'produto_materias_primas'):
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'produtos';
+                END
+            ''')
+
+    # Indicadores do dashboard já agregados, válidos para as versões gravadas junto
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_painel (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            versao_dados INTEGER NOT NULL, versao_regras INTEGER NOT NULL, versao_produtos INTEGER NOT NULL,
+            conteudo TEXT NOT NULL
+        )
+    ''')
+
+
+def _migracao_005_materiais_canonicos(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS materiais_canonicos (
+            id INTEGER PRIMARY KEY, descricao NVARCHAR(255) UNIQUE NOT NULL,
+            chave_normalizada NVARCHAR(255) UNIQUE NOT NULL
+        )
+    ''')
+    # status: 'exato', 'automatico', 'novo', 'revisao' (aguardando decisão) ou 'confirmado'
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS descricoes_materiais (
+            id INTEGER PRIMARY KEY, descricao_produto NVARCHAR(255) UNIQUE NOT NULL,
+            material_id INTEGER NOT NULL REFERENCES materiais_canonicos(id),
+            status NVARCHAR(20) NOT NULL, similaridade REAL, sugestao_material_id INTEGER
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_descricoes_materiais_material ON descricoes_materiais (material_id)")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_descricoes_materiais_revisao
+        ON descricoes_materiais (id) WHERE status = 'revisao'
+    ''')
+    # Vincula as descrições existentes e leva estado, camadas e atributos para o material canônico.
+    # Única etapa não congelada: o resultado segue a normalização e os limiares MATERIAIS_LIMIAR_*
+    # de quando a migração roda, então o mesmo histórico pode agrupar diferente em outro ambiente
+    vincular_historico(cursor)
+
+    # Estado e camadas passam a ser agrupados pela descrição canônica
+    for trigger in ('insert', 'delete', 'update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_estado_custos_{trigger}")
+    cursor.execute('''
+        CREATE TRIGGER trg_estado_custos_insert
+        AFTER INSERT ON notas_fiscais
+        WHEN NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM controle_versoes WHERE chave = 'carga_em_lote')
+        BEGIN
+            INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+            VALUES (COALESCE((
+                SELECT mc.descricao FROM descricoes_materiais dm JOIN materiais_canonicos mc ON mc.id = dm.material_id
+                WHERE dm.descricao_produto = NEW.descricao_produto
+            ), NEW.descricao_produto), NEW.quantidade, NEW.quantidade * NEW.valor_unitario)
+            ON CONFLICT(descricao_produto) DO UPDATE SET
+                quantidade_total = quantidade_total + excluded.quantidade_total,
+                valor_total = valor_total + excluded.valor_total;
+
+            INSERT INTO camadas_fifo (nota_id, descricao_produto, data_emissao_nota, quantidade_restante, valor_unitario)
+            VALUES (NEW.id, COALESCE((
+                SELECT mc.descricao FROM descricoes_materiais dm JOIN materiais_canonicos mc ON mc.id = dm.material_id
+                WHERE dm.descricao_produto = NEW.descricao_produto
+            ), NEW.descricao_produto), NEW.data_emissao_nota, NEW.quantidade, NEW.valor_unitario);
+        END
+    ''')
+    # Excluir ou alterar uma nota estorna só o saldo ainda não baixado da camada (registrar_baixa
+    # pode ter consumido parte dela); o estado é lido da camada, que já guarda a descrição
+    # canônica sob a qual a nota foi aplicada
+    cursor.execute('''
+        CREATE TRIGGER trg_estado_custos_delete
+        AFTER DELETE ON notas_fiscais
+        WHEN OLD.descricao_produto IS NOT NULL AND OLD.quantidade > 0 AND OLD.valor_unitario IS NOT NULL
+        BEGIN
+            UPDATE estado_custo_medio
+            SET quantidade_total = quantidade_total - (SELECT quantidade_restante FROM camadas_fifo WHERE nota_id = OLD.id),
+                valor_total = CASE
+                    WHEN quantidade_total - (SELECT quantidade_restante FROM camadas_fifo WHERE nota_id = OLD.id) <= 0 THEN 0
+                    ELSE MAX(0, valor_total - (SELECT quantidade_restante FROM camadas_fifo WHERE nota_id = OLD.id) * OLD.valor_unitario)
+                END
+            WHERE descricao_produto = (SELECT descricao_produto FROM camadas_fifo WHERE nota_id = OLD.id);
+
+            DELETE FROM camadas_fifo WHERE nota_id = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_estado_custos_update
+        AFTER UPDATE OF descricao_produto, quantidade, valor_unitario, data_emissao_nota ON notas_fiscais
+        BEGIN
+            -- Estorna o saldo não baixado da camada antiga...
+            UPDATE estado_custo_medio
+            SET quantidade_total = quantidade_total - (SELECT quantidade_restante FROM camadas_fifo WHERE nota_id = OLD.id),
+                valor_total = CASE
+                    WHEN quantidade_total - (SELECT quantidade_restante FROM camadas_fifo WHERE nota_id = OLD.id) <= 0 THEN 0
+                    ELSE MAX(0, valor_total - (SELECT quantidade_restante FROM camadas_fifo WHERE nota_id = OLD.id) * OLD.valor_unitario)
+                END
+            WHERE descricao_produto = (SELECT descricao_produto FROM camadas_fifo WHERE nota_id = OLD.id);
+
+            -- ...e aplica a nota nova descontando o que já tinha sido baixado dela
+            INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+            SELECT COALESCE((
+                SELECT mc.descricao FROM descricoes_materiais dm JOIN materiais_canonicos mc ON mc.id = dm.material_id
+                WHERE dm.descricao_produto = NEW.descricao_produto
+            ), NEW.descricao_produto), saldo, saldo * NEW.valor_unitario
+            FROM (
+                SELECT MAX(0, NEW.quantidade - COALESCE(
+                    (SELECT OLD.quantidade - quantidade_restante FROM camadas_fifo WHERE nota_id = OLD.id), 0
+                )) AS saldo
+            )
+            WHERE NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL AND saldo > 0
+            ON CONFLICT(descricao_produto) DO UPDATE SET
+                quantidade_total = quantidade_total + excluded.quantidade_total,
+                valor_total = valor_total + excluded.valor_total;
+
+            -- A camada preserva o que já foi consumido dela
+            UPDATE camadas_fifo
+            SET descricao_produto = COALESCE((
+                    SELECT mc.descricao FROM descricoes_materiais dm JOIN materiais_canonicos mc ON mc.id = dm.material_id
+                    WHERE dm.descricao_produto = NEW.descricao_produto
+                ), NEW.descricao_produto),
+                data_emissao_nota = NEW.data_emissao_nota,
+                valor_unitario = NEW.valor_unitario,
+                quantidade_restante = MAX(0, quantidade_restante + NEW.quantidade - COALESCE(OLD.quantidade, 0))
+            WHERE nota_id = OLD.id;
+
+            INSERT OR IGNORE INTO camadas_fifo (nota_id, descricao_produto, data_emissao_nota, quantidade_restante, valor_unitario)
+            SELECT NEW.id, COALESCE((
+                SELECT mc.descricao FROM descricoes_materiais dm JOIN materiais_canonicos mc ON mc.id = dm.material_id
+                WHERE dm.descricao_produto = NEW.descricao_produto
+            ), NEW.descricao_produto), NEW.data_emissao_nota, NEW.quantidade, NEW.valor_unitario
+            WHERE NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL;
+
+            DELETE FROM camadas_fifo
+            WHERE nota_id = NEW.id
+                AND NOT (NEW.descricao_produto IS NOT NULL AND NEW.quantidade > 0 AND NEW.valor_unitario IS NOT NULL);
+        END
+    ''')
+
+    # Cada nota com a descrição do material canônico a que pertence
+    cursor.execute('DROP VIEW IF EXISTS notas_fiscais_canonicas')
+    cursor.execute('''
+        CREATE VIEW notas_fiscais_canonicas AS
+        SELECT nf.*, COALESCE(mc.descricao, nf.descricao_produto) AS descricao_canonica
+        FROM notas_fiscais nf
+        LEFT JOIN descricoes_materiais dm ON dm.descricao_produto = nf.descricao_produto
+        LEFT JOIN materiais_canonicos mc ON mc.id = dm.material_id
+    ''')
+
+    # Uma linha por material canônico (não mais por texto de descrição)
+    cursor.execute('DROP VIEW IF EXISTS materias_primas_detalhadas')
+    cursor.execute('''
+        CREATE VIEW materias_primas_detalhadas AS
+        WITH produtos_agrupados AS (
+            SELECT
+                nf.id, nf.data_emissao_nota, nf.codigo_produto, nf.descricao_canonica,
+                nf.unidade_medida AS unidade_medida_nf,
+                nf.valor_unitario AS valor_unitario_nf,
+                ROW_NUMBER() OVER(PARTITION BY nf.descricao_canonica ORDER BY nf.data_emissao_nota DESC, nf.id ASC) AS rn
+            FROM notas_fiscais_canonicas nf
+        )
+        SELECT
+            pa.id,
+            pa.data_emissao_nota,
+            pa.codigo_produto,
+            pa.descricao_canonica AS descricao_produto,
+            pa.unidade_medida_nf,
+            pa.valor_unitario_nf,
+            amp.peso_bruto,
+            amp.unidade_medida_padrao,
+            cmp.custo_por_unidade_padrao
+        FROM produtos_agrupados pa
+        LEFT JOIN atributos_materias_primas amp ON pa.descricao_canonica = amp.descricao_produto
+        LEFT JOIN custos_materias_primas cmp ON pa.descricao_canonica = cmp.descricao_produto
+        WHERE pa.rn = 1
+    ''')
+    cursor.execute("UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados'")
+
+
+def _migracao_006_eventos(cursor):
+    # Feed de alterações lido por /events; AUTOINCREMENT garante que seq nunca é reutilizado,
+    # mesmo depois de eventos antigos serem apagados
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS eventos (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo NVARCHAR(50) NOT NULL,
+            dados TEXT NOT NULL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+MIGRACOES = [
+    _migracao_001_esquema_inicial,
+    _migracao_002_triggers_carga_em_lote,
+    _migracao_003_versao_em_lote_para_atributos_e_correcoes,
+    _migracao_004_cache_painel,
+    _migracao_005_materiais_canonicos,
+    _migracao_006_eventos,
+]
+VERSAO_ESQUEMA = len(MIGRACOES)
+
+
+def preparar_banco(empresa=EMPRESA_PADRAO):
+    caminho = caminho_banco(empresa)
+    if os.path.dirname(caminho):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    conexao = sqlite3.connect(caminho, isolation_level=None)
+    try:
+        cursor = conexao.cursor()
+        versao_atual = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if versao_atual >= VERSAO_ESQUEMA:
+            _bancos_preparados.add(empresa)
+            return False
+
+        # Trava de escrita: se vários workers sobem juntos, só um aplica as migrações
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            versao_atual = cursor.execute("PRAGMA user_version").fetchone()[0]
+            for versao, migracao in enumerate(MIGRACOES[versao_atual:], start=versao_atual + 1):
+                print(f"[{empresa}] Aplicando migração {versao}: {migracao.__name__}...")
+                migracao(cursor)
+                cursor.execute(f"PRAGMA user_version = {versao}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        _bancos_preparados.add(empresa)
+        return True
+    finally:
+        conexao.close()
+
+
+def preparar_bancos():
+    if len(EMPRESAS) > 1 and not SEGREDO_EMPRESAS:
+        print(f"Aviso: EMPRESAS_SEGREDO não configurado; as requisições só acessam a empresa {EMPRESA_PADRAO}.")
+    return [empresa for empresa in EMPRESAS if preparar_banco(empresa)]
@@ -0,0 +1,77 @@
+# Mede o tempo de inicialização do backend com `python -X importtime`.
+#
+# Uso:
+#   python benchmark_inicializacao.py                     # módulos padrão do app (MODULOS_PADRAO)
+#   python benchmark_inicializacao.py --modulos leitura   # worker só de leitura
+#   python benchmark_inicializacao.py --limite-ms 800     # falha se passar do limite
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PASTA_BACKEND = os.path.dirname(os.path.abspath(__file__))
+MODULOS_PESADOS = ('pandas', 'numpy', 'pdfplumber', 'pdfminer')
+
+
+def medir(modulos, db_file):
+    # Sem --modulos vale o BACKEND_MODULOS do ambiente ou, na falta dele, o MODULOS_PADRAO do app
+    ambiente = dict(os.environ, DB_FILE=db_file)
+    if modulos:
+        ambiente['BACKEND_MODULOS'] = modulos
+    inicio = time.perf_counter()
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app; print(",".join(app.app.blueprints))'],
+        cwd=PASTA_BACKEND, env=ambiente, capture_output=True, text=True
+    )
+    tempo_total_ms = (time.perf_counter() - inicio) * 1000
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falha ao importar o app:\n{resultado.stderr}")
+
+    # Linhas no formato "import time: self [us] | cumulative | imported package"
+    imports = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith('import time:') or 'cumulative' in linha:
+            continue
+        _, proprio, cumulativo, nome = [parte.strip() for parte in linha.replace('import time:', '|', 1).split('|')]
+        imports.append((nome, int(proprio), int(cumulativo)))
+
+    carregados = resultado.stdout.strip().splitlines()[-1] if resultado.stdout.strip() else ''
+    return tempo_total_ms, imports, carregados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização do backend")
+    parser.add_argument('--modulos', help="Valor de BACKEND_MODULOS (padrão: o do ambiente ou MODULOS_PADRAO do app)")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="Quantos imports mais lentos listar")
+    parser.add_argument('--limite-ms', type=float, help="Falha se a mediana passar deste valor")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        db_file = os.path.join(pasta, 'benchmark.db')
+        # A primeira execução aplica as migrações; as medições refletem um restart a frio comum
+        medir(args.modulos, db_file)
+        medicoes = [medir(args.modulos, db_file) for _ in range(args.repeticoes)]
+
+    tempos = sorted(tempo for tempo, _, _ in medicoes)
+    mediana = tempos[len(tempos) // 2]
+    _, imports, modulos_carregados = medicoes[-1]
+
+    print(f"Módulos de rotas: {modulos_carregados}")
+    print(f"Inicialização (mediana de {args.repeticoes}): {mediana:.0f} ms  (min {tempos[0]:.0f} ms, max {tempos[-1]:.0f} ms)")
+    print(f"\nTop {args.top} imports por tempo cumulativo:")
+    for nome, _, cumulativo in sorted(imports, key=lambda i: i[2], reverse=True)[:args.top]:
+        print(f"  {cumulativo / 1000:8.1f} ms  {nome}")
+
+    carregados = sorted({nome.strip().split('.')[0] for nome, _, _ in imports} & set(MODULOS_PESADOS))
+    print(f"\nMódulos pesados carregados na inicialização: {', '.join(carregados) or 'nenhum'}")
+
+    if args.limite_ms is not None and mediana > args.limite_ms:
+        print(f"\nFALHOU: {mediana:.0f} ms acima do limite de {args.limite_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,665 @@
+# Rotas de cadastro e manutenção (materiais, produtos, mapeamentos, baixas e regras de custo)
+import json
+from datetime import date
+
+from flask import Blueprint, request, jsonify
+
+from banco import conectar
+from custeio_estoque import finalizar_carga_em_lote, iniciar_carga_em_lote, registrar_baixa
+from eventos import registrar_evento
+from leitura import buscar_detalhes_produto
+from materiais_canonicos import descricao_canonica, fundir_materiais, vincular_descricao, vincular_descricoes
+from regras_custo import atualizar_custos, custos_em_dia, garantir_custos_atualizados, validar_regras, recalcular_custos
+
+cadastro_bp = Blueprint('cadastro', __name__)
+
+# Rota para editar um material (PUT)
+@cadastro_bp.route('/materias-primas/<int:id>', methods=['PUT'])
+def editar_materia_prima(id):
+    try:
+        dados_recebidos = request.json
+        
+        conexao = conectar()
+        conexao.isolation_level = None
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        em_dia = custos_em_dia(cursor)
+
+        campos_para_atualizar = []
+        valores = []
+
+        # Descrição anterior, para o feed de eventos atualizar também o material de onde a nota saiu
+        cursor.execute("SELECT descricao_produto FROM notas_fiscais WHERE id = ?", (id,))
+        anterior = cursor.fetchone()
+
+        if 'descricao_produto' in dados_recebidos:
+            vincular_descricao(cursor, dados_recebidos.get('descricao_produto'))
+            campos_para_atualizar.append('descricao_produto = ?')
+            valores.append(dados_recebidos.get('descricao_produto'))
+        
+        if 'unidade_medida' in dados_recebidos:
+            campos_para_atualizar.append('unidade_medida = ?')
+            valores.append(dados_recebidos.get('unidade_medida'))
+        
+        if 'valor_unitario' in dados_recebidos:
+            campos_para_atualizar.append('valor_unitario = ?')
+            valores.append(dados_recebidos.get('valor_unitario'))
+        
+        campos_para_atualizar.append('data_processamento = ?')
+        valores.append(date.today())
+        
+        query = f"UPDATE notas_fiscais SET {', '.join(campos_para_atualizar)} WHERE id = ?"
+        valores.append(id)
+
+        cursor.execute(query, tuple(valores))
+        alterados = cursor.rowcount
+        if alterados:
+            # Só os custos do material de onde a nota saiu e do material para onde foi
+            if em_dia:
+                atualizar_custos(cursor, [anterior[0], dados_recebidos.get('descricao_produto')])
+            registrar_evento(cursor, 'materiais_alterados', {
+                "descricoes": [anterior[0], dados_recebidos.get('descricao_produto')]
+            })
+        
+        conexao.commit()
+        
+        if alterados == 0:
+            return jsonify({"error": "Material não encontrado ou nenhum dado alterado"}), 404
+            
+        return jsonify({"message": f"Material com ID {id} atualizado com sucesso!"}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao atualizar material: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para excluir um material por ID (DELETE)
+@cadastro_bp.route('/materias-primas/<int:id>', methods=['DELETE'])
+def excluir_materia_prima(id):
+    try:
+        conexao = conectar()
+        conexao.isolation_level = None
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        em_dia = custos_em_dia(cursor)
+        
+        cursor.execute("SELECT descricao_produto FROM notas_fiscais WHERE id = ?", (id,))
+        anterior = cursor.fetchone()
+        # Produtos que apontam para esta nota deixam de somar o material; entram no evento
+        cursor.execute("SELECT DISTINCT produto_id FROM produto_materias_primas WHERE materia_prima_id = ?", (id,))
+        produtos_afetados = [registro[0] for registro in cursor.fetchall()]
+
+        cursor.execute("DELETE FROM notas_fiscais WHERE id = ?", (id,))
+        excluidos = cursor.rowcount
+        if excluidos:
+            if em_dia:
+                atualizar_custos(cursor, [anterior[0]])
+            registrar_evento(cursor, 'materiais_alterados', {"descricoes": [anterior[0]], "produtos": produtos_afetados})
+        conexao.commit()
+        
+        if excluidos == 0:
+            return jsonify({"error": "Material não encontrado"}), 404
+            
+        return jsonify({"message": f"Material com ID {id} excluído com sucesso!"}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao excluir material: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para excluir todos os materiais (DELETE)
+@cadastro_bp.route('/materias-primas', methods=['DELETE'])
+def excluir_todos_materiais():
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+        cursor.execute("DELETE FROM notas_fiscais")
+        registrar_evento(cursor, 'recarregar', {"motivo": "materiais_excluidos"})
+        conexao.commit()
+        return jsonify({"message": "Todos os materiais foram excluídos com sucesso!"}), 200
+    except Exception as e:
+        return jsonify({"error": f"Erro ao excluir todos os materiais: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para cadastrar um produto
+@cadastro_bp.route('/cadastrar-produto', methods=['POST'])
+def cadastrar_produto():
+    try:
+        dados_recebidos = request.json
+        if not dados_recebidos or 'nome_produto' not in dados_recebidos or 'materias_primas' not in dados_recebidos:
+            return jsonify({"error": "Dados inválidos."}), 400
+
+        nome_produto = dados_recebidos['nome_produto']
+        materias_primas = dados_recebidos['materias_primas']
+        
+        conexao = conectar()
+        cursor = conexao.cursor()
+        
+        cursor.execute("INSERT INTO produtos (nome_produto, data_cadastro) VALUES (?, ?)", (nome_produto, date.today()))
+        produto_id = cursor.lastrowid
+        
+        for mp in materias_primas:
+            materia_prima_id = mp.get('materia_prima_id')
+            quantidade_utilizada = mp.get('quantidade_utilizada')
+            unidade_medida = mp.get('unidade_medida')
+            
+            cursor.execute('''
+                INSERT INTO produto_materias_primas (produto_id, materia_prima_id, quantidade_utilizada, unidade_medida)
+                VALUES (?, ?, ?, ?)
+            ''', (produto_id, materia_prima_id, quantidade_utilizada, unidade_medida))
+
+        registrar_evento(cursor, 'produtos_alterados', {"produtos": [produto_id]})
+        conexao.commit()
+        
+        return jsonify({"message": "Produto cadastrado com sucesso!", "produto_id": produto_id}), 201
+    
+    except Exception as e:
+        return jsonify({"error": f"Erro ao cadastrar o produto: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para atualizar o nome de um produto (PUT)
+@cadastro_bp.route('/produtos-cadastrados/<int:id>', methods=['PUT'])
+def atualizar_produto(id):
+    try:
+        dados_recebidos = request.json
+        nome_produto = dados_recebidos.get('nome_produto')
+        
+        conexao = conectar()
+        cursor = conexao.cursor()
+
+        cursor.execute('''
+            UPDATE produtos
+            SET nome_produto = ?
+            WHERE id = ?
+        ''', (nome_produto, id))
+        alterados = cursor.rowcount
+        if alterados:
+            registrar_evento(cursor, 'produtos_alterados', {"produtos": [id]})
+        
+        conexao.commit()
+        
+        if alterados == 0:
+            return jsonify({"error": "Produto não encontrado ou nenhum dado alterado"}), 404
+        
+        return jsonify({"message": f"Produto com ID {id} atualizado com sucesso!"}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao atualizar produto: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para adicionar uma matéria-prima a um produto existente (POST)
+@cadastro_bp.route('/produtos-cadastrados/<int:id>/adicionar-mp', methods=['POST'])
+def adicionar_materia_prima_ao_produto(id):
+    try:
+        dados_recebidos = request.json
+        materia_prima_id = dados_recebidos.get('materia_prima_id')
+        quantidade_utilizada = dados_recebidos.get('quantidade_utilizada')
+        unidade_medida = dados_recebidos.get('unidade_medida')
+
+        conexao = conectar()
+        cursor = conexao.cursor()
+
+        cursor.execute('''
+            INSERT INTO produto_materias_primas (produto_id, materia_prima_id, quantidade_utilizada, unidade_medida)
+            VALUES (?, ?, ?, ?)
+        ''', (id, materia_prima_id, quantidade_utilizada, unidade_medida))
+        registrar_evento(cursor, 'produtos_alterados', {"produtos": [id]})
+        
+        conexao.commit()
+
+        return jsonify({"message": f"Matéria-prima adicionada ao produto {id} com sucesso!"}), 201
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao adicionar matéria-prima: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para remover uma matéria-prima específica de um produto (DELETE)
+@cadastro_bp.route('/produtos-cadastrados/<int:produto_id>/remover-mp/<int:associacao_id>', methods=['DELETE'])
+def remover_materia_prima_do_produto(produto_id, associacao_id):
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+
+        cursor.execute("DELETE FROM produto_materias_primas WHERE id = ?", (associacao_id,))
+        removidas = cursor.rowcount
+        if removidas:
+            registrar_evento(cursor, 'produtos_alterados', {"produtos": [produto_id]})
+        
+        conexao.commit()
+
+        if removidas == 0:
+            return jsonify({"error": "Associação de matéria-prima não encontrada."}), 404
+        
+        return jsonify({"message": f"Associação de matéria-prima {associacao_id} do produto {produto_id} removida com sucesso!"}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao remover a matéria-prima: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para excluir um produto e suas associações (DELETE)
+@cadastro_bp.route('/produtos-cadastrados/<int:id>', methods=['DELETE'])
+def excluir_produto_completo(id):
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+
+        cursor.execute("DELETE FROM produto_materias_primas WHERE produto_id = ?", (id,))
+        
+        cursor.execute("DELETE FROM produtos WHERE id = ?", (id,))
+        excluidos = cursor.rowcount
+        if excluidos:
+            registrar_evento(cursor, 'produtos_alterados', {"produtos": [id]})
+        
+        conexao.commit()
+        
+        if excluidos == 0:
+            return jsonify({"error": "Produto não encontrado."}), 404
+        
+        return jsonify({"message": f"Produto com ID {id} e suas associações foram excluídos com sucesso!"}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao excluir o produto: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para inserir ou atualizar os atributos de uma matéria-prima (mapeamento)
+@cadastro_bp.route('/mapear-atributos', methods=['POST'])
+def mapear_atributos():
+    try:
+        dados = request.json
+        descricao_produto = dados.get('descricao_produto')
+        peso_bruto = dados.get('peso_bruto')
+        unidade_padrao = dados.get('unidade_medida_padrao')
+
+        if not descricao_produto:
+            return jsonify({"error": "Descrição do produto é obrigatória."}), 400
+
+        conexao = conectar()
+        conexao.isolation_level = None
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        em_dia = custos_em_dia(cursor)
+
+        # Os atributos pertencem ao material canônico, valendo para todas as grafias dele
+        descricao_produto = descricao_canonica(cursor, descricao_produto)
+
+        cursor.execute("SELECT id FROM atributos_materias_primas WHERE descricao_produto = ?", (descricao_produto,))
+        existente = cursor.fetchone()
+
+        if existente:
+            cursor.execute('''
+                UPDATE atributos_materias_primas
+                SET peso_bruto = ?, unidade_medida_padrao = ?
+                WHERE descricao_produto = ?
+            ''', (peso_bruto, unidade_padrao, descricao_produto))
+            mensagem = f"Atributos para '{descricao_produto}' atualizados com sucesso."
+        else:
+            cursor.execute('''
+                INSERT INTO atributos_materias_primas (descricao_produto, peso_bruto, unidade_medida_padrao)
+                VALUES (?, ?, ?)
+            ''', (descricao_produto, peso_bruto, unidade_padrao))
+            mensagem = f"Atributos para '{descricao_produto}' inseridos com sucesso."
+
+        if em_dia:
+            atualizar_custos(cursor, [descricao_produto])
+        registrar_evento(cursor, 'materiais_alterados', {"descricoes": [descricao_produto]})
+        conexao.commit()
+        return jsonify({"message": mensagem}), 200
+
+    except Exception as e:
+        if 'conexao' in locals() and conexao and conexao.in_transaction:
+            conexao.execute("ROLLBACK")
+        return jsonify({"error": f"Erro ao mapear atributos: {e}"}), 500
+    finally:
+        if 'conexao' in locals() and conexao:
+            conexao.close()
+
+# Rota para mapear atributos e corrigir preços de várias matérias-primas de uma vez (POST)
+# Corpo: {"atributos": [{descricao_produto, peso_bruto, unidade_medida_padrao}],
+#         "precos": [{id, descricao_produto?, unidade_medida?, valor_unitario?}]}
+@cadastro_bp.route('/mapear-atributos/lote', methods=['POST'])
+def mapear_atributos_em_lote():
+    try:
+        dados = request.json or {}
+        if not isinstance(dados, dict):
+            return jsonify({"error": "O corpo da requisição deve ser um objeto."}), 400
+        atributos = dados.get('atributos') or []
+        precos = dados.get('precos') or []
+
+        if not isinstance(atributos, list) or not isinstance(precos, list):
+            return jsonify({"error": "'atributos' e 'precos' devem ser listas."}), 400
+        if not all(isinstance(item, dict) for item in atributos + precos):
+            return jsonify({"error": "Cada item de 'atributos' e 'precos' deve ser um objeto."}), 400
+        if any(not item.get('descricao_produto') or not isinstance(item['descricao_produto'], str) for item in atributos):
+            return jsonify({"error": "Descrição do produto é obrigatória em todos os atributos."}), 400
+        if not all(isinstance(item.get('id'), int) and not isinstance(item['id'], bool) and item['id'] for item in precos):
+            return jsonify({"error": "Toda correção de preço precisa do 'id' da nota."}), 400
+        if any(not isinstance(item.get('descricao_produto', ''), (str, type(None))) for item in precos):
+            return jsonify({"error": "'descricao_produto' das correções de preço deve ser texto."}), 400
+
+        conexao = conectar()
+        conexao.isolation_level = None
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        em_dia = custos_em_dia(cursor)
+
+        # Com a carga em lote aberta, os triggers de versão não disparam a cada linha;
+        # a invalidação dos custos acontece uma vez só, em finalizar_carga_em_lote
+        ultimo_id = iniciar_carga_em_lote(cursor)
+        vincular_descricoes(cursor, dict.fromkeys(item.get('descricao_produto') for item in precos))
+
+        cursor.executemany('''
+            INSERT INTO atributos_materias_primas (descricao_produto, peso_bruto, unidade_medida_padrao)
+            VALUES (?, ?, ?)
+            ON CONFLICT(descricao_produto) DO UPDATE SET
+                peso_bruto = excluded.peso_bruto,
+                unidade_medida_padrao = excluded.unidade_medida_padrao
+        ''', [(descricao_canonica(cursor, item['descricao_produto']), item.get('peso_bruto'), item.get('unidade_medida_padrao'))
+              for item in atributos])
+
+        # Descrições que as notas corrigidas tinham antes, para o feed de eventos
+        descricoes_alteradas = {item['descricao_produto'] for item in atributos} | {item.get('descricao_produto') for item in precos}
+        for item in precos:
+            cursor.execute("SELECT descricao_produto FROM notas_fiscais WHERE id = ?", (item['id'],))
+            descricoes_alteradas.update(registro[0] for registro in cursor.fetchall())
+
+        # Campos ausentes mantêm o valor atual da nota
+        cursor.executemany('''
+            UPDATE notas_fiscais
+            SET descricao_produto = COALESCE(?, descricao_produto),
+                unidade_medida = COALESCE(?, unidade_medida),
+                valor_unitario = COALESCE(?, valor_unitario),
+                data_processamento = ?
+            WHERE id = ?
+        ''', [(item.get('descricao_produto'), item.get('unidade_medida'), item.get('valor_unitario'), date.today(), item['id'])
+              for item in precos])
+        corrigidos = cursor.rowcount if precos else 0
+
+        if corrigidos != len(precos):
+            cursor.execute("ROLLBACK")
+            return jsonify({"error": "Alguma nota informada em 'precos' não foi encontrada. Nada foi alterado."}), 404
+
+        finalizar_carga_em_lote(cursor, ultimo_id)
+        if em_dia:
+            atualizar_custos(cursor, descricoes_alteradas)
+        registrar_evento(cursor, 'materiais_alterados', {"descricoes": sorted(d for d in descricoes_alteradas if d)})
+        cursor.execute("COMMIT")
+
+        return jsonify({
+            "message": f"{len(atributos)} atributo(s) mapeado(s) e {corrigidos} preço(s) corrigido(s) com sucesso.",
+            "atributos": len(atributos),
+            "precos": corrigidos
+        }), 200
+
+    except Exception as e:
+        if 'conexao' in locals() and conexao and conexao.in_transaction:
+            conexao.execute("ROLLBACK")
+        return jsonify({"error": f"Erro ao mapear atributos em lote: {e}"}), 500
+    finally:
+        if 'conexao' in locals() and conexao:
+            conexao.close()
+
+# Rota para decidir um vínculo da fila de revisão de materiais (POST)
+# Corpo: {"acao": "vincular" | "manter_separado", "material_id": opcional (padrão: a sugestão)}
+@cadastro_bp.route('/materiais-canonicos/revisao/<int:id>', methods=['POST'])
+def revisar_material(id):
+    dados = request.json or {}
+    acao = dados.get('acao')
+    if acao not in ('vincular', 'manter_separado'):
+        return jsonify({"error": "'acao' deve ser 'vincular' ou 'manter_separado'."}), 400
+
+    try:
+        conexao = conectar()
+        conexao.isolation_level = None
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        em_dia = custos_em_dia(cursor)
+
+        cursor.execute("SELECT material_id, sugestao_material_id FROM descricoes_materiais WHERE id = ? AND status = 'revisao'", (id,))
+        registro = cursor.fetchone()
+        if not registro:
+            cursor.execute("ROLLBACK")
+            return jsonify({"error": "Descrição não encontrada na fila de revisão."}), 404
+
+        material_id, sugestao_id = registro
+        cursor.execute("SELECT descricao FROM materiais_canonicos WHERE id = ?", (material_id,))
+        descricao_material = cursor.fetchone()[0]
+        if acao == 'vincular':
+            # Estado de estoque, camadas FIFO e atributos passam para o material escolhido
+            fundir_materiais(cursor, material_id, dados.get('material_id') or sugestao_id)
+            if em_dia:
+                # O custo do material de origem sai e o do destino passa a incluir as notas dele
+                atualizar_custos(cursor, [descricao_material])
+            mensagem = "Descrição vinculada ao material canônico."
+        else:
+            cursor.execute("UPDATE descricoes_materiais SET status = 'confirmado', sugestao_material_id = NULL WHERE id = ?", (id,))
+            mensagem = "Descrição mantida como material próprio."
+
+        registrar_evento(cursor, 'materiais_alterados', {"descricoes": [descricao_material]})
+        cursor.execute("COMMIT")
+        return jsonify({"message": mensagem}), 200
+
+    except LookupError as e:
+        if conexao.in_transaction:
+            conexao.execute("ROLLBACK")
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        if 'conexao' in locals() and conexao and conexao.in_transaction:
+            conexao.execute("ROLLBACK")
+        return jsonify({"error": f"Erro ao revisar o vínculo do material: {e}"}), 500
+    finally:
+        if 'conexao' in locals() and conexao:
+            conexao.close()
+
+# Rota para editar uma matéria-prima de um produto (PUT)
+@cadastro_bp.route('/produtos-cadastrados/<int:produto_id>/editar-mp/<int:associacao_id>', methods=['PUT'])
+def editar_materia_prima_do_produto(produto_id, associacao_id):
+    try:
+        dados_recebidos = request.json
+        
+        materia_prima_id_nova = dados_recebidos.get('materia_prima_id')
+        quantidade_utilizada = dados_recebidos.get('quantidade_utilizada')
+        unidade_medida = dados_recebidos.get('unidade_medida')
+
+        conexao = conectar()
+        cursor = conexao.cursor()
+
+        cursor.execute('''
+            UPDATE produto_materias_primas
+            SET
+                materia_prima_id = ?,
+                quantidade_utilizada = ?,
+                unidade_medida = ?
+            WHERE produto_id = ? AND id = ?
+        ''', (materia_prima_id_nova, quantidade_utilizada, unidade_medida, produto_id, associacao_id))
+        alteradas = cursor.rowcount
+        if alteradas:
+            registrar_evento(cursor, 'produtos_alterados', {"produtos": [produto_id]})
+
+        conexao.commit()
+
+        if alteradas == 0:
+            return jsonify({"error": "Matéria-prima não encontrada ou nenhum dado alterado para este produto"}), 404
+            
+        return jsonify({"message": f"Matéria-prima com ID de associação {associacao_id} do produto {produto_id} atualizada com sucesso!"}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao atualizar matéria-prima do produto: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+
+# Rota para aplicar de uma vez todas as alterações da lista de matérias-primas de um produto (PUT)
+# Corpo: {"nome_produto": opcional, "adicionar": [...], "editar": [{"id": ..., ...}], "remover": [ids]}
+@cadastro_bp.route('/produtos-cadastrados/<int:id>/materias-primas', methods=['PUT'])
+def atualizar_materias_primas_do_produto(id):
+    try:
+        dados_recebidos = request.json or {}
+        if not isinstance(dados_recebidos, dict):
+            return jsonify({"error": "O corpo da requisição deve ser um objeto."}), 400
+        adicionar = dados_recebidos.get('adicionar') or []
+        editar = dados_recebidos.get('editar') or []
+        remover = dados_recebidos.get('remover') or []
+
+        if not all(isinstance(lista, list) for lista in (adicionar, editar, remover)):
+            return jsonify({"error": "'adicionar', 'editar' e 'remover' devem ser listas."}), 400
+        if not all(isinstance(mp, dict) for mp in adicionar + editar):
+            return jsonify({"error": "Cada item de 'adicionar' e 'editar' deve ser um objeto."}), 400
+        if not all(isinstance(associacao_id, int) and not isinstance(associacao_id, bool) for associacao_id in remover):
+            return jsonify({"error": "'remover' deve ser uma lista de ids de associação."}), 400
+        if any(not mp.get('materia_prima_id') for mp in adicionar):
+            return jsonify({"error": "Toda matéria-prima adicionada precisa de 'materia_prima_id'."}), 400
+        if any(not mp.get('id') for mp in editar):
+            return jsonify({"error": "Toda matéria-prima editada precisa do 'id' da associação."}), 400
+        # Um id repetido em 'remover' só apaga uma vez; sem isso a contagem acusaria um id alheio
+        remover = list(dict.fromkeys(remover))
+
+        conexao = conectar()
+        garantir_custos_atualizados(conexao)
+
+        # Uma única transação (e um único commit): quem lê nunca vê o produto pela metade
+        conexao.isolation_level = None
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("SELECT id FROM produtos WHERE id = ?", (id,))
+        if not cursor.fetchone():
+            cursor.execute("ROLLBACK")
+            return jsonify({"error": "Produto não encontrado"}), 404
+
+        if 'nome_produto' in dados_recebidos:
+            cursor.execute("UPDATE produtos SET nome_produto = ? WHERE id = ?", (dados_recebidos['nome_produto'], id))
+
+        # Campos ausentes mantêm o valor atual da associação
+        cursor.executemany('''
+            UPDATE produto_materias_primas
+            SET materia_prima_id = COALESCE(?, materia_prima_id),
+                quantidade_utilizada = COALESCE(?, quantidade_utilizada),
+                unidade_medida = COALESCE(?, unidade_medida)
+            WHERE produto_id = ? AND id = ?
+        ''', [(mp.get('materia_prima_id'), mp.get('quantidade_utilizada'), mp.get('unidade_medida'), id, mp['id']) for mp in editar])
+        editadas = cursor.rowcount if editar else 0
+
+        cursor.executemany(
+            "DELETE FROM produto_materias_primas WHERE produto_id = ? AND id = ?",
+            [(id, associacao_id) for associacao_id in remover]
+        )
+        removidas = cursor.rowcount if remover else 0
+
+        if editadas != len(editar) or removidas != len(remover):
+            cursor.execute("ROLLBACK")
+            return jsonify({"error": "Alguma matéria-prima editada ou removida não pertence a este produto. Nada foi alterado."}), 404
+
+        cursor.executemany('''
+            INSERT INTO produto_materias_primas (produto_id, materia_prima_id, quantidade_utilizada, unidade_medida)
+            VALUES (?, ?, ?, ?)
+        ''', [(id, mp.get('materia_prima_id'), mp.get('quantidade_utilizada'), mp.get('unidade_medida')) for mp in adicionar])
+
+        produto_formatado = buscar_detalhes_produto(conexao, id)
+        registrar_evento(cursor, 'produtos_alterados', {"produtos": [id]})
+        cursor.execute("COMMIT")
+
+        return jsonify({
+            "message": f"Produto {id} atualizado: {len(adicionar)} adicionada(s), {editadas} editada(s), {removidas} removida(s).",
+            "produto": produto_formatado
+        }), 200
+
+    except Exception as e:
+        if 'conexao' in locals() and conexao and conexao.in_transaction:
+            conexao.execute("ROLLBACK")
+        return jsonify({"error": f"Erro ao atualizar as matérias-primas do produto: {e}"}), 500
+    finally:
+        if 'conexao' in locals() and conexao:
+            conexao.close()
+
+# Rota para remover todas as matérias-primas de um produto (DELETE)
+@cadastro_bp.route('/produtos-cadastrados/<int:id>/remover-mp-all', methods=['DELETE'])
+def remover_all_materias_primas_do_produto(id):
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+
+        cursor.execute("DELETE FROM produto_materias_primas WHERE produto_id = ?", (id,))
+        removidas = cursor.rowcount
+        if removidas:
+            registrar_evento(cursor, 'produtos_alterados', {"produtos": [id]})
+        conexao.commit()
+        
+        if removidas == 0:
+            return jsonify({"error": "Nenhuma matéria-prima encontrada para este produto"}), 404
+        
+        return jsonify({"message": f"Todas as matérias-primas do produto {id} foram removidas com sucesso!"}), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao remover todas as matérias-primas: {e}"}), 500
+    finally:
+        conexao.close()
+
+# Rota para registrar a baixa (consumo) de matérias-primas no estoque (POST)
+@cadastro_bp.route('/materias-primas/baixa', methods=['POST'])
+def baixar_materias_primas():
+    try:
+        dados_recebidos = request.json
+        if not isinstance(dados_recebidos, list):
+            dados_recebidos = [dados_recebidos]
+
+        conexao = conectar()
+        conexao.isolation_level = None
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        em_dia = custos_em_dia(cursor)
+
+        baixas = []
+        for dado in dados_recebidos:
+            descricao_produto = dado.get('descricao_produto')
+            quantidade = float(dado.get('quantidade') or 0)
+            if not descricao_produto or quantidade <= 0:
+                cursor.execute("ROLLBACK")
+                return jsonify({"error": "Informe 'descricao_produto' e uma 'quantidade' maior que zero."}), 400
+            baixas.append(registrar_baixa(cursor, descricao_produto, quantidade))
+
+        if em_dia:
+            atualizar_custos(cursor, [baixa['descricao_produto'] for baixa in baixas])
+        registrar_evento(cursor, 'materiais_alterados', {"descricoes": [dado.get('descricao_produto') for dado in dados_recebidos]})
+        conexao.commit()
+        return jsonify({"message": f"{len(baixas)} baixa(s) registrada(s) com sucesso!", "baixas": baixas}), 200
+
+    except Exception as e:
+        if 'conexao' in locals() and conexao and conexao.in_transaction:
+            conexao.execute("ROLLBACK")
+        return jsonify({"error": f"Erro ao registrar a baixa: {e}"}), 500
+    finally:
+        if 'conexao' in locals() and conexao:
+            conexao.close()
+
+# Rota para publicar uma nova versão das regras de custo e recalcular tudo em lote (PUT)
+@cadastro_bp.route('/regras-custo', methods=['PUT'])
+def atualizar_regras_custo():
+    try:
+        regras = validar_regras(request.json)
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": f"Regras inválidas: {e}"}), 400
+
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+        cursor.execute("INSERT INTO regras_custo (regras, data_criacao) VALUES (?, ?)", (json.dumps(regras), date.today()))
+        versao = cursor.lastrowid
+        # Todos os custos mudam com as regras: os clientes recarregam as listas
+        registrar_evento(cursor, 'recarregar', {"motivo": "regras_custo", "versao": versao})
+        conexao.commit()
+
+        total = recalcular_custos(conexao)
+
+        return jsonify({"message": f"Regras de custo versão {versao} publicadas. {total} matérias-primas recalculadas.", "versao": versao}), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao atualizar as regras de custo: {e}"}), 500
+    finally:
+        if 'conexao' in locals() and conexao:
+            conexao.close()
@@ -0,0 +1,119 @@
+# Custeio de estoque por média ponderada móvel e FIFO, mantido de forma incremental
+# a cada nota inserida, alterada ou excluída (sem reprocessar o histórico).
+# Estado e camadas são agrupados pela descrição canônica do material (materiais_canonicos.py).
+from materiais_canonicos import descricao_canonica, descricao_canonica_sql
+
+_NOTA_VALIDA = "{r}.descricao_produto IS NOT NULL AND {r}.quantidade > 0 AND {r}.valor_unitario IS NOT NULL"
+
+# Enquanto esta chave existir em controle_versoes (só dentro da transação de uma carga
+# em lote), o trigger de inserção fica inativo e o estado é aplicado de uma vez no final.
+# Os triggers de estado e camadas são criados pelas migrações em banco.py.
+_CHAVE_CARGA_EM_LOTE = 'carga_em_lote'
+
+_CANONICA_G = descricao_canonica_sql('g.descricao_produto')
+
+
+def iniciar_carga_em_lote(cursor):
+    cursor.execute("INSERT OR REPLACE INTO controle_versoes (chave, valor) VALUES (?, 1)", (_CHAVE_CARGA_EM_LOTE,))
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM notas_fiscais")
+    return cursor.fetchone()[0]
+
+
+def finalizar_carga_em_lote(cursor, ultimo_id_anterior):
+    # Aplica de uma vez só as notas inseridas na carga (id acima do último existente antes dela).
+    # A descrição canônica é resolvida uma vez por descrição distinta, não por nota, e as camadas
+    # entram na ordem do índice idx_camadas_fifo_abertas
+    cursor.execute(f'''
+        INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+        SELECT {_CANONICA_G}, SUM(g.quantidade), SUM(g.valor)
+        FROM (
+            SELECT nf.descricao_produto, SUM(nf.quantidade) AS quantidade, SUM(nf.quantidade * nf.valor_unitario) AS valor
+            FROM notas_fiscais nf
+            WHERE nf.id > ? AND {_NOTA_VALIDA.format(r='nf')}
+            GROUP BY nf.descricao_produto
+        ) g
+        GROUP BY 1
+        ON CONFLICT(descricao_produto) DO UPDATE SET
+            quantidade_total = quantidade_total + excluded.quantidade_total,
+            valor_total = valor_total + excluded.valor_total
+    ''', (ultimo_id_anterior,))
+    cursor.execute(f'''
+        WITH canonicas AS MATERIALIZED (
+            SELECT g.descricao_produto, {_CANONICA_G} AS descricao_canonica
+            FROM (SELECT DISTINCT descricao_produto FROM notas_fiscais WHERE id > :ultimo_id) g
+        )
+        INSERT INTO camadas_fifo (nota_id, descricao_produto, data_emissao_nota, quantidade_restante, valor_unitario)
+        SELECT nf.id, c.descricao_canonica, nf.data_emissao_nota, nf.quantidade, nf.valor_unitario
+        FROM notas_fiscais nf
+        JOIN canonicas c ON c.descricao_produto = nf.descricao_produto
+        WHERE nf.id > :ultimo_id AND {_NOTA_VALIDA.format(r='nf')}
+        ORDER BY c.descricao_canonica, nf.data_emissao_nota, nf.id
+    ''', {'ultimo_id': ultimo_id_anterior})
+    cursor.execute("DELETE FROM controle_versoes WHERE chave = ?", (_CHAVE_CARGA_EM_LOTE,))
+    cursor.execute("UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados'")
+
+
+def carregar_estado_custos(conexao, descricoes=None):
+    # descricoes: descrições canônicas em JSON, para ler só o estado delas
+    cursor = conexao.cursor()
+    filtro = "WHERE e.descricao_produto IN (SELECT value FROM json_each(?))" if descricoes is not None else ""
+    cursor.execute(f'''
+        SELECT
+            e.descricao_produto,
+            CASE WHEN e.quantidade_total > 0 THEN e.valor_total * 1.0 / e.quantidade_total END AS custo_medio,
+            (
+                SELECT c.valor_unitario FROM camadas_fifo c
+                WHERE c.descricao_produto = e.descricao_produto AND c.quantidade_restante > 0
+                ORDER BY c.data_emissao_nota, c.id
+                LIMIT 1
+            ) AS custo_fifo
+        FROM estado_custo_medio e
+        {filtro}
+    ''', () if descricoes is None else (descricoes,))
+    return cursor.fetchall()
+
+
+def registrar_baixa(cursor, descricao_produto, quantidade):
+    # Consome as camadas mais antigas primeiro; cada camada é esgotada uma única vez,
+    # então o custo amortizado por baixa é constante.
+    descricao_produto = descricao_canonica(cursor, descricao_produto)
+    restante = quantidade
+    custo_fifo = 0.0
+    while restante > 0:
+        cursor.execute('''
+            SELECT id, quantidade_restante, valor_unitario FROM camadas_fifo
+            WHERE descricao_produto = ? AND quantidade_restante > 0
+            ORDER BY data_emissao_nota, id
+            LIMIT 1
+        ''', (descricao_produto,))
+        camada = cursor.fetchone()
+        if not camada:
+            break
+        camada_id, disponivel, valor_unitario = camada
+        consumido = min(disponivel, restante)
+        cursor.execute("UPDATE camadas_fifo SET quantidade_restante = quantidade_restante - ? WHERE id = ?", (consumido, camada_id))
+        custo_fifo += consumido * (valor_unitario or 0)
+        restante -= consumido
+
+    baixado = quantidade - restante
+
+    cursor.execute("SELECT quantidade_total, valor_total FROM estado_custo_medio WHERE descricao_produto = ?", (descricao_produto,))
+    estado = cursor.fetchone()
+    custo_medio = 0.0
+    if estado and estado[0] and estado[0] > 0:
+        custo_medio = baixado * estado[1] / estado[0]
+        cursor.execute('''
+            UPDATE estado_custo_medio
+            SET quantidade_total = quantidade_total - ?, valor_total = valor_total - ?
+            WHERE descricao_produto = ?
+        ''', (baixado, custo_medio, descricao_produto))
+
+    cursor.execute("UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados'")
+
+    return {
+        "descricao_produto": descricao_produto,
+        "quantidade_baixada": baixado,
+        "quantidade_sem_estoque": restante,
+        "custo_fifo": custo_fifo,
+        "custo_media_ponderada": custo_medio,
+    }
@@ -0,0 +1,131 @@
+# Feed de alterações por Server-Sent Events (/events).
+# As rotas de escrita gravam um evento curto (o que mudou) na mesma transação da alteração,
+# então a sequência só avança com o que foi de fato gravado. Ao enviar, o stream anexa o
+# estado atual das matérias-primas e produtos afetados, para o cliente atualizar só essas
+# linhas em vez de recarregar as listas inteiras.
+#
+# Implantação: cada stream aberto ocupa uma thread do worker enquanto dura (até
+# DURACAO_MAXIMA). O gunicorn precisa rodar com workers de threads (gthread, ver
+# gunicorn.conf.py) e threads suficientes para os streams mais as requisições comuns;
+# o frontend abre um único stream por aba, compartilhado por todas as páginas.
+import json
+import os
+import time
+
+from flask import Blueprint, Response, request
+
+from banco import conectar, empresa_atual
+from leitura import buscar_totais_produtos
+from materiais_canonicos import descricao_canonica
+from regras_custo import garantir_custos_atualizados
+
+eventos_bp = Blueprint('eventos', __name__)
+
+RETENCAO_EVENTOS = int(os.environ.get('EVENTOS_RETENCAO', 10000))
+INTERVALO_CONSULTA = float(os.environ.get('EVENTOS_INTERVALO_SEGUNDOS', 1))
+INTERVALO_PING = float(os.environ.get('EVENTOS_PING_SEGUNDOS', 15))
+# O stream é encerrado a cada DURACAO_MAXIMA para liberar a thread; o EventSource reconecta
+# sozinho depois de RECONEXAO_MS e retoma do último id recebido (cabeçalho Last-Event-ID)
+DURACAO_MAXIMA = float(os.environ.get('EVENTOS_DURACAO_MAXIMA_SEGUNDOS', 30))
+RECONEXAO_MS = 1000
+
+
+def registrar_evento(cursor, tipo, dados=None):
+    # Chamado dentro da transação da escrita. dados: {"descricoes": [...], "produtos": [...], ...}
+    cursor.execute("INSERT INTO eventos (tipo, dados) VALUES (?, ?)", (tipo, json.dumps(dados or {}, default=str)))
+    seq = cursor.lastrowid
+    if seq % 100 == 0:
+        cursor.execute("DELETE FROM eventos WHERE seq <= ?", (seq - RETENCAO_EVENTOS,))
+    return seq
+
+
+def _linhas_como_dicts(cursor):
+    nomes_colunas = [column[0] for column in cursor.description]
+    return [dict(zip(nomes_colunas, registro)) for registro in cursor.fetchall()]
+
+
+def _detalhar(conexao, dados):
+    # Estado atual de tudo que o evento tocou; produtos que usam as matérias-primas alteradas entram junto
+    cursor = conexao.cursor()
+    detalhes = {k: v for k, v in dados.items() if k not in ('descricoes', 'produtos')}
+
+    descricoes = {descricao_canonica(cursor, d) for d in dados.get('descricoes', []) if d}
+    produtos = set(dados.get('produtos', []))
+    if descricoes:
+        marcadores = ', '.join('?' * len(descricoes))
+        cursor.execute(f"SELECT * FROM materias_primas_detalhadas WHERE descricao_produto IN ({marcadores})", tuple(descricoes))
+        materiais = _linhas_como_dicts(cursor)
+        detalhes['materiais'] = materiais
+        detalhes['materiais_removidos'] = sorted(descricoes - {m['descricao_produto'] for m in materiais})
+
+        cursor.execute(f'''
+            SELECT DISTINCT pmp.produto_id FROM produto_materias_primas pmp
+            JOIN notas_fiscais_canonicas nfc ON nfc.id = pmp.materia_prima_id
+            WHERE nfc.descricao_canonica IN ({marcadores})
+        ''', tuple(descricoes))
+        produtos.update(registro[0] for registro in cursor.fetchall())
+
+    if produtos:
+        totais = buscar_totais_produtos(cursor, sorted(produtos))
+        detalhes['produtos'] = totais
+        detalhes['produtos_removidos'] = sorted(produtos - {p['ID_Produto'] for p in totais})
+    return detalhes
+
+
+def _mensagem(seq, tipo, dados):
+    return f"id: {seq}\nevent: {tipo}\ndata: {json.dumps(dados, default=str)}\n\n"
+
+
+def _ultimo_seq(cursor):
+    cursor.execute("SELECT COALESCE(MAX(seq), 0), COALESCE(MIN(seq), 1) FROM eventos")
+    return cursor.fetchone()
+
+
+def _stream(desde, empresa):
+    conexao = conectar(empresa)
+    try:
+        cursor = conexao.cursor()
+        yield f"retry: {RECONEXAO_MS}\n\n"
+
+        ultimo, primeiro = _ultimo_seq(cursor)
+        if desde is None:
+            desde = ultimo
+        elif desde < primeiro - 1:
+            # Os eventos pedidos já saíram da retenção: o cliente precisa recarregar tudo
+            yield _mensagem(ultimo, 'recarregar', {"motivo": "eventos_expirados"})
+            desde = ultimo
+
+        inicio = ultimo_envio = time.monotonic()
+        while time.monotonic() - inicio < DURACAO_MAXIMA:
+            cursor.execute("SELECT seq, tipo, dados FROM eventos WHERE seq > ? ORDER BY seq LIMIT 100", (desde,))
+            eventos = cursor.fetchall()
+            if eventos:
+                garantir_custos_atualizados(conexao)
+                for seq, tipo, dados in eventos:
+                    yield _mensagem(seq, tipo, _detalhar(conexao, json.loads(dados)))
+                    desde = seq
+                ultimo_envio = time.monotonic()
+                continue
+
+            if time.monotonic() - ultimo_envio >= INTERVALO_PING:
+                yield ": ping\n\n"
+                ultimo_envio = time.monotonic()
+            time.sleep(INTERVALO_CONSULTA)
+    finally:
+        conexao.close()
+
+
+# Rota do feed de alterações (SSE) da empresa. Retoma a partir de Last-Event-ID ou ?desde=<seq>
+@eventos_bp.route('/events', methods=['GET'])
+def stream_eventos():
+    desde = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    try:
+        desde = int(desde) if desde not in (None, '') else None
+    except ValueError:
+        desde = None
+
+    # O gerador roda depois que a rota retorna, fora do contexto da requisição
+    resposta = Response(_stream(desde, empresa_atual()), mimetype='text/event-stream')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
@@ -0,0 +1,9 @@
+# Configuração do gunicorn, lida automaticamente quando ele sobe nesta pasta (gunicorn app:app).
+# Os streams do /events (eventos.py) seguram uma thread cada enquanto estão abertos, então os
+# workers são de threads: um worker síncrono ficaria preso a um único cliente.
+import os
+
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Streams abertos (um por aba) mais as requisições comuns, por worker
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
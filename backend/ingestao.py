@@ -0,0 +1,273 @@
+# Rotas de ingestão: upload de notas fiscais (XML/PDF) e inclusão manual.
+# pandas e os conversores de PDF são importados dentro das rotas para não pesar na
+# inicialização dos workers que só atendem leitura.
+import os
+import time
+from datetime import date
+
+from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from banco import conectar
+from custeio_estoque import finalizar_carga_em_lote, iniciar_carga_em_lote
+from eventos import registrar_evento
+from materiais_canonicos import indice_da_transacao, vincular_descricoes
+from regras_custo import atualizar_custos, custos_em_dia
+from upload_seguro import (MAX_ARQUIVOS, RETRY_AFTER_SEGUNDOS, RequisicaoComUploadLimitado,
+                           aplicar_limites, detectar_tipo, fila_ingestao)
+
+ingestao_bp = Blueprint('ingestao', __name__)
+
+@ingestao_bp.record_once
+def _configurar_uploads(state):
+    state.app.request_class = RequisicaoComUploadLimitado
+
+@ingestao_bp.errorhandler(RequestEntityTooLarge)
+def _upload_muito_grande(e):
+    return jsonify({"error": e.description}), 413
+
+COLUNAS_DB = ['chave_acesso', 'emissor', 'cnpj_emissor', 'data_emissao_nota', 'codigo_produto',
+              'descricao_produto', 'ncm_sh', 'cfop', 'unidade_medida', 'quantidade',
+              'valor_unitario', 'valor_total', 'data_processamento', 'origem_dados']
+TAMANHO_LOTE = int(os.environ.get('INGESTAO_TAMANHO_LOTE', 5000))
+_POSICAO_DESCRICAO = COLUNAS_DB.index('descricao_produto')
+
+def _linhas_para_insercao(df):
+    df = df.reindex(columns=COLUNAS_DB)
+    # Mesmo formato de data que o to_sql gravava, para não misturar padrões na coluna
+    for coluna in ('data_emissao_nota', 'data_processamento'):
+        if str(df[coluna].dtype).startswith('datetime64'):
+            df[coluna] = df[coluna].dt.strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            df[coluna] = df[coluna].map(lambda v: v.isoformat() if hasattr(v, 'isoformat') else v)
+    # tolist() já devolve tipos nativos do Python; NaN/NaT viram None só nas colunas que os têm
+    colunas = []
+    for coluna in COLUNAS_DB:
+        serie = df[coluna]
+        valores = serie.tolist()
+        if serie.isna().any():
+            valores = [None if nulo else v for v, nulo in zip(valores, serie.isna().tolist())]
+        colunas.append(valores)
+    return list(zip(*colunas))
+
+def inserir_dados(lotes):
+    # Uma transação para o lote inteiro e um savepoint por arquivo: um arquivo com
+    # problema é desfeito sozinho, sem deixar o restante gravado pela metade.
+    sql = f"INSERT INTO notas_fiscais ({', '.join(COLUNAS_DB)}) VALUES ({', '.join('?' * len(COLUNAS_DB))})"
+    resultados = []
+    total_linhas = 0
+    descricoes_gravadas = set()
+    # Descrição -> material canônico, já resolvidas nesta carga: cada descrição distinta é
+    # vinculada uma única vez, mesmo que apareça em vários arquivos
+    vinculos = {}
+
+    # A conversão roda antes de abrir a transação, para segurar o lock de escrita só durante o INSERT
+    preparados = []
+    for nome, df in lotes:
+        try:
+            preparados.append((nome, _linhas_para_insercao(df), None))
+        except Exception as e:
+            preparados.append((nome, [], e))
+
+    conexao = conectar()
+    conexao.isolation_level = None
+    inicio = time.perf_counter()
+    try:
+        cursor = conexao.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        em_dia = custos_em_dia(cursor)
+        # Um índice de materiais para a carga toda, com o que os arquivos anteriores criaram
+        indice = indice_da_transacao(cursor)
+        for nome, linhas, erro in preparados:
+            cursor.execute("SAVEPOINT arquivo")
+            try:
+                if erro:
+                    raise erro
+                ultimo_id = iniciar_carga_em_lote(cursor)
+                # Descrições novas são vinculadas ao material canônico antes de as notas entrarem
+                descricoes = dict.fromkeys(linha[_POSICAO_DESCRICAO] for linha in linhas)
+                vinculados = vincular_descricoes(cursor, [d for d in descricoes if d not in vinculos], indice)
+                for i in range(0, len(linhas), TAMANHO_LOTE):
+                    cursor.executemany(sql, linhas[i:i + TAMANHO_LOTE])
+                finalizar_carga_em_lote(cursor, ultimo_id)
+                cursor.execute("RELEASE SAVEPOINT arquivo")
+                # Vínculos de um arquivo desfeito não valem para os próximos
+                vinculos.update(vinculados)
+                total_linhas += len(linhas)
+                descricoes_gravadas.update(linha[_POSICAO_DESCRICAO] for linha in linhas if linha[_POSICAO_DESCRICAO])
+                resultados.append({"arquivo": nome, "registros": len(linhas), "status": "ok"})
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT arquivo")
+                cursor.execute("RELEASE SAVEPOINT arquivo")
+                # Materiais criados pelo arquivo desfeito saem do índice
+                indice = indice_da_transacao(cursor)
+                print(f"Erro ao gravar {nome}, arquivo desfeito: {e}")
+                resultados.append({"arquivo": nome, "registros": 0, "status": "erro", "erro": str(e)})
+        if total_linhas:
+            if em_dia:
+                atualizar_custos(cursor, descricoes_gravadas)
+            registrar_evento(cursor, 'notas_ingeridas', {
+                "registros": total_linhas,
+                "arquivos": [r['arquivo'] for r in resultados if r['status'] == 'ok'],
+                "descricoes": sorted(descricoes_gravadas),
+            })
+        cursor.execute("COMMIT")
+    except Exception:
+        if conexao.in_transaction:
+            conexao.execute("ROLLBACK")
+        raise
+    finally:
+        conexao.close()
+
+    tempo_banco = time.perf_counter() - inicio
+    return {
+        "registros": total_linhas,
+        "arquivos": resultados,
+        "tempo_banco_ms": round(tempo_banco * 1000, 1),
+        "linhas_por_segundo": round(total_linhas / tempo_banco) if tempo_banco > 0 else None,
+    }
+
+# Rota para receber arquivos XML/PDF e processá-los
+@ingestao_bp.route('/upload-xml', methods=['POST'])
+def upload_arquivos():
+    # Com a fila cheia, recusa antes de receber o corpo da requisição
+    if not fila_ingestao.acquire(blocking=False):
+        resposta = jsonify({"error": "Muitas importações em andamento. Tente novamente em instantes."})
+        resposta.headers['Retry-After'] = str(RETRY_AFTER_SEGUNDOS)
+        return resposta, 429
+
+    try:
+        return processar_upload()
+    finally:
+        fila_ingestao.release()
+
+def processar_upload():
+    aplicar_limites(request)
+    if 'files[]' not in request.files:
+        return jsonify({"error": "Nenhum arquivo encontrado"}), 400
+
+    arquivos = request.files.getlist('files[]')
+    if len(arquivos) > MAX_ARQUIVOS:
+        return jsonify({"error": f"Envie no máximo {MAX_ARQUIVOS} arquivos por vez."}), 413
+
+    # Todos os arquivos são validados antes de qualquer parsing
+    tipos = [detectar_tipo(arquivo.stream) for arquivo in arquivos]
+    rejeitados = [arquivo.filename for arquivo, tipo in zip(arquivos, tipos) if tipo is None]
+    if rejeitados:
+        return jsonify({"error": "Tipo de arquivo não suportado (apenas XML e PDF).", "arquivos": rejeitados}), 415
+
+    import pandas as pd
+    from parsers_notas import (LAYOUTS_PDF, converter_xml, formatar_data, formatar_numero_robusto,
+                               limpar_chave_acesso, limpar_descricao)
+
+    lista_dfs_processados = []
+
+    for arquivo, tipo in zip(arquivos, tipos):
+        nome_arquivo = arquivo.filename
+        
+        if tipo == 'xml':
+            print(f"Processando XML: {nome_arquivo}...")
+            try:
+                df_xml = converter_xml(arquivo)
+                if df_xml is not None:
+                    df_xml['origem_dados'] = 'XML'
+                    df_xml['_arquivo'] = nome_arquivo
+                    lista_dfs_processados.append(df_xml)
+            except Exception as e:
+                print(f"Erro ao processar XML {nome_arquivo}: {e}")
+        
+        elif tipo == 'pdf':
+            print(f"Processando PDF: {nome_arquivo}...")
+            sucesso = False
+            for layout_func in LAYOUTS_PDF:
+                try:
+                    arquivo.seek(0)
+                    df_pdf = layout_func(arquivo)
+                    df_pdf['origem_dados'] = 'PDF'
+                    df_pdf['_arquivo'] = nome_arquivo
+                    lista_dfs_processados.append(df_pdf)
+                    sucesso = True
+                    print(f"  -> Layout '{layout_func.__name__}' aplicado com sucesso.")
+                    break
+                except Exception:
+                    pass
+            if not sucesso:
+                print(f"Nenhum layout compatível encontrado para o PDF: {nome_arquivo}")
+
+    if not lista_dfs_processados:
+        return jsonify({"error": "Nenhum dado válido foi extraído."}), 400
+
+    df_unificado = pd.concat(lista_dfs_processados, ignore_index=True)
+    
+    try:
+        df_unificado['chave_acesso'] = limpar_chave_acesso(df_unificado['chave_acesso'])
+        df_unificado['descricao_produto'] = limpar_descricao(df_unificado['descricao_produto'])
+        df_unificado['data_emissao_nota'] = formatar_data(df_unificado['data_emissao_nota'])
+        df_unificado['quantidade'] = formatar_numero_robusto(df_unificado['quantidade'])
+        df_unificado['valor_unitario'] = formatar_numero_robusto(df_unificado['valor_unitario'])
+        df_unificado['valor_total'] = formatar_numero_robusto(df_unificado['valor_total'])
+        df_unificado["data_processamento"] = pd.to_datetime(date.today()).date()
+
+        lotes = list(df_unificado.groupby('_arquivo', sort=False))
+        relatorio = inserir_dados(lotes)
+        print(f"{relatorio['registros']} registros gravados em {relatorio['tempo_banco_ms']} ms ({relatorio['linhas_por_segundo']} linhas/s)")
+
+        if relatorio['registros'] == 0:
+            return jsonify({"error": "Nenhum registro foi salvo.", **relatorio}), 500
+        return jsonify({"message": f"Sucesso! {relatorio['registros']} registros salvos.", "count": len(arquivos), **relatorio}), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro na formatação final ou ao salvar no banco: {e}"}), 500
+
+# Rota para adicionar dados manualmente
+@ingestao_bp.route('/adicionar-manual', methods=['POST'])
+def adicionar_manual():
+    import pandas as pd
+
+    try:
+        dados_recebidos = request.json
+        if not isinstance(dados_recebidos, list):
+            dados_recebidos = [dados_recebidos]
+
+        if not dados_recebidos:
+            return jsonify({"error": "Nenhum dado recebido"}), 400
+        
+        registros = []
+        for dado in dados_recebidos:
+            emissor = dado.get('emissor')
+            cnpj_emissor = dado.get('cnpj')
+            codigo_produto = dado.get('codProduto')
+            descricao_produto = dado.get('descricao')
+            unidade_medida = dado.get('unidade')
+            quantidade = dado.get('quantidade')
+            valor_unitario = dado.get('valorUnitario')
+
+            if not descricao_produto:
+                continue
+
+            quantidade = int(quantidade)
+            valor_unitario = float(valor_unitario)
+            
+            registros.append({
+                'emissor': emissor,
+                'cnpj_emissor': cnpj_emissor,
+                'codigo_produto': codigo_produto,
+                'descricao_produto': descricao_produto,
+                'unidade_medida': unidade_medida,
+                'quantidade': quantidade,
+                'valor_unitario': valor_unitario,
+                'valor_total': quantidade * valor_unitario,
+                'data_emissao_nota': date.today(),
+                'data_processamento': date.today(),
+                'origem_dados': 'Manual'
+            })
+
+        # Todas as linhas entram na mesma transação: ou grava tudo ou nada
+        relatorio = inserir_dados([('manual', pd.DataFrame(registros))])
+        if registros and relatorio['registros'] == 0:
+            return jsonify({"error": f"Erro ao adicionar dados manualmente: {relatorio['arquivos'][0].get('erro')}"}), 500
+        
+        return jsonify({"message": f"Dados de {len(dados_recebidos)} linha(s) inseridos manualmente com sucesso!"}), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao adicionar dados manualmente: {e}"}), 500
@@ -0,0 +1,260 @@
+# Rotas somente de leitura (consultas de materiais, produtos, regras e sugestões)
+import json
+import sqlite3
+
+from flask import Blueprint, jsonify
+
+from banco import EMPRESA_PADRAO, EMPRESAS, conectar, empresa_atual, empresa_autenticada
+from painel import montar_relatorio_empresas, obter_painel
+from regras_custo import MODELOS_REGRAS, REGRAS_PADRAO, garantir_custos_atualizados
+
+leitura_bp = Blueprint('leitura', __name__)
+
+# Rota de teste
+@leitura_bp.route('/', methods=['GET'])
+def index():
+    return jsonify({"message": "Servidor está funcionando!"}), 200
+
+# Rota para buscar todos os materiais mais recentes da view
+@leitura_bp.route('/materias-primas', methods=['GET'])
+def get_materias_primas():
+    try:
+        conexao = conectar()
+        garantir_custos_atualizados(conexao)
+        cursor = conexao.cursor()
+        cursor.execute("SELECT * FROM materias_primas_detalhadas")
+        registros = cursor.fetchall()
+        
+        nomes_colunas = [column[0] for column in cursor.description]
+        dados = [dict(zip(nomes_colunas, registro)) for registro in registros]
+            
+        return jsonify(dados), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar os dados: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+        
+
+def buscar_totais_produtos(cursor, ids=None):
+    filtro, parametros = '', ()
+    if ids is not None:
+        filtro = f"WHERE p.id IN ({', '.join('?' * len(ids))})"
+        parametros = tuple(ids)
+
+    cursor.execute(f'''
+        SELECT
+            p.id AS ID_Produto,
+            p.nome_produto AS Produto,
+            SUM(pmp.quantidade_utilizada) AS Quantidades_MP,
+            -- O Total agora é a soma da quantidade usada * o custo por unidade padrão
+            SUM(pmp.quantidade_utilizada * COALESCE(mpd.custo_por_unidade_padrao, 0)) AS Total_Produto
+        FROM produtos p
+        JOIN produto_materias_primas pmp ON p.id = pmp.produto_id
+        -- A matéria-prima segue o material canônico da nota escolhida
+        JOIN notas_fiscais_canonicas nfc ON nfc.id = pmp.materia_prima_id
+        JOIN materias_primas_detalhadas mpd ON mpd.descricao_produto = nfc.descricao_canonica
+        {filtro}
+        GROUP BY p.id
+    ''', parametros)
+
+    registros = cursor.fetchall()
+
+    nomes_colunas = [column[0] for column in cursor.description]
+    return [dict(zip(nomes_colunas, registro)) for registro in registros]
+
+# Rota para buscar produtos cadastrados
+@leitura_bp.route('/produtos-cadastrados', methods=['GET'])
+def get_produtos_cadastrados():
+    try:
+        conexao = conectar()
+        garantir_custos_atualizados(conexao)
+
+        dados = buscar_totais_produtos(conexao.cursor())
+            
+        return jsonify(dados), 200
+        
+    except sqlite3.OperationalError as e:
+        return jsonify({"error": f"Erro no banco de dados: {e}"}), 500
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar os produtos cadastrados: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+
+def buscar_detalhes_produto(conexao, id):
+    cursor = conexao.cursor()
+
+    cursor.execute("SELECT id, nome_produto FROM produtos WHERE id = ?", (id,))
+    produto = cursor.fetchone()
+    if not produto:
+        return None
+
+    cursor.execute('''
+        SELECT
+            pmp.id,
+            mpd.id AS materia_prima_id,
+            pmp.quantidade_utilizada,
+            mpd.unidade_medida_padrao, -- <<< ADICIONADO AQUI
+            mpd.descricao_produto,
+            mpd.custo_por_unidade_padrao AS valor_unitario
+        FROM produto_materias_primas pmp
+        JOIN notas_fiscais_canonicas nfc ON nfc.id = pmp.materia_prima_id
+        JOIN materias_primas_detalhadas mpd ON mpd.descricao_produto = nfc.descricao_canonica
+        WHERE pmp.produto_id = ?
+    ''', (id,))
+    materias_primas = cursor.fetchall()
+    
+    nomes_colunas_mp = [desc[0] for desc in cursor.description]
+    materias_primas_formatadas = [dict(zip(nomes_colunas_mp, mp)) for mp in materias_primas]
+
+    total_custo = sum(
+        (mp['quantidade_utilizada'] or 0) * (mp['valor_unitario'] or 0) 
+        for mp in materias_primas_formatadas
+    )
+
+    return {
+        "id": produto[0],
+        "nome_produto": produto[1],
+        "total_custo": total_custo,
+        "materias_primas": materias_primas_formatadas
+    }
+
+# Rota para buscar detalhes de um produto específico e suas matérias-primas
+@leitura_bp.route('/produtos-cadastrados/<int:id>', methods=['GET'])
+def get_detalhes_produto(id):
+    try:
+        conexao = conectar()
+        garantir_custos_atualizados(conexao)
+
+        produto_formatado = buscar_detalhes_produto(conexao, id)
+        if not produto_formatado:
+            return jsonify({"error": "Produto não encontrado"}), 404
+            
+        return jsonify(produto_formatado), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar detalhes do produto: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+
+# Rota para consultar as regras de custo ativas
+@leitura_bp.route('/regras-custo', methods=['GET'])
+def get_regras_custo():
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+        cursor.execute("SELECT versao, regras, data_criacao FROM regras_custo ORDER BY versao DESC LIMIT 1")
+        registro = cursor.fetchone()
+        if not registro:
+            return jsonify({"versao": 0, "regras": REGRAS_PADRAO, "data_criacao": None}), 200
+
+        return jsonify({"versao": registro[0], "regras": json.loads(registro[1]), "data_criacao": registro[2]}), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar as regras de custo: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+
+# Rota para listar os modelos opcionais de regras de custo (publicados pelo PUT /regras-custo)
+@leitura_bp.route('/regras-custo/modelos', methods=['GET'])
+def get_modelos_regras_custo():
+    return jsonify(MODELOS_REGRAS), 200
+
+# Rota para listar as descrições que aguardam revisão do vínculo com um material canônico
+@leitura_bp.route('/materiais-canonicos/revisao', methods=['GET'])
+def get_revisao_materiais():
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+        cursor.execute('''
+            SELECT dm.id, dm.descricao_produto, dm.similaridade,
+                   dm.material_id, sug.id AS sugestao_material_id, sug.descricao AS sugestao_descricao
+            FROM descricoes_materiais dm
+            LEFT JOIN materiais_canonicos sug ON sug.id = dm.sugestao_material_id
+            WHERE dm.status = 'revisao'
+            ORDER BY dm.similaridade DESC, dm.id
+        ''')
+        registros = cursor.fetchall()
+
+        nomes_colunas = [column[0] for column in cursor.description]
+        dados = [dict(zip(nomes_colunas, registro)) for registro in registros]
+
+        return jsonify(dados), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar a fila de revisão: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+
+# Rota com os indicadores do dashboard, já agregados no servidor
+@leitura_bp.route('/dashboard', methods=['GET'])
+def get_dashboard():
+    try:
+        conexao = conectar()
+        return jsonify(obter_painel(conexao, empresa_atual())), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao montar o dashboard: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+
+# Rota para o relatório consolidado da matriz, com um resumo de cada empresa.
+# Exige o token assinado da matriz: a empresa padrão usada na falta de segredo não basta
+@leitura_bp.route('/relatorios/empresas', methods=['GET'])
+def get_relatorio_empresas():
+    if empresa_autenticada() != EMPRESA_PADRAO:
+        return jsonify({"error": "Relatório disponível apenas para a matriz."}), 403
+    try:
+        return jsonify(montar_relatorio_empresas(EMPRESAS)), 200
+    except Exception as e:
+        return jsonify({"error": f"Erro ao montar o relatório consolidado: {e}"}), 500
+
+@leitura_bp.route('/sugestoes/emissores_cnpj', methods=['GET'])
+def get_sugestoes_emissores():
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+        cursor.execute("""
+            SELECT DISTINCT emissor, cnpj_emissor
+            FROM notas_fiscais
+            WHERE emissor IS NOT NULL AND emissor != '' AND cnpj_emissor IS NOT NULL AND cnpj_emissor != ''
+        """)
+        registros = cursor.fetchall()
+
+        dados = [{"emissor": r[0], "cnpj": r[1]} for r in registros]
+
+        return jsonify(dados), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar sugestões de emissores: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
+
+@leitura_bp.route('/sugestoes/codigos_produto', methods=['GET'])
+def get_sugestoes_codigos():
+    try:
+        conexao = conectar()
+        cursor = conexao.cursor()
+        cursor.execute("""
+            SELECT DISTINCT codigo_produto 
+            FROM notas_fiscais 
+            WHERE codigo_produto IS NOT NULL AND codigo_produto != ''
+        """)
+        registros = cursor.fetchall()
+
+        dados = [{"codProduto": r[0]} for r in registros]
+
+        return jsonify(dados), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar sugestões de códigos: {e}"}), 500
+    finally:
+        if conexao:
+            conexao.close()
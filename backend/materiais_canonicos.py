@@ -0,0 +1,311 @@
+# Camada de materiais canônicos: descrições de notas que diferem só em grafia, acentos,
+# pontuação ou espaçamento apontam para o mesmo material. Custos, atributos, estado de
+# estoque e a view materias_primas_detalhadas passam a usar a descrição canônica.
+#
+# O vínculo de uma descrição nova é feito na ingestão:
+#   1. chave normalizada igual à de um material existente -> vínculo exato;
+#   2. senão, candidatos pelo índice invertido de trigramas (blocking por prefixo: só os
+#      trigramas mais raros da descrição são consultados) e similaridade de Jaccard;
+#      acima de LIMIAR_VINCULO_AUTOMATICO -> vínculo automático;
+#   3. entre LIMIAR_REVISAO e o automático -> vira material próprio e entra na fila de revisão;
+#   4. abaixo disso, ou com números diferentes (medidas, bitolas) -> material novo.
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+
+LIMIAR_VINCULO_AUTOMATICO = float(os.environ.get('MATERIAIS_LIMIAR_AUTOMATICO', 0.85))
+LIMIAR_REVISAO = float(os.environ.get('MATERIAIS_LIMIAR_REVISAO', 0.6))
+# Descrições por consulta IN (abaixo do limite de parâmetros do SQLite)
+TAMANHO_BLOCO_CONSULTA = 500
+# Contador em controle_versoes de materiais removidos (fusões): quando muda, o índice
+# mantido em memória é montado de novo
+_CHAVE_REMOCOES = 'materiais_canonicos_removidos'
+
+# Expressão SQL com a descrição canônica de uma descrição de nota (ou ela própria, se não vinculada)
+_DESCRICAO_CANONICA = '''COALESCE((
+    SELECT mc.descricao FROM descricoes_materiais dm JOIN materiais_canonicos mc ON mc.id = dm.material_id
+    WHERE dm.descricao_produto = {d}
+), {d})'''
+
+
+def descricao_canonica_sql(coluna):
+    return _DESCRICAO_CANONICA.format(d=coluna)
+
+
+def normalizar_descricao(descricao):
+    texto = unicodedata.normalize('NFKD', str(descricao)).encode('ascii', 'ignore').decode().upper()
+    texto = re.sub(r'(?<=\d),(?=\d)', '.', texto)
+    # "20AWG" e "20 AWG", "M6X20" e "M6 X 20" geram a mesma chave
+    texto = re.sub(r'(?<=\d)(?=[A-Z])|(?<=[A-Z])(?=\d)', ' ', texto)
+    texto = re.sub(r'(?<!\d)\.|\.(?!\d)', ' ', texto)
+    texto = re.sub(r'[^A-Z0-9.]+', ' ', texto)
+    return texto.strip()
+
+
+def _trigramas(chave):
+    texto = f" {chave} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _numeros(chave):
+    # Medidas e bitolas diferentes indicam outro material, por mais parecido que seja o texto
+    return tuple(re.findall(r'\d+(?:\.\d+)?', chave))
+
+
+class IndiceMateriais:
+    # Índice em memória das chaves normalizadas: busca exata por chave e, para os candidatos
+    # aproximados, índice invertido de trigramas separado pela sequência de números da chave
+    # (só materiais com as mesmas medidas são comparados).
+    # Com uma base (o índice dos materiais já confirmados no banco, mantido entre chamadas),
+    # este guarda só os materiais que ainda não estão nela e consulta os dois
+    def __init__(self, registros=(), base=None):
+        self.base = base
+        self.ultimo_id = 0
+        self.por_chave = {}
+        self.trigramas = {}
+        self.postagens = defaultdict(set)
+        for material_id, descricao, chave in registros:
+            self.adicionar(material_id, descricao, chave)
+
+    def adicionar(self, material_id, descricao, chave):
+        numeros = _numeros(chave)
+        self.ultimo_id = max(self.ultimo_id, material_id)
+        self.por_chave[chave] = (material_id, descricao)
+        self.trigramas[material_id] = (descricao, _trigramas(chave))
+        for trigrama in self.trigramas[material_id][1]:
+            self.postagens[(numeros, trigrama)].add(material_id)
+
+    def material_da_chave(self, chave):
+        if chave in self.por_chave or not self.base:
+            return self.por_chave.get(chave)
+        with _trava_indices:
+            return self.base.material_da_chave(chave)
+
+    def melhor_candidato(self, chave):
+        melhor, melhor_similaridade = self._melhor_candidato_local(chave)
+        if self.base:
+            with _trava_indices:
+                candidato, similaridade = self.base.melhor_candidato(chave)
+            if similaridade > melhor_similaridade:
+                melhor, melhor_similaridade = candidato, similaridade
+        return melhor, melhor_similaridade
+
+    def _melhor_candidato_local(self, chave):
+        numeros = _numeros(chave)
+        trigramas = _trigramas(chave)
+        if not trigramas:
+            return None, 0.0
+        # Filtro de prefixo: um material com Jaccard >= LIMIAR_REVISAO compartilha pelo menos
+        # um dos trigramas mais raros da descrição, então só as postagens deles são lidas
+        postagens = sorted((self.postagens.get((numeros, t), set()) for t in trigramas), key=len)
+        prefixo = len(trigramas) - math.ceil(LIMIAR_REVISAO * len(trigramas)) + 1
+        candidatos = set().union(*postagens[:prefixo])
+
+        melhor, melhor_similaridade = None, 0.0
+        for material_id in candidatos:
+            descricao, trigramas_candidato = self.trigramas[material_id]
+            em_comum = len(trigramas & trigramas_candidato)
+            similaridade = em_comum / (len(trigramas) + len(trigramas_candidato) - em_comum)
+            if similaridade > melhor_similaridade:
+                melhor, melhor_similaridade = (material_id, descricao), similaridade
+        return melhor, melhor_similaridade
+
+
+# Índice dos materiais confirmados de cada arquivo de banco, mantido entre as cargas do processo
+_indices_confirmados = {}
+_trava_indices = threading.Lock()
+
+
+def _indice_confirmado(caminho):
+    # Lido por uma conexão à parte, que só enxerga o que já foi confirmado: materiais de uma
+    # transação que acabar desfeita nunca entram no índice compartilhado. A cada chamada só
+    # os materiais acima do último id conhecido são lidos; remoções fazem o índice ser refeito
+    leitura = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+    try:
+        with _trava_indices:
+            indice = _indices_confirmados.get(caminho)
+        leitura.execute("BEGIN")
+        registro = leitura.execute("SELECT valor FROM controle_versoes WHERE chave = ?", (_CHAVE_REMOCOES,)).fetchone()
+        remocoes = registro[0] if registro else 0
+        if indice is not None:
+            # Quantidade diferente até o último id: houve remoção feita fora do app
+            existentes = leitura.execute("SELECT COUNT(*) FROM materiais_canonicos WHERE id <= ?", (indice.ultimo_id,)).fetchone()[0]
+            if indice.remocoes != remocoes or existentes != len(indice.trigramas):
+                indice = None
+        if indice is None:
+            indice = IndiceMateriais()
+            indice.remocoes = remocoes
+        registros = leitura.execute(
+            "SELECT id, descricao, chave_normalizada FROM materiais_canonicos WHERE id > ? ORDER BY id", (indice.ultimo_id,)
+        ).fetchall()
+        leitura.execute("COMMIT")
+    finally:
+        leitura.close()
+
+    with _trava_indices:
+        for registro in registros:
+            indice.adicionar(*registro)
+        _indices_confirmados[caminho] = indice
+    return indice
+
+
+def indice_da_transacao(cursor):
+    cursor.execute("PRAGMA database_list")
+    caminho = next((arquivo for _, nome, arquivo in cursor.fetchall() if nome == 'main'), None)
+    base = None
+    if caminho:
+        try:
+            base = _indice_confirmado(caminho)
+        except sqlite3.Error:
+            # Ex.: na migração que cria as tabelas, ainda não confirmadas; o índice é montado inteiro
+            base = None
+    # Materiais que esta transação enxerga e a base ainda não tem (inclusive os criados por ela)
+    cursor.execute(
+        "SELECT id, descricao, chave_normalizada FROM materiais_canonicos WHERE id > ?", (base.ultimo_id if base else 0,)
+    )
+    return IndiceMateriais(cursor.fetchall(), base=base)
+
+
+def _criar_material(cursor, indice, descricao, chave):
+    cursor.execute("INSERT INTO materiais_canonicos (descricao, chave_normalizada) VALUES (?, ?)", (descricao, chave))
+    indice.adicionar(cursor.lastrowid, descricao, chave)
+    return cursor.lastrowid
+
+
+def _fundir_estado(cursor, descricao_origem, descricao_destino):
+    # Move estado de estoque, camadas FIFO e atributos já gravados sob uma descrição para outra
+    if descricao_origem == descricao_destino:
+        return False
+    cursor.execute('''
+        INSERT INTO estado_custo_medio (descricao_produto, quantidade_total, valor_total)
+        SELECT ?, quantidade_total, valor_total FROM estado_custo_medio WHERE descricao_produto = ?
+        ON CONFLICT(descricao_produto) DO UPDATE SET
+            quantidade_total = quantidade_total + excluded.quantidade_total,
+            valor_total = valor_total + excluded.valor_total
+    ''', (descricao_destino, descricao_origem))
+    movido = cursor.rowcount > 0
+    cursor.execute("DELETE FROM estado_custo_medio WHERE descricao_produto = ?", (descricao_origem,))
+    # As camadas mantêm o que já foi consumido delas
+    cursor.execute("UPDATE camadas_fifo SET descricao_produto = ? WHERE descricao_produto = ?", (descricao_destino, descricao_origem))
+    movido = cursor.rowcount > 0 or movido
+    # Atributos do material de destino têm precedência
+    cursor.execute('''
+        INSERT OR IGNORE INTO atributos_materias_primas (descricao_produto, peso_bruto, unidade_medida_padrao)
+        SELECT ?, peso_bruto, unidade_medida_padrao FROM atributos_materias_primas WHERE descricao_produto = ?
+    ''', (descricao_destino, descricao_origem))
+    cursor.execute("DELETE FROM atributos_materias_primas WHERE descricao_produto = ?", (descricao_origem,))
+    movido = cursor.rowcount > 0 or movido
+    if movido:
+        cursor.execute("UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados'")
+    return movido
+
+
+def _descricoes_vinculadas(cursor, descricoes):
+    # Uma consulta por bloco de descrições, não uma por descrição
+    vinculos = {}
+    for i in range(0, len(descricoes), TAMANHO_BLOCO_CONSULTA):
+        bloco = descricoes[i:i + TAMANHO_BLOCO_CONSULTA]
+        cursor.execute(f'''
+            SELECT dm.descricao_produto, mc.descricao
+            FROM descricoes_materiais dm JOIN materiais_canonicos mc ON mc.id = dm.material_id
+            WHERE dm.descricao_produto IN ({', '.join('?' * len(bloco))})
+        ''', bloco)
+        vinculos.update(cursor.fetchall())
+    return vinculos
+
+
+def _vincular_nova(cursor, indice, descricao):
+    chave = normalizar_descricao(descricao)
+    sugestao = None
+    material_exato = indice.material_da_chave(chave)
+    if material_exato:
+        material_id, descricao_canonica = material_exato
+        status, similaridade = 'exato', 1.0
+    else:
+        candidato, similaridade = indice.melhor_candidato(chave)
+        if candidato and similaridade >= LIMIAR_VINCULO_AUTOMATICO:
+            material_id, descricao_canonica = candidato
+            status = 'automatico'
+        else:
+            material_id, descricao_canonica = _criar_material(cursor, indice, descricao, chave), descricao
+            if candidato and similaridade >= LIMIAR_REVISAO:
+                status, sugestao = 'revisao', candidato[0]
+            else:
+                status = 'novo'
+
+    cursor.execute('''
+        INSERT INTO descricoes_materiais (descricao_produto, material_id, status, similaridade, sugestao_material_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (descricao, material_id, status, similaridade, sugestao))
+
+    # Notas já gravadas com esta descrição antes do vínculo passam para o material canônico
+    _fundir_estado(cursor, descricao, descricao_canonica)
+    return descricao_canonica
+
+
+def vincular_descricoes(cursor, descricoes, indice=None):
+    # Descrições já vinculadas são resolvidas em lote pela chave única; o índice só é
+    # consultado se alguma descrição for nova. Quem vincula várias vezes na mesma transação
+    # pode passar o próprio indice_da_transacao (e montar outro se desfizer parte dela)
+    descricoes = [descricao for descricao in dict.fromkeys(descricoes) if descricao]
+    vinculos = _descricoes_vinculadas(cursor, descricoes)
+    novas = [descricao for descricao in descricoes if descricao not in vinculos]
+
+    if novas:
+        indice = indice or indice_da_transacao(cursor)
+        for descricao in novas:
+            vinculos[descricao] = _vincular_nova(cursor, indice, descricao)
+    return vinculos
+
+
+def vincular_descricao(cursor, descricao):
+    return vincular_descricoes(cursor, [descricao]).get(descricao, descricao)
+
+
+def descricao_canonica(cursor, descricao):
+    cursor.execute(f"SELECT {descricao_canonica_sql(':d')}", {'d': descricao})
+    return cursor.fetchone()[0]
+
+
+def fundir_materiais(cursor, origem_id, destino_id):
+    # Todas as descrições do material de origem passam para o de destino, que continua existindo
+    cursor.execute("SELECT descricao FROM materiais_canonicos WHERE id = ?", (origem_id,))
+    origem = cursor.fetchone()
+    cursor.execute("SELECT descricao FROM materiais_canonicos WHERE id = ?", (destino_id,))
+    destino = cursor.fetchone()
+    if not origem or not destino:
+        raise LookupError("Material canônico não encontrado.")
+    if origem_id == destino_id:
+        return
+
+    cursor.execute('''
+        UPDATE descricoes_materiais
+        SET material_id = ?, status = 'confirmado', sugestao_material_id = NULL
+        WHERE material_id = ?
+    ''', (destino_id, origem_id))
+    cursor.execute("UPDATE descricoes_materiais SET sugestao_material_id = ? WHERE sugestao_material_id = ?", (destino_id, origem_id))
+    cursor.execute("DELETE FROM materiais_canonicos WHERE id = ?", (origem_id,))
+    cursor.execute('''
+        INSERT INTO controle_versoes (chave, valor) VALUES (?, 1)
+        ON CONFLICT(chave) DO UPDATE SET valor = valor + 1
+    ''', (_CHAVE_REMOCOES,))
+    _fundir_estado(cursor, origem[0], destino[0])
+    cursor.execute("UPDATE controle_versoes SET valor = valor + 1 WHERE chave = 'dados'")
+
+
+def vincular_historico(cursor):
+    # Carga inicial: vincula as descrições já existentes na ordem em que apareceram
+    cursor.execute('''
+        SELECT descricao_produto FROM notas_fiscais
+        WHERE descricao_produto IS NOT NULL
+        GROUP BY descricao_produto
+        ORDER BY MIN(id)
+    ''')
+    descricoes = [registro[0] for registro in cursor.fetchall()]
+    cursor.execute("SELECT descricao_produto FROM atributos_materias_primas WHERE descricao_produto IS NOT NULL ORDER BY id")
+    descricoes += [registro[0] for registro in cursor.fetchall()]
+    return vincular_descricoes(cursor, descricoes)
@@ -0,0 +1,201 @@
+# Indicadores do dashboard, calculados no servidor e guardados em cache_painel.
+# O cache é recalculado em segundo plano depois de cada escrita (agendar_atualizacao_painel,
+# chamado pelo app após toda requisição de escrita bem-sucedida), então o dashboard é sempre
+# a leitura de uma única linha, qualquer que seja o tamanho do banco.
+import json
+import os
+import threading
+from datetime import datetime
+
+from banco import LIMITE_ATTACH, conectar, conectar_consolidado
+from regras_custo import _obter_versao, garantir_custos_atualizados, obter_regras_ativas
+
+TOP_PRODUTOS = 10
+LIMITE_LISTAS = 10
+# Escritas seguidas (um upload em vários arquivos, uma edição em série) viram um único recálculo
+ATRASO_ATUALIZACAO = float(os.environ.get('PAINEL_ATRASO_ATUALIZACAO_SEGUNDOS', 0.5))
+
+_trava_agendamentos = threading.Lock()
+_agendamentos = {}
+
+
+def _linhas_como_dicts(cursor):
+    nomes_colunas = [column[0] for column in cursor.description]
+    return [dict(zip(nomes_colunas, registro)) for registro in cursor.fetchall()]
+
+
+def _versoes(cursor):
+    versao_regras, _ = obter_regras_ativas(cursor)
+    return _obter_versao(cursor, 'dados'), versao_regras, _obter_versao(cursor, 'produtos')
+
+
+def montar_painel(cursor):
+    # Mesmo cálculo de /produtos-cadastrados, agregado aqui em vez de no navegador
+    cursor.execute('''
+        SELECT
+            p.id AS ID_Produto,
+            p.nome_produto AS Produto,
+            SUM(pmp.quantidade_utilizada * COALESCE(mpd.custo_por_unidade_padrao, 0)) AS Total_Produto
+        FROM produtos p
+        JOIN produto_materias_primas pmp ON p.id = pmp.produto_id
+        JOIN notas_fiscais_canonicas nfc ON nfc.id = pmp.materia_prima_id
+        JOIN materias_primas_detalhadas mpd ON mpd.descricao_produto = nfc.descricao_canonica
+        GROUP BY p.id
+        ORDER BY Total_Produto DESC
+    ''')
+    produtos = _linhas_como_dicts(cursor)
+    soma_total = sum(p['Total_Produto'] or 0 for p in produtos)
+
+    cursor.execute('''
+        SELECT COALESCE(unidade_medida_padrao, 'Não mapeada') AS unidade, COUNT(*) AS quantidade
+        FROM materias_primas_detalhadas
+        GROUP BY 1
+        ORDER BY quantidade DESC
+    ''')
+    materiais_por_unidade = _linhas_como_dicts(cursor)
+    total_materias_primas = sum(u['quantidade'] for u in materiais_por_unidade)
+
+    cursor.execute('''
+        SELECT id, descricao_produto, unidade_medida_nf, valor_unitario_nf
+        FROM materias_primas_detalhadas
+        WHERE unidade_medida_padrao IS NULL
+        ORDER BY descricao_produto
+    ''')
+    nao_mapeadas = _linhas_como_dicts(cursor)
+
+    # Variações entre compras consecutivas do mesmo material, das mais recentes para as mais antigas
+    cursor.execute('''
+        SELECT descricao_produto, data_emissao_nota, valor_anterior, valor_unitario AS valor_atual,
+               (valor_unitario - valor_anterior) * 100.0 / valor_anterior AS variacao_percentual
+        FROM (
+            SELECT descricao_canonica AS descricao_produto, data_emissao_nota, valor_unitario, id,
+                   LAG(valor_unitario) OVER(PARTITION BY descricao_canonica ORDER BY data_emissao_nota, id) AS valor_anterior
+            FROM notas_fiscais_canonicas
+            WHERE descricao_canonica IS NOT NULL AND valor_unitario IS NOT NULL
+        )
+        WHERE valor_anterior IS NOT NULL AND valor_anterior <> 0 AND valor_unitario <> valor_anterior
+        ORDER BY data_emissao_nota DESC, id DESC
+        LIMIT ?
+    ''', (LIMITE_LISTAS,))
+    variacoes_preco = _linhas_como_dicts(cursor)
+
+    return {
+        "total_produtos": len(produtos),
+        "custo_total_produtos": soma_total,
+        "custo_medio_produto": soma_total / len(produtos) if produtos else 0,
+        "total_materias_primas": total_materias_primas,
+        "produtos_maior_custo": produtos[:TOP_PRODUTOS],
+        "custo_outros_produtos": sum(p['Total_Produto'] or 0 for p in produtos[TOP_PRODUTOS:]),
+        "materiais_por_unidade": materiais_por_unidade,
+        "total_nao_mapeadas": len(nao_mapeadas),
+        "materias_primas_nao_mapeadas": nao_mapeadas[:LIMITE_LISTAS],
+        "variacoes_preco_recentes": variacoes_preco,
+    }
+
+
+def atualizar_painel(conexao):
+    cursor = conexao.cursor()
+    garantir_custos_atualizados(conexao)
+    versoes = _versoes(cursor)
+    painel = montar_painel(cursor)
+    painel['calculado_em'] = datetime.now().isoformat(timespec='seconds')
+    cursor.execute('''
+        INSERT INTO cache_painel (id, versao_dados, versao_regras, versao_produtos, conteudo)
+        VALUES (1, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            versao_dados = excluded.versao_dados,
+            versao_regras = excluded.versao_regras,
+            versao_produtos = excluded.versao_produtos,
+            conteudo = excluded.conteudo
+    ''', (*versoes, json.dumps(painel)))
+    conexao.commit()
+    return painel
+
+
+def _executar_atualizacao(empresa):
+    # Sai da lista antes de calcular: uma escrita durante o cálculo agenda outro
+    with _trava_agendamentos:
+        _agendamentos.pop(empresa, None)
+    conexao = conectar(empresa)
+    try:
+        cursor = conexao.cursor()
+        cursor.execute("SELECT versao_dados, versao_regras, versao_produtos FROM cache_painel WHERE id = 1")
+        cache = cursor.fetchone()
+        if not cache or tuple(cache) != _versoes(cursor):
+            atualizar_painel(conexao)
+    except Exception as e:
+        print(f"Erro ao atualizar o dashboard da empresa {empresa}: {e}")
+    finally:
+        conexao.close()
+
+
+def agendar_atualizacao_painel(empresa):
+    with _trava_agendamentos:
+        if empresa in _agendamentos:
+            return
+        agendamento = threading.Timer(ATRASO_ATUALIZACAO, _executar_atualizacao, (empresa,))
+        agendamento.daemon = True
+        _agendamentos[empresa] = agendamento
+    agendamento.start()
+
+
+def obter_painel(conexao, empresa):
+    # Só lê o cache. Se uma escrita ainda não foi refletida (ou veio de fora do app, como uma
+    # migração), devolve o último cálculo marcado como desatualizado e agenda o recálculo
+    cursor = conexao.cursor()
+    cursor.execute("SELECT versao_dados, versao_regras, versao_produtos, conteudo FROM cache_painel WHERE id = 1")
+    cache = cursor.fetchone()
+    if not cache:
+        # Banco novo, ainda sem nenhum cálculo
+        return atualizar_painel(conexao)
+
+    painel = json.loads(cache[3])
+    painel['desatualizado'] = tuple(cache[:3]) != _versoes(cursor)
+    if painel['desatualizado']:
+        agendar_atualizacao_painel(empresa)
+    return painel
+
+
+# Resumo de uma empresa no relatório consolidado; {e} é o esquema anexado dela
+_RESUMO_EMPRESA = '''
+    SELECT
+        ? AS empresa,
+        (SELECT COUNT(*) FROM {e}.notas_fiscais) AS notas,
+        (SELECT COALESCE(SUM(valor_total), 0) FROM {e}.notas_fiscais) AS valor_compras,
+        (SELECT COUNT(*) FROM {e}.materias_primas_detalhadas) AS materias_primas,
+        (SELECT COUNT(*) FROM {e}.materias_primas_detalhadas WHERE unidade_medida_padrao IS NULL) AS materias_primas_nao_mapeadas,
+        (SELECT COUNT(*) FROM {e}.produtos) AS produtos,
+        (SELECT COALESCE(SUM(pmp.quantidade_utilizada * COALESCE(mpd.custo_por_unidade_padrao, 0)), 0)
+         FROM {e}.produto_materias_primas pmp
+         JOIN {e}.notas_fiscais_canonicas nfc ON nfc.id = pmp.materia_prima_id
+         JOIN {e}.materias_primas_detalhadas mpd ON mpd.descricao_produto = nfc.descricao_canonica) AS custo_total_produtos
+'''
+
+
+def montar_relatorio_empresas(empresas):
+    # Custos de cada empresa atualizados no próprio banco; a leitura consolidada é só leitura
+    for empresa in empresas:
+        conexao = conectar(empresa)
+        try:
+            garantir_custos_atualizados(conexao)
+        finally:
+            conexao.close()
+
+    # Os bancos são anexados em grupos de até LIMITE_ATTACH, uma consulta UNION ALL por grupo
+    resumo = []
+    for i in range(0, len(empresas), LIMITE_ATTACH):
+        grupo = empresas[i:i + LIMITE_ATTACH]
+        conexao, esquemas = conectar_consolidado(grupo)
+        try:
+            cursor = conexao.cursor()
+            cursor.execute(' UNION ALL '.join(_RESUMO_EMPRESA.format(e=esquemas[empresa]) for empresa in grupo), tuple(grupo))
+            resumo += _linhas_como_dicts(cursor)
+        finally:
+            conexao.close()
+
+    colunas = ('notas', 'valor_compras', 'materias_primas', 'materias_primas_nao_mapeadas', 'produtos', 'custo_total_produtos')
+    return {
+        "empresas": resumo,
+        "totais": {coluna: sum(linha[coluna] for linha in resumo) for coluna in colunas},
+        "calculado_em": datetime.now().isoformat(timespec='seconds'),
+    }
@@ -0,0 +1,137 @@
+# Conversores de notas fiscais (XML e layouts de PDF) e limpeza dos dados extraídos.
+# Este módulo concentra os imports pesados (pandas, pdfplumber) e só deve ser
+# importado sob demanda pelas rotas de ingestão.
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+import pdfplumber
+
+def limpar_descricao(series):
+    return series.astype(str).str.strip().str.lstrip('- ')
+
+def limpar_chave_acesso(series):
+    return series.astype(str).str.replace(r'[^0-9]', '', regex=True)
+
+def formatar_data(series):
+    return pd.to_datetime(series.astype(str).str.slice(0, 10), errors='coerce', dayfirst=True)
+
+def formatar_numero_robusto(series):
+    def converter(valor):
+        if pd.isna(valor):
+            return None
+        s = str(valor).strip()
+        if ',' in s:
+            s = s.replace('.', '').replace(',', '.')
+        return pd.to_numeric(s, errors='coerce')
+    return series.apply(converter)
+
+def converter_primeiro_layout(arquivo_pdf):
+    with pdfplumber.open(arquivo_pdf) as pdf:
+        primeira_pagina = pdf.pages[0]
+        tabelas = primeira_pagina.extract_tables()
+        tabela_produtos = tabelas[-1]
+        df = pd.DataFrame(pdf.pages[0].extract_tables()[-1][1:], columns=pdf.pages[0].extract_tables()[-1][0])
+        df["chave_acesso"] = pdf.pages[0].extract_tables()[0][1][2].split("\n")[1]
+        df["emissor"] = pdf.pages[0].extract_tables()[0][0][0].split("\n")[1]
+        df["cnpj_emissor"] = pdf.pages[0].extract_tables()[0][4][3].split("\n")[1]
+        df["data_emissao_nota"] = pdf.pages[0].extract_tables()[2][0][4].split("\n")[1]
+        colunas_a_explodir = ['CÓDIGO PRODUTO', 'DESCRIÇÃO DO PRODUTO / SERVIÇO', 'NCM/SH', 'CFOP', 'UN', 'QUANT', 'VALOR UNIT', 'VALOR TOTAL']
+        for col in colunas_a_explodir:
+            df[col] = df[col].str.split("\n")
+        df_expandido = df.explode(column=colunas_a_explodir, ignore_index=True)
+        df_final = df_expandido.rename(columns={
+            "CÓDIGO PRODUTO": "codigo_produto", "DESCRIÇÃO DO PRODUTO / SERVIÇO": "descricao_produto",
+            "NCM/SH": "ncm_sh", "CFOP": "cfop", "UN": "unidade_medida", "QUANT": "quantidade",
+            "VALOR UNIT": "valor_unitario", "VALOR TOTAL": "valor_total"
+        })
+        return df_final[df_final.columns.intersection(['chave_acesso', 'emissor', 'cnpj_emissor', 'data_emissao_nota', 'codigo_produto', 'descricao_produto', 'ncm_sh', 'cfop', 'unidade_medida', 'quantidade', 'valor_unitario', 'valor_total'])]
+
+def converter_segundo_layout(arquivo_pdf):
+    with pdfplumber.open(arquivo_pdf) as pdf:
+        primeira_pagina = pdf.pages[0]
+        tabelas = pdf.pages[0].extract_tables()
+        df = pd.DataFrame()
+        df["codigo_produto"] = tabelas[5][1][0].split("\n")
+        df["descricao_produto"] = tabelas[5][1][1].split("\n")[0:200:3]
+        df["ncm_sh"] = tabelas[5][1][2].split("\n")
+        df["cfop"] = tabelas[5][1][4].split("\n")
+        df["unidade_medida"] = tabelas[5][1][5].split("\n")
+        df["quantidade"] = tabelas[5][1][6].split("\n")
+        df["valor_unitario"] = tabelas[5][1][7].split("\n")
+        df["valor_total"] = tabelas[5][1][8].split("\n")
+        df["emissor"] = tabelas[0][0][0].replace("RECEBEMOS DE ", "").replace(" OS PRODUTOS/SERVIÇOS CONSTANTES DA NOTA FISCAL INDICADA AO LADO", "")
+        df["cnpj_emissor"] = tabelas[1][2][1].split("\n")[1]
+        df["chave_acesso"] = tabelas[1][0][2].split("\n")[2]
+        df["data_emissao_nota"] = tabelas[2][0][5].split("\n")[1]
+        return df
+
+def converter_terceiro_layout(arquivo_pdf):
+    with pdfplumber.open(arquivo_pdf) as pdf:
+        primeira_pagina = pdf.pages[0]
+        tabelas = pdf.pages[0].extract_tables()
+        dados = tabelas[3][2:]
+        df_prod = pd.DataFrame(dados, columns=[col.replace('\n', ' ') for col in tabelas[3][1]])
+        df_final = pd.DataFrame()
+        df_final["codigo_produto"] = df_prod["CÓDIGO"]
+        df_final["descricao_produto"] = df_prod["DESCRIÇÃO DO PRODUTO"]
+        df_final["ncm_sh"] = df_prod["NCM/SH"]
+        df_final["cfop"] = df_prod["CFOP"]
+        df_final["unidade_medida"] = df_prod["UNID"]
+        df_final["quantidade"] = df_prod["QTDE"].str.split("\n").str[0]
+        df_final["valor_unitario"] = df_prod["VLR UNIT"]
+        df_final["valor_total"] = df_prod["VLR TOTAL"].str.split(" ").str[0]
+        df_final["emissor"] = tabelas[1][0][0].split("\n")[0]
+        df_final["cnpj_emissor"] = tabelas[0][0][0].split(" - ")[-1].split("\n")[0]
+        df_final["data_emissao_nota"] = tabelas[0][1][1].split("\n")[1].replace("DATA DE EMISSÃO: ", "").split(" ")[0]
+        df_final["chave_acesso"] = tabelas[1][1][18].replace("CHAVE DE ACESSO ", "")
+        return df_final
+
+def converter_quarto_layout(arquivo_pdf):
+    with pdfplumber.open(arquivo_pdf) as pdf:
+        primeira_pagina = pdf.pages[0]
+        tabelas = pdf.pages[0].extract_tables()
+        prods_ = tabelas[8][1:]
+        df_prod = pd.DataFrame(prods_, columns=tabelas[8][0])
+        df_final = pd.DataFrame()
+        df_final["codigo_produto"] = df_prod["CÓDIGO"]
+        df_final["descricao_produto"] = df_prod["DESCRIÇÃO DO PRODUTO"]
+        df_final["ncm_sh"] = df_prod["NCM/SH"]
+        df_final["cfop"] = df_prod["CFOP"]
+        df_final["unidade_medida"] = df_prod["UNID."]
+        df_final["quantidade"] = df_prod["QUANTIDADE"].str.split("\n").str[0]
+        df_final["valor_unitario"] = df_prod["VALOR UNITÁRIO"].str.split(" ").str[0]
+        df_final["valor_total"] = df_prod["VALOR UNITÁRIO"].str.split(" ").str[1]
+        df_final["emissor"] = tabelas[0][0][0].replace("RECEBEMOS DE ", "").replace(" OS PRODUTOS CONSTANTES NA NOTA FISCAL AO LADO", "")
+        df_final["cnpj_emissor"] = "11.908.486/0001-87"
+        df_final["data_emissao_nota"] = tabelas[1][0][1].split(" ")[5]
+        df_final["chave_acesso"] = "0000000000000000000"
+        return df_final
+
+LAYOUTS_PDF = [converter_primeiro_layout, converter_segundo_layout, converter_terceiro_layout, converter_quarto_layout]
+
+def converter_xml(arquivo_xml):
+    arvore = ET.parse(arquivo_xml)
+    raiz = arvore.getroot()
+    ns = {"nfe": "http://www.portalfiscal.inf.br/nfe"}
+    infNFe = raiz.find(".//nfe:infNFe", ns)
+    if not infNFe:
+        return None
+    dados_xml = []
+    for item in raiz.findall('.//nfe:det', ns):
+        prod = item.find("nfe:prod", ns)
+        if prod:
+            dados_xml.append({
+                'chave_acesso': infNFe.attrib.get('Id'),
+                'emissor': infNFe.find("nfe:emit/nfe:xNome", ns).text,
+                'cnpj_emissor': infNFe.find("nfe:emit/nfe:CNPJ", ns).text,
+                'data_emissao_nota': infNFe.find("nfe:ide/nfe:dhEmi", ns).text,
+                'codigo_produto': prod.find("nfe:cProd", ns).text,
+                'descricao_produto': prod.find("nfe:xProd", ns).text,
+                'ncm_sh': prod.find("nfe:NCM", ns).text,
+                'cfop': prod.find("nfe:CFOP", ns).text,
+                'unidade_medida': prod.find("nfe:uCom", ns).text,
+                'quantidade': prod.find("nfe:qCom", ns).text,
+                'valor_unitario': prod.find("nfe:vUnCom", ns).text,
+                'valor_total': prod.find("nfe:vProd", ns).text
+            })
+    return pd.DataFrame(dados_xml)
@@ -0,0 +1,291 @@
+# Motor de regras de custo: substitui o CASE fixo da view materias_primas_detalhadas
+import json
+from functools import lru_cache
+
+# numpy/pandas são importados dentro das funções: só quem recalcula custos paga o custo do import
+from custeio_estoque import carregar_estado_custos
+from materiais_canonicos import descricao_canonica_sql
+
+POLITICAS_PRECO = ('recente', 'media_ponderada', 'media_ultimas_n', 'fifo')
+
+# Regras equivalentes ao CASE antigo da view: UN, MT e KG custam o próprio valor da nota;
+# LT divide pelo peso bruto e fica sem custo se o peso não estiver cadastrado.
+# "divisor" pode ser um número ou "peso_bruto"; quando "divisor_obrigatorio" é falso e o peso
+# não está cadastrado, o custo continua sendo o próprio valor da nota.
+REGRAS_PADRAO = {
+    'politica_preco': 'recente',
+    'ultimas_n': 3,
+    'conversoes': [
+        {'de': '*', 'para': 'UN', 'divisor': 1},
+        {'de': '*', 'para': 'MT', 'divisor': 1},
+        {'de': '*', 'para': 'KG', 'divisor': 1},
+        {'de': '*', 'para': 'LT', 'divisor': 'peso_bruto', 'divisor_obrigatorio': True},
+    ],
+    'rateio': {
+        'frete_percentual': 0,
+        'impostos_percentual': 0,
+    },
+}
+
+# Modelos opcionais, publicados pelo PUT /regras-custo como qualquer outra versão.
+# "conversoes_embalagem" converte caixa (CX->UN) e rolo (RL->MT) pelo peso bruto e grama (G->KG).
+MODELOS_REGRAS = {
+    'conversoes_embalagem': {
+        **REGRAS_PADRAO,
+        'conversoes': [
+            {'de': 'CX', 'para': 'UN', 'divisor': 'peso_bruto', 'divisor_obrigatorio': False},
+            {'de': 'G', 'para': 'KG', 'divisor': 0.001},
+            {'de': 'RL', 'para': 'MT', 'divisor': 'peso_bruto', 'divisor_obrigatorio': False},
+            *REGRAS_PADRAO['conversoes'],
+        ],
+    },
+}
+
+
+def validar_regras(regras):
+    if not isinstance(regras, dict):
+        raise ValueError("As regras devem ser um objeto JSON.")
+
+    politica = regras.get('politica_preco', 'recente')
+    if politica not in POLITICAS_PRECO:
+        raise ValueError(f"Política de preço inválida: '{politica}'. Use uma de {', '.join(POLITICAS_PRECO)}.")
+
+    ultimas_n = regras.get('ultimas_n', 3)
+    if not isinstance(ultimas_n, int) or ultimas_n < 1:
+        raise ValueError("'ultimas_n' deve ser um inteiro maior que zero.")
+
+    conversoes = regras.get('conversoes', [])
+    if not isinstance(conversoes, list):
+        raise ValueError("'conversoes' deve ser uma lista.")
+    for conversao in conversoes:
+        if not isinstance(conversao, dict):
+            raise ValueError("Cada conversão deve ser um objeto JSON.")
+        if not isinstance(conversao.get('de'), str) or not isinstance(conversao.get('para'), str) \
+                or not conversao['de'] or not conversao['para']:
+            raise ValueError("Cada conversão precisa dos campos 'de' e 'para'.")
+        divisor = conversao.get('divisor', 1)
+        if divisor != 'peso_bruto' and (not isinstance(divisor, (int, float)) or isinstance(divisor, bool) or divisor <= 0):
+            raise ValueError(f"Divisor inválido na conversão {conversao['de']}->{conversao['para']}.")
+
+    # O rateio é um percentual único sobre o custo de todas as matérias-primas: as notas não
+    # trazem frete nem impostos por item para ratear nota a nota
+    rateio = regras.get('rateio', {})
+    if not isinstance(rateio, dict):
+        raise ValueError("'rateio' deve ser um objeto JSON.")
+    for chave in ('frete_percentual', 'impostos_percentual'):
+        valor = rateio.get(chave, 0)
+        if not isinstance(valor, (int, float)) or isinstance(valor, bool) or valor < 0:
+            raise ValueError(f"'{chave}' deve ser um número maior ou igual a zero.")
+
+    return {
+        'politica_preco': politica,
+        'ultimas_n': ultimas_n,
+        'conversoes': conversoes,
+        'rateio': {
+            'frete_percentual': rateio.get('frete_percentual', 0),
+            'impostos_percentual': rateio.get('impostos_percentual', 0),
+        },
+    }
+
+
+def _aplicar_politica(notas, estado, politica, ultimas_n):
+    import numpy as np
+    import pandas as pd
+
+    # Empates de data ficam com o menor id, como na view materias_primas_detalhadas
+    notas = notas.sort_values(['descricao_produto', 'data_emissao_nota', 'id'], ascending=[True, True, False])
+    grupos = notas.groupby('descricao_produto', sort=False)
+    resultado = grupos.tail(1).set_index('descricao_produto')[['unidade_medida_nf', 'valor_unitario_nf']]
+
+    if politica == 'recente':
+        return resultado.rename(columns={'valor_unitario_nf': 'preco_base'}).reset_index()
+
+    if politica in ('media_ponderada', 'fifo'):
+        # Lidos do estado corrente mantido pelos triggers, sem percorrer o histórico
+        coluna = 'custo_medio' if politica == 'media_ponderada' else 'custo_fifo'
+        preco = estado.set_index('descricao_produto')[coluna]
+    else:
+        ultimas = grupos.tail(ultimas_n)
+        quantidade = ultimas['quantidade'].fillna(0).clip(lower=0)
+        ponderado = pd.DataFrame({
+            'descricao_produto': ultimas['descricao_produto'],
+            'valor': ultimas['valor_unitario_nf'] * quantidade,
+            'quantidade': quantidade,
+        }).groupby('descricao_produto').sum()
+        preco = ponderado['valor'] / ponderado['quantidade'].replace(0, np.nan)
+
+    # Sem estoque ou sem quantidade válida, vale o preço da nota mais recente
+    preco = pd.to_numeric(preco, errors='coerce')
+    resultado['preco_base'] = preco.reindex(resultado.index).fillna(resultado['valor_unitario_nf'])
+    return resultado.drop(columns='valor_unitario_nf').reset_index()
+
+
+@lru_cache(maxsize=8)
+def compilar_regras(versao, regras_json):
+    regras = validar_regras(json.loads(regras_json))
+
+    # Conversões específicas ('de' preenchido) têm precedência sobre as genéricas ('*')
+    conversoes = sorted(regras['conversoes'], key=lambda c: c['de'] == '*')
+    fator_rateio = 1 + (regras['rateio']['frete_percentual'] + regras['rateio']['impostos_percentual']) / 100
+
+    def avaliar(notas, atributos, estado):
+        import numpy as np
+        import pandas as pd
+
+        if notas.empty:
+            return pd.DataFrame(columns=['descricao_produto', 'custo_por_unidade_padrao'])
+
+        df = _aplicar_politica(notas, estado, regras['politica_preco'], regras['ultimas_n'])
+        df = df.merge(atributos, on='descricao_produto', how='left')
+
+        unidade_nf = df['unidade_medida_nf'].astype('string').str.strip().str.upper()
+        # Unidade padrão comparada como está gravada, igual ao IN ('UN', 'MT', 'KG') do CASE antigo
+        unidade_padrao = df['unidade_medida_padrao'].astype('string')
+        peso = pd.to_numeric(df['peso_bruto'], errors='coerce')
+        peso_valido = peso.notna() & (peso > 0)
+        preco = pd.to_numeric(df['preco_base'], errors='coerce')
+
+        condicoes, escolhas = [], []
+        for conversao in conversoes:
+            condicao = (unidade_padrao == conversao['para']).fillna(False)
+            if conversao['de'] != '*':
+                condicao &= (unidade_nf == conversao['de'].upper()).fillna(False)
+
+            divisor = conversao.get('divisor', 1)
+            if divisor == 'peso_bruto':
+                custo = preco / peso.where(peso_valido)
+                if not conversao.get('divisor_obrigatorio', True):
+                    custo = custo.fillna(preco)
+            else:
+                custo = preco / divisor
+
+            condicoes.append(condicao.to_numpy(dtype=bool))
+            escolhas.append(custo.to_numpy(dtype=float))
+
+        custos = np.select(condicoes, escolhas, default=np.nan) if condicoes else np.full(len(df), np.nan)
+
+        return pd.DataFrame({
+            'descricao_produto': df['descricao_produto'],
+            'custo_por_unidade_padrao': custos * fator_rateio,
+        })
+
+    return avaliar
+
+
+def obter_regras_ativas(cursor):
+    cursor.execute("SELECT versao, regras FROM regras_custo ORDER BY versao DESC LIMIT 1")
+    registro = cursor.fetchone()
+    if not registro:
+        return 0, json.dumps(REGRAS_PADRAO)
+    return registro[0], registro[1]
+
+
+def _obter_versao(cursor, chave):
+    cursor.execute("SELECT valor FROM controle_versoes WHERE chave = ?", (chave,))
+    registro = cursor.fetchone()
+    return registro[0] if registro else 0
+
+
+def _ler(cursor, sql, parametros=()):
+    import pandas as pd
+
+    cursor.execute(sql, parametros)
+    return pd.DataFrame(cursor.fetchall(), columns=[coluna[0] for coluna in cursor.description])
+
+
+def _avaliar_custos(cursor, notas, atributos, estado):
+    import pandas as pd
+
+    versao_regras, regras_json = obter_regras_ativas(cursor)
+    avaliar = compilar_regras(versao_regras, regras_json)
+    estado = pd.DataFrame(estado, columns=['descricao_produto', 'custo_medio', 'custo_fifo'])
+    custos = avaliar(notas, atributos, estado)
+    return versao_regras, list(custos.astype(object).where(custos.notna(), None).itertuples(index=False, name=None))
+
+
+def recalcular_custos(conexao):
+    cursor = conexao.cursor()
+    versao_dados = _obter_versao(cursor, 'dados')
+
+    notas = _ler(cursor, '''
+        SELECT id, descricao_canonica AS descricao_produto, data_emissao_nota, quantidade,
+               unidade_medida AS unidade_medida_nf, valor_unitario AS valor_unitario_nf
+        FROM notas_fiscais_canonicas
+        WHERE descricao_produto IS NOT NULL
+    ''')
+    atributos = _ler(cursor, "SELECT descricao_produto, peso_bruto, unidade_medida_padrao FROM atributos_materias_primas")
+    versao_regras, custos = _avaliar_custos(cursor, notas, atributos, carregar_estado_custos(conexao))
+
+    # Uma única passada em lote: substitui todos os custos derivados de uma vez
+    cursor.execute("DELETE FROM custos_materias_primas")
+    cursor.executemany(
+        "INSERT INTO custos_materias_primas (descricao_produto, custo_por_unidade_padrao) VALUES (?, ?)",
+        custos
+    )
+    cursor.executemany(
+        "INSERT OR REPLACE INTO controle_versoes (chave, valor) VALUES (?, ?)",
+        [('custos_regras', versao_regras), ('custos_dados', versao_dados)]
+    )
+    conexao.commit()
+    return len(custos)
+
+
+def custos_em_dia(cursor):
+    versao_regras, _ = obter_regras_ativas(cursor)
+    return (_obter_versao(cursor, 'custos_regras') == versao_regras
+            and _obter_versao(cursor, 'custos_dados') == _obter_versao(cursor, 'dados'))
+
+
+def atualizar_custos(cursor, descricoes):
+    # Recalcula, na transação da escrita, só os custos dos materiais que ela tocou (descrições
+    # como gravadas ou canônicas; a própria descrição entra para apagar o custo de um material
+    # que deixou de existir). Só vale se custos_em_dia era verdadeiro no início da transação:
+    # os demais custos continuam certos e a versão passa a valer para a escrita inteira
+    cursor.execute(f'''
+        SELECT value FROM json_each(:descricoes) WHERE value IS NOT NULL
+        UNION
+        SELECT {descricao_canonica_sql('value')} FROM json_each(:descricoes) WHERE value IS NOT NULL
+    ''', {'descricoes': json.dumps(list(descricoes))})
+    alvo = json.dumps([registro[0] for registro in cursor.fetchall()])
+
+    notas = _ler(cursor, '''
+        WITH alvo AS MATERIALIZED (SELECT value AS descricao FROM json_each(:alvo)),
+        grafias AS MATERIALIZED (
+            SELECT dm.descricao_produto, mc.descricao AS descricao_canonica
+            FROM alvo
+            JOIN materiais_canonicos mc ON mc.descricao = alvo.descricao
+            JOIN descricoes_materiais dm ON dm.material_id = mc.id
+            UNION
+            SELECT alvo.descricao, alvo.descricao FROM alvo
+            WHERE NOT EXISTS (SELECT 1 FROM descricoes_materiais dm WHERE dm.descricao_produto = alvo.descricao)
+        )
+        SELECT nf.id, g.descricao_canonica AS descricao_produto, nf.data_emissao_nota, nf.quantidade,
+               nf.unidade_medida AS unidade_medida_nf, nf.valor_unitario AS valor_unitario_nf
+        FROM notas_fiscais nf
+        JOIN grafias g ON g.descricao_produto = nf.descricao_produto
+    ''', {'alvo': alvo})
+    atributos = _ler(cursor, '''
+        SELECT descricao_produto, peso_bruto, unidade_medida_padrao FROM atributos_materias_primas
+        WHERE descricao_produto IN (SELECT value FROM json_each(?))
+    ''', (alvo,))
+    _, custos = _avaliar_custos(cursor, notas, atributos, carregar_estado_custos(cursor.connection, alvo))
+
+    cursor.execute("DELETE FROM custos_materias_primas WHERE descricao_produto IN (SELECT value FROM json_each(?))", (alvo,))
+    cursor.executemany(
+        "INSERT INTO custos_materias_primas (descricao_produto, custo_por_unidade_padrao) VALUES (?, ?)",
+        custos
+    )
+    cursor.execute('''
+        INSERT OR REPLACE INTO controle_versoes (chave, valor)
+        SELECT 'custos_dados', valor FROM controle_versoes WHERE chave = 'dados'
+    ''')
+    return len(custos)
+
+
+def garantir_custos_atualizados(conexao):
+    # Escritas que passam por atualizar_custos mantêm os custos em dia; a passada completa
+    # fica para regras novas e para o primeiro acesso depois de uma escrita que não passou
+    if custos_em_dia(conexao.cursor()):
+        return False
+    recalcular_custos(conexao)
+    return True
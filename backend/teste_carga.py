@@ -0,0 +1,398 @@
+# Teste de carga do backend: vários usuários simultâneos repetindo uma mistura realista de
+# rotas (navegação, edição de produtos, sugestões e upload de notas), com latência
+# p50/p95/p99, vazão e taxa de erros por rota, comparadas a limites de SLO.
+#
+# Uso:
+#   python teste_carga.py                                 # sobe um servidor local numa cópia do banco
+#   python teste_carga.py --usuarios 50 --duracao 60
+#   python teste_carga.py --gunicorn --workers 4          # servidor local com gunicorn
+#   python teste_carga.py --url http://localhost:5000     # servidor já rodando (as escritas são reais!)
+#   python teste_carga.py --mix materias_primas=5,upload_xml=1 --slo slo.json --json resultado.json
+#
+# O arquivo de --slo tem o formato {"rota": {"p95_ms": ..., "p99_ms": ..., "erros": 0.01, "recusadas": 0.05}};
+# "*" vale para as rotas sem limite próprio. Sai com código 1 se alguma rota violar o SLO.
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+PASTA_BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+# Peso de cada operação na mistura: a maior parte é navegação, uploads são raros e pesados
+MIX_PADRAO = {
+    'materias_primas': 35,
+    'produto_detalhes': 25,
+    'produtos_cadastrados': 10,
+    'sugestoes_emissores': 8,
+    'sugestoes_codigos': 7,
+    'editar_bom': 10,
+    'upload_xml': 5,
+}
+
+SLO_PADRAO = {
+    '*': {'p95_ms': 500, 'p99_ms': 1500, 'erros': 0.01, 'recusadas': 0.01},
+    'editar_bom': {'p95_ms': 800, 'p99_ms': 2000, 'erros': 0.01, 'recusadas': 0.01},
+    'upload_xml': {'p95_ms': 5000, 'p99_ms': 10000, 'erros': 0.02, 'recusadas': 0.05},
+}
+
+XML_NOTA = '''<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe><infNFe Id="NFe{chave}" versao="4.00">
+<ide><dhEmi>{data}</dhEmi></ide>
+<emit><CNPJ>11222333000181</CNPJ><xNome>FORNECEDOR TESTE DE CARGA LTDA</xNome></emit>
+{itens}
+</infNFe></NFe></nfeProc>'''
+
+XML_ITEM = '''<det nItem="{n}"><prod><cProd>{codigo}</cProd><xProd>{descricao}</xProd><NCM>73181500</NCM>
+<CFOP>5102</CFOP><uCom>{unidade}</uCom><qCom>{quantidade}</qCom><vUnCom>{valor:.4f}</vUnCom>
+<vProd>{total:.2f}</vProd></prod></det>'''
+
+
+class Cliente:
+    def __init__(self, url, timeout):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def requisitar(self, metodo, caminho, corpo=None, cabecalhos=None):
+        requisicao = urllib.request.Request(self.url + caminho, data=corpo, method=metodo, headers=cabecalhos or {})
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+                return resposta.status, resposta.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def json(self, caminho):
+        status, corpo = self.requisitar('GET', caminho)
+        if status != 200:
+            raise RuntimeError(f"GET {caminho} respondeu {status}: {corpo[:200]!r}")
+        return json.loads(corpo)
+
+
+class Dados:
+    # Ids e descrições reais do banco, lidos uma vez antes da carga, para as operações
+    # apontarem para registros que existem
+    def __init__(self, cliente):
+        self.descricoes = [m['descricao_produto'] for m in cliente.json('/materias-primas') if m.get('descricao_produto')]
+        self.produtos = {}
+        for produto in cliente.json('/produtos-cadastrados'):
+            detalhes = cliente.json(f"/produtos-cadastrados/{produto['ID_Produto']}")
+            self.produtos[produto['ID_Produto']] = detalhes['materias_primas']
+
+
+def _json(dados):
+    return json.dumps(dados).encode(), {'Content-Type': 'application/json'}
+
+
+def _nota_xml(rng, dados, itens):
+    linhas = []
+    for n in range(1, itens + 1):
+        # A maioria das compras repete materiais conhecidos; algumas trazem descrições novas
+        if dados.descricoes and rng.random() < 0.9:
+            descricao = rng.choice(dados.descricoes)
+        else:
+            descricao = f"MATERIAL TESTE DE CARGA {rng.randint(1, 500)}"
+        quantidade = rng.randint(1, 100)
+        valor = rng.uniform(0.5, 200)
+        linhas.append(XML_ITEM.format(n=n, codigo=f"TC-{rng.randint(1, 9999)}", descricao=descricao.replace('&', '&amp;').replace('<', '&lt;'),
+                                      unidade=rng.choice(['UN', 'KG', 'PC', 'M']), quantidade=quantidade,
+                                      valor=valor, total=quantidade * valor))
+    chave = ''.join(rng.choice('0123456789') for _ in range(44))
+    return XML_NOTA.format(chave=chave, data=time.strftime('%Y-%m-%dT%H:%M:%S-03:00'), itens='\n'.join(linhas)).encode()
+
+
+def _multipart(arquivos):
+    fronteira = uuid.uuid4().hex
+    partes = []
+    for nome, conteudo in arquivos:
+        partes.append(f'--{fronteira}\r\nContent-Disposition: form-data; name="files[]"; filename="{nome}"\r\n'
+                      f'Content-Type: application/xml\r\n\r\n'.encode() + conteudo + b'\r\n')
+    corpo = b''.join(partes) + f'--{fronteira}--\r\n'.encode()
+    return corpo, {'Content-Type': f'multipart/form-data; boundary={fronteira}'}
+
+
+# Cada operação devolve (método, caminho, corpo, cabeçalhos) ou None se não houver dados para ela
+def op_materias_primas(rng, dados, args):
+    return 'GET', '/materias-primas', None, None
+
+
+def op_produtos_cadastrados(rng, dados, args):
+    return 'GET', '/produtos-cadastrados', None, None
+
+
+def op_produto_detalhes(rng, dados, args):
+    if not dados.produtos:
+        return None
+    return 'GET', f"/produtos-cadastrados/{rng.choice(list(dados.produtos))}", None, None
+
+
+def op_sugestoes_emissores(rng, dados, args):
+    return 'GET', '/sugestoes/emissores_cnpj', None, None
+
+
+def op_sugestoes_codigos(rng, dados, args):
+    return 'GET', '/sugestoes/codigos_produto', None, None
+
+
+def op_editar_bom(rng, dados, args):
+    # Salva a lista de matérias-primas de um produto com uma quantidade ajustada, como a tela de detalhes
+    produtos = [id_produto for id_produto, mps in dados.produtos.items() if mps]
+    if not produtos:
+        return None
+    id_produto = rng.choice(produtos)
+    mp = rng.choice(dados.produtos[id_produto])
+    corpo, cabecalhos = _json({'editar': [{
+        'id': mp['id'],
+        'materia_prima_id': mp['materia_prima_id'],
+        'quantidade_utilizada': round((mp['quantidade_utilizada'] or 1) * rng.uniform(0.95, 1.05), 4),
+        'unidade_medida': mp.get('unidade_medida_padrao'),
+    }]})
+    return 'PUT', f"/produtos-cadastrados/{id_produto}/materias-primas", corpo, cabecalhos
+
+
+def op_upload_xml(rng, dados, args):
+    arquivos = [(f"carga_{uuid.uuid4().hex[:8]}.xml", _nota_xml(rng, dados, args.itens_por_nota))
+                for _ in range(args.arquivos_por_upload)]
+    corpo, cabecalhos = _multipart(arquivos)
+    return 'POST', '/upload-xml', corpo, cabecalhos
+
+
+OPERACOES = {
+    'materias_primas': op_materias_primas,
+    'produtos_cadastrados': op_produtos_cadastrados,
+    'produto_detalhes': op_produto_detalhes,
+    'sugestoes_emissores': op_sugestoes_emissores,
+    'sugestoes_codigos': op_sugestoes_codigos,
+    'editar_bom': op_editar_bom,
+    'upload_xml': op_upload_xml,
+}
+
+
+def usuario(indice, cliente, dados, mix, args, fim, resultados, trava):
+    rng = random.Random(args.semente + indice)
+    nomes, pesos = zip(*mix.items())
+    medicoes = []
+    while time.monotonic() < fim:
+        nome = rng.choices(nomes, pesos)[0]
+        requisicao = OPERACOES[nome](rng, dados, args)
+        if requisicao is None:
+            continue
+        metodo, caminho, corpo, cabecalhos = requisicao
+        inicio = time.perf_counter()
+        try:
+            status, resposta = cliente.requisitar(metodo, caminho, corpo, cabecalhos)
+        except Exception as e:
+            status, resposta = None, str(e).encode()
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        medicoes.append((nome, status, latencia_ms, b'database is locked' in resposta))
+        if args.pausa_ms:
+            time.sleep(rng.uniform(0, 2 * args.pausa_ms) / 1000)
+    with trava:
+        resultados.extend(medicoes)
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    # Método nearest-rank: o menor valor com pelo menos p% das medições até ele
+    posicao = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[posicao]
+
+
+def _arredondar(valor):
+    return round(valor, 1) if valor is not None else None
+
+
+def resumir(medicoes, duracao):
+    por_rota = defaultdict(list)
+    for medicao in medicoes:
+        por_rota[medicao[0]].append(medicao)
+        por_rota['TOTAL'].append(medicao)
+
+    resumo = {}
+    for rota, lista in por_rota.items():
+        # 429 é a fila de ingestão recusando de propósito (com Retry-After): conta à parte, não como
+        # erro, e fica fora das latências, senão recusas de ~1 ms escondem a lentidão das aceitas
+        latencias = sorted(m[2] for m in lista if m[1] != 429)
+        recusadas = sum(1 for m in lista if m[1] == 429)
+        erros = sum(1 for m in lista if m[1] is None or (m[1] >= 400 and m[1] != 429))
+        resumo[rota] = {
+            'requisicoes': len(lista),
+            'por_segundo': round(len(lista) / duracao, 1),
+            'p50_ms': _arredondar(percentil(latencias, 50)),
+            'p95_ms': _arredondar(percentil(latencias, 95)),
+            'p99_ms': _arredondar(percentil(latencias, 99)),
+            'max_ms': _arredondar(latencias[-1] if latencias else None),
+            'erros': erros,
+            'taxa_erros': round(erros / len(lista), 4),
+            'recusadas_429': recusadas,
+            'taxa_recusadas': round(recusadas / len(lista), 4),
+            'banco_travado': sum(1 for m in lista if m[3]),
+        }
+    return resumo
+
+
+def verificar_slo(resumo, slo):
+    violacoes = []
+    for rota, metricas in resumo.items():
+        if rota == 'TOTAL':
+            continue
+        limites = slo.get(rota, slo.get('*', {}))
+        for chave, metrica in (('p95_ms', 'p95_ms'), ('p99_ms', 'p99_ms'), ('erros', 'taxa_erros'), ('recusadas', 'taxa_recusadas')):
+            if chave in limites and metricas[metrica] is not None and metricas[metrica] > limites[chave]:
+                violacoes.append(f"{rota}: {metrica} = {metricas[metrica]} (limite {limites[chave]})")
+    return violacoes
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(args, pasta):
+    # Cópia consistente do banco (backup do SQLite inclui o que ainda está no WAL)
+    db_file = os.path.join(pasta, 'teste_carga.db')
+    if os.path.exists(args.banco):
+        origem = sqlite3.connect(args.banco)
+        destino = sqlite3.connect(db_file)
+        origem.backup(destino)
+        destino.close()
+        origem.close()
+
+    porta = _porta_livre()
+    ambiente = dict(os.environ, DB_FILE=db_file, EMPRESAS_DIR=os.path.join(pasta, 'empresas'))
+    if args.gunicorn:
+        comando = [shutil.which('gunicorn') or 'gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+                   '-b', f'127.0.0.1:{porta}', 'app:app']
+    else:
+        comando = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(porta), '--with-threads']
+    processo = subprocess.Popen(comando, cwd=PASTA_BACKEND, env=ambiente,
+                                stdout=subprocess.DEVNULL, stderr=open(os.path.join(pasta, 'servidor.log'), 'w'))
+
+    url = f'http://127.0.0.1:{porta}'
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"O servidor terminou ao iniciar (código {processo.returncode}).")
+        try:
+            urllib.request.urlopen(url + '/', timeout=1).read()
+            return processo, url
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError("O servidor não respondeu em 60 s.")
+
+
+def _ler_mix(texto):
+    mix = {}
+    for item in texto.split(','):
+        nome, _, peso = item.partition('=')
+        if nome.strip() not in OPERACOES:
+            raise SystemExit(f"Operação desconhecida no --mix: {nome.strip()} (opções: {', '.join(OPERACOES)})")
+        mix[nome.strip()] = float(peso or 1)
+    return mix
+
+
+def imprimir(resumo, duracao, usuarios):
+    print(f"\n{usuarios} usuários por {duracao:.0f} s\n")
+    cabecalho = f"{'rota':<22}{'req':>7}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'erros':>8}{'429':>6}{'locked':>8}"
+    print(cabecalho)
+    print('-' * len(cabecalho))
+    for rota in sorted(resumo, key=lambda r: (r == 'TOTAL', r)):
+        m = {chave: '-' if valor is None else valor for chave, valor in resumo[rota].items()}
+        print(f"{rota:<22}{m['requisicoes']:>7}{m['por_segundo']:>8}{m['p50_ms']:>9}{m['p95_ms']:>9}{m['p99_ms']:>9}"
+              f"{m['max_ms']:>9}{m['taxa_erros']:>8.2%}{m['recusadas_429']:>6}{m['banco_travado']:>8}")
+    print("\nLatências em ms, só das requisições aceitas. 429 = recusadas pela fila de ingestão; locked = respostas com 'database is locked'.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga e SLO de latência do backend")
+    parser.add_argument('--url', help="Servidor já rodando; sem isto, um servidor local é iniciado numa cópia do banco")
+    parser.add_argument('--banco', default=os.path.join(PASTA_BACKEND, 'dados_notas_fiscais.db'),
+                        help="Banco copiado para o servidor local")
+    parser.add_argument('--gunicorn', action='store_true', help="Servidor local com gunicorn em vez do servidor do Flask")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--usuarios', type=int, default=50, help="Usuários simultâneos")
+    parser.add_argument('--duracao', type=float, default=30, help="Segundos de carga")
+    parser.add_argument('--pausa-ms', type=float, default=100, help="Pausa média entre requisições de um usuário")
+    parser.add_argument('--mix', help="Pesos das operações, ex.: materias_primas=5,upload_xml=1")
+    parser.add_argument('--itens-por-nota', type=int, default=20)
+    parser.add_argument('--arquivos-por-upload', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--slo', help="Arquivo JSON com os limites por rota (padrão: SLO_PADRAO)")
+    parser.add_argument('--sem-slo', action='store_true', help="Só mede, sem verificar limites")
+    parser.add_argument('--json', help="Grava o resumo neste arquivo")
+    args = parser.parse_args()
+
+    mix = _ler_mix(args.mix) if args.mix else MIX_PADRAO
+    slo = SLO_PADRAO
+    if args.slo:
+        with open(args.slo, encoding='utf-8') as arquivo:
+            slo = json.load(arquivo)
+
+    pasta = tempfile.mkdtemp(prefix='teste_carga_')
+    processo = None
+    try:
+        url = args.url
+        if not url:
+            processo, url = iniciar_servidor(args, pasta)
+            print(f"Servidor local em {url} (banco copiado para {pasta})")
+
+        cliente = Cliente(url, args.timeout)
+        dados = Dados(cliente)
+        print(f"{len(dados.descricoes)} matérias-primas e {len(dados.produtos)} produtos no banco")
+
+        resultados, trava = [], threading.Lock()
+        inicio = time.monotonic()
+        fim = inicio + args.duracao
+        usuarios = [threading.Thread(target=usuario, args=(i, cliente, dados, mix, args, fim, resultados, trava))
+                    for i in range(args.usuarios)]
+        for thread in usuarios:
+            thread.start()
+        for thread in usuarios:
+            thread.join()
+        duracao = time.monotonic() - inicio
+    finally:
+        if processo:
+            processo.terminate()
+            processo.wait(timeout=10)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    if not resultados:
+        print("Nenhuma requisição foi feita.")
+        sys.exit(1)
+
+    resumo = resumir(resultados, duracao)
+    imprimir(resumo, duracao, args.usuarios)
+
+    violacoes = [] if args.sem_slo else verificar_slo(resumo, slo)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as arquivo:
+            json.dump({'usuarios': args.usuarios, 'duracao_s': round(duracao, 1), 'mix': mix,
+                       'rotas': resumo, 'violacoes_slo': violacoes}, arquivo, indent=2, ensure_ascii=False)
+
+    if violacoes:
+        print("\nFALHOU (SLO):")
+        for violacao in violacoes:
+            print(f"  {violacao}")
+        sys.exit(1)
+    if not args.sem_slo:
+        print("\nSLO atendido em todas as rotas.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# app.py prepara o banco ao ser importado: nunca o dados_notas_fiscais.db do repositório
+_DIR_TESTES = tempfile.mkdtemp(prefix='testes_backend_')
+os.environ['DB_FILE'] = os.path.join(_DIR_TESTES, 'importacao.db')
+os.environ['EMPRESAS_DIR'] = os.path.join(_DIR_TESTES, 'empresas')
+os.environ['PAINEL_ATRASO_ATUALIZACAO_SEGUNDOS'] = '0'
+
+import banco  # noqa: E402
+
+BANCO_EXEMPLO = os.path.join(BACKEND_DIR, 'dados_notas_fiscais.db')
+
+
+@pytest.fixture
+def banco_vazio(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'teste.db')
+    monkeypatch.setattr(banco, 'DB_FILE', caminho)
+    monkeypatch.setattr(banco, 'EMPRESAS_DIR', str(tmp_path / 'empresas'))
+    monkeypatch.setattr(banco, '_pools', {})
+    monkeypatch.setattr(banco, '_bancos_preparados', set())
+    yield caminho
+    # Recálculos do dashboard agendados pelo teste terminam antes de o banco dele sair de cena
+    for agendamento in threading.enumerate():
+        if isinstance(agendamento, threading.Timer):
+            agendamento.join()
+
+
+@pytest.fixture
+def banco_exemplo(banco_vazio):
+    # Cópia do banco de exemplo do repositório, ainda no esquema antigo (user_version 0)
+    shutil.copyfile(BANCO_EXEMPLO, banco_vazio)
+    return banco_vazio
+
+
+@pytest.fixture
+def cliente(banco_vazio):
+    from app import criar_app
+    app = criar_app()
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+@pytest.fixture
+def cliente_exemplo(banco_exemplo):
+    from app import criar_app
+    app = criar_app()
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+def gerar_nfe(itens, chave='NFe35240100000000000000550010000000011000000010', data='2024-01-15T10:00:00-03:00'):
+    # NF-e mínima com os campos lidos por parsers_notas.converter_xml; itens: (descricao, unidade, quantidade, valor)
+    detalhes = ''.join(f'''
+        <det nItem="{i}"><prod>
+            <cProd>{i}</cProd><xProd>{descricao}</xProd><NCM>00000000</NCM><CFOP>5102</CFOP>
+            <uCom>{unidade}</uCom><qCom>{quantidade}</qCom><vUnCom>{valor}</vUnCom><vProd>{quantidade * valor}</vProd>
+        </prod></det>''' for i, (descricao, unidade, quantidade, valor) in enumerate(itens, start=1))
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><NFe><infNFe Id="{chave}" versao="4.00">
+    <ide><dhEmi>{data}</dhEmi></ide>
+    <emit><CNPJ>00000000000191</CNPJ><xNome>FORNECEDOR TESTE</xNome></emit>{detalhes}
+</infNFe></NFe></nfeProc>'''.encode()
+
+
+def banco_reconstruido(origem, destino):
+    # Banco novo com as notas e os vínculos de origem, aplicados nota a nota pelos triggers das
+    # migrações: o estado e as camadas dele são a referência para cargas em lote e atualizações
+    conexao = sqlite3.connect(destino, isolation_level=None)
+    cursor = conexao.cursor()
+    cursor.execute("BEGIN")
+    for migracao in banco.MIGRACOES:
+        migracao(cursor)
+    cursor.execute(f"PRAGMA user_version = {banco.VERSAO_ESQUEMA}")
+    cursor.execute("COMMIT")
+
+    cursor.execute("ATTACH DATABASE ? AS origem", (origem,))
+    cursor.execute("BEGIN")
+    cursor.execute("INSERT INTO materiais_canonicos SELECT id, descricao, chave_normalizada FROM origem.materiais_canonicos")
+    cursor.execute('''
+        INSERT INTO descricoes_materiais
+        SELECT id, descricao_produto, material_id, status, similaridade, sugestao_material_id FROM origem.descricoes_materiais
+    ''')
+    cursor.execute('''
+        INSERT INTO notas_fiscais (id, descricao_produto, data_emissao_nota, quantidade, valor_unitario)
+        SELECT id, descricao_produto, data_emissao_nota, quantidade, valor_unitario FROM origem.notas_fiscais ORDER BY id
+    ''')
+    cursor.execute("COMMIT")
+    cursor.execute("DETACH DATABASE origem")
+    return conexao
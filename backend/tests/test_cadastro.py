@@ -0,0 +1,93 @@
+import pytest
+
+
+@pytest.fixture
+def produto(cliente):
+    # Produto com duas matérias-primas de uma nota manual
+    resposta = cliente.post('/adicionar-manual', json=[
+        {'descricao': 'CABO', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 2.0},
+        {'descricao': 'FITA', 'unidade': 'UN', 'quantidade': 5, 'valorUnitario': 1.0},
+    ])
+    assert resposta.status_code == 200
+    materiais = {m['descricao_produto']: m['id'] for m in cliente.get('/materias-primas').get_json()}
+    resposta = cliente.post('/cadastrar-produto', json={'nome_produto': 'PAINEL', 'materias_primas': [
+        {'materia_prima_id': materiais['CABO'], 'quantidade_utilizada': 2, 'unidade_medida': 'MT'},
+        {'materia_prima_id': materiais['FITA'], 'quantidade_utilizada': 1, 'unidade_medida': 'UN'},
+    ]})
+    produto_id = resposta.get_json()['produto_id']
+    associacoes = [mp['id'] for mp in cliente.get(f'/produtos-cadastrados/{produto_id}').get_json()['materias_primas']]
+    return produto_id, associacoes, materiais
+
+
+@pytest.mark.parametrize('corpo', [
+    [1, 2],
+    {'adicionar': [1]},
+    {'adicionar': ['x']},
+    {'editar': [None]},
+    {'remover': [{'id': 1}]},
+    {'remover': ['1']},
+    {'remover': [True]},
+    {'remover': 5},
+])
+def test_materias_primas_do_produto_rejeita_itens_invalidos(cliente, produto, corpo):
+    produto_id, _, _ = produto
+    resposta = cliente.put(f'/produtos-cadastrados/{produto_id}/materias-primas', json=corpo)
+    assert resposta.status_code == 400
+    assert len(cliente.get(f'/produtos-cadastrados/{produto_id}').get_json()['materias_primas']) == 2
+
+
+def test_materias_primas_do_produto_remover_repetido(cliente, produto):
+    produto_id, associacoes, _ = produto
+    resposta = cliente.put(f'/produtos-cadastrados/{produto_id}/materias-primas', json={'remover': [associacoes[0], associacoes[0]]})
+    assert resposta.status_code == 200
+    restantes = cliente.get(f'/produtos-cadastrados/{produto_id}').get_json()['materias_primas']
+    assert [mp['id'] for mp in restantes] == associacoes[1:]
+
+
+def test_materias_primas_do_produto_id_alheio_nao_altera_nada(cliente, produto):
+    produto_id, associacoes, _ = produto
+    resposta = cliente.put(f'/produtos-cadastrados/{produto_id}/materias-primas', json={'remover': [associacoes[0], 9999]})
+    assert resposta.status_code == 404
+    assert len(cliente.get(f'/produtos-cadastrados/{produto_id}').get_json()['materias_primas']) == 2
+
+
+@pytest.mark.parametrize('corpo', [
+    [1],
+    {'atributos': [1]},
+    {'atributos': ['CABO']},
+    {'atributos': [{'descricao_produto': ['CABO']}]},
+    {'precos': [None]},
+    {'precos': [{'id': 1, 'descricao_produto': {'x': 1}}]},
+    {'precos': {'id': 1}},
+    {'precos': [{'id': [1]}]},
+    {'precos': [{'id': {'id': 1}}]},
+    {'precos': [{'id': '1'}]},
+    {'precos': [{'id': True}]},
+])
+def test_mapear_atributos_em_lote_rejeita_itens_invalidos(cliente, produto, corpo):
+    resposta = cliente.post('/mapear-atributos/lote', json=corpo)
+    assert resposta.status_code == 400
+    assert all(m['peso_bruto'] is None for m in cliente.get('/materias-primas').get_json())
+
+
+def test_mapear_atributos_em_lote_aplica_tudo(cliente, produto):
+    resposta = cliente.post('/mapear-atributos/lote', json={
+        'atributos': [{'descricao_produto': 'CABO', 'peso_bruto': 0.5, 'unidade_medida_padrao': 'MT'}],
+    })
+    assert resposta.status_code == 200
+    materiais = {m['descricao_produto']: m for m in cliente.get('/materias-primas').get_json()}
+    assert materiais['CABO']['peso_bruto'] == 0.5
+
+
+def test_materias_primas_do_produto_edicao_parcial_mantem_os_demais_campos(cliente, produto):
+    produto_id, associacoes, materiais = produto
+    antes = {mp['id']: mp for mp in cliente.get(f'/produtos-cadastrados/{produto_id}').get_json()['materias_primas']}
+
+    resposta = cliente.put(f'/produtos-cadastrados/{produto_id}/materias-primas', json={'editar': [{'id': associacoes[0], 'quantidade_utilizada': 3}]})
+    assert resposta.status_code == 200
+
+    depois = {mp['id']: mp for mp in resposta.get_json()['produto']['materias_primas']}
+    assert set(depois) == set(associacoes)
+    assert depois[associacoes[0]]['quantidade_utilizada'] == 3
+    assert depois[associacoes[0]]['materia_prima_id'] == antes[associacoes[0]]['materia_prima_id']
+    assert depois[associacoes[1]] == antes[associacoes[1]]
@@ -0,0 +1,90 @@
+import pytest
+
+import banco
+from custeio_estoque import carregar_estado_custos, registrar_baixa
+
+
+@pytest.fixture
+def conexao(banco_vazio):
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    yield conexao
+    conexao.close()
+
+
+def _inserir(conexao, descricao, data, quantidade, valor_unitario):
+    cursor = conexao.cursor()
+    cursor.execute(
+        "INSERT INTO notas_fiscais (descricao_produto, data_emissao_nota, quantidade, valor_unitario) VALUES (?, ?, ?, ?)",
+        (descricao, data, quantidade, valor_unitario)
+    )
+    conexao.commit()
+    return cursor.lastrowid
+
+
+def _estado(conexao, descricao='CABO'):
+    registro = conexao.execute(
+        "SELECT quantidade_total, valor_total FROM estado_custo_medio WHERE descricao_produto = ?", (descricao,)
+    ).fetchone()
+    saldo_camadas = conexao.execute(
+        "SELECT COALESCE(SUM(quantidade_restante), 0) FROM camadas_fifo WHERE descricao_produto = ?", (descricao,)
+    ).fetchone()[0]
+    # O estado médio sempre corresponde ao saldo das camadas FIFO
+    assert registro[0] == pytest.approx(saldo_camadas)
+    assert registro[0] >= 0 and registro[1] >= 0
+    return registro
+
+
+def _custos(conexao):
+    return {descricao: (medio, fifo) for descricao, medio, fifo in carregar_estado_custos(conexao)}
+
+
+def test_media_e_fifo_acompanham_as_notas(conexao):
+    _inserir(conexao, 'CABO', '2024-01-01', 10, 1.0)
+    _inserir(conexao, 'CABO', '2024-02-01', 10, 3.0)
+    assert _estado(conexao) == (20, 40.0)
+    assert _custos(conexao)['CABO'] == (2.0, 1.0)
+
+
+def test_excluir_nota_baixada_nao_deixa_estado_negativo(conexao):
+    antiga = _inserir(conexao, 'CABO', '2024-01-01', 10, 1.0)
+    recente = _inserir(conexao, 'CABO', '2024-02-01', 10, 3.0)
+
+    baixa = registrar_baixa(conexao.cursor(), 'CABO', 15)
+    conexao.commit()
+    assert baixa['custo_fifo'] == 10 * 1.0 + 5 * 3.0
+    assert _estado(conexao) == (5, pytest.approx(10.0))
+
+    # A nota antiga já foi toda consumida: não há o que estornar
+    conexao.execute("DELETE FROM notas_fiscais WHERE id = ?", (antiga,))
+    conexao.commit()
+    assert _estado(conexao) == (5, pytest.approx(10.0))
+    assert _custos(conexao)['CABO'] == (pytest.approx(2.0), 3.0)
+
+    # Da recente, só o saldo de 5 unidades volta
+    conexao.execute("DELETE FROM notas_fiscais WHERE id = ?", (recente,))
+    conexao.commit()
+    assert _estado(conexao) == (0, 0)
+    assert _custos(conexao)['CABO'] == (None, None)
+
+
+def test_alterar_nota_baixada_desconta_o_consumido(conexao):
+    nota = _inserir(conexao, 'CABO', '2024-01-01', 10, 1.0)
+    registrar_baixa(conexao.cursor(), 'CABO', 4)
+    conexao.commit()
+    assert _estado(conexao) == (6, pytest.approx(6.0))
+
+    # 4 das 8 unidades corrigidas já foram baixadas: restam 4, ao preço novo
+    conexao.execute("UPDATE notas_fiscais SET quantidade = 8, valor_unitario = 2.0 WHERE id = ?", (nota,))
+    conexao.commit()
+    assert _estado(conexao) == (4, pytest.approx(8.0))
+
+    # Quantidade corrigida abaixo do que já foi baixado: nada fica em estoque
+    conexao.execute("UPDATE notas_fiscais SET quantidade = 2 WHERE id = ?", (nota,))
+    conexao.commit()
+    assert _estado(conexao) == (0, 0)
+
+    # Nota invalidada e depois corrigida de novo
+    conexao.execute("UPDATE notas_fiscais SET valor_unitario = NULL WHERE id = ?", (nota,))
+    conexao.execute("UPDATE notas_fiscais SET quantidade = 10, valor_unitario = 1.0 WHERE id = ?", (nota,))
+    conexao.commit()
+    assert _estado(conexao) == (10, pytest.approx(10.0))
@@ -0,0 +1,77 @@
+import pytest
+
+import banco
+import leitura
+
+NOTA = {'descricao': 'CABO FILIAL', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 2.0}
+
+
+@pytest.fixture
+def empresas(monkeypatch):
+    monkeypatch.setattr(banco, 'EMPRESAS', ['matriz', 'filial'])
+    monkeypatch.setattr(leitura, 'EMPRESAS', ['matriz', 'filial'])
+
+
+@pytest.fixture
+def segredo(monkeypatch, empresas):
+    monkeypatch.setattr(banco, 'SEGREDO_EMPRESAS', 'segredo-de-teste')
+
+
+def _token(empresa, validade_segundos=3600):
+    return {'X-Empresa-Token': banco.assinar_empresa(empresa, validade_segundos)}
+
+
+def _descricoes(cliente, **kwargs):
+    return [m['descricao_produto'] for m in cliente.get('/materias-primas', **kwargs).get_json()]
+
+
+def test_dados_de_uma_empresa_nao_aparecem_na_outra(cliente, segredo):
+    assert cliente.post('/adicionar-manual', json=NOTA, headers=_token('filial')).status_code == 200
+
+    assert _descricoes(cliente, headers=_token('filial')) == ['CABO FILIAL']
+    assert _descricoes(cliente, headers=_token('matriz')) == []
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'headers': {'X-Empresa': 'filial'}},
+    {'query_string': {'empresa': 'filial'}},
+])
+def test_empresa_escolhida_pelo_cliente_e_ignorada(cliente, empresas, kwargs):
+    # Sem segredo, tudo vai para a empresa padrão, qualquer que seja o cabeçalho ou parâmetro
+    assert cliente.post('/adicionar-manual', json=NOTA, **kwargs).status_code == 200
+    conexao = banco.conectar('filial')
+    assert conexao.execute("SELECT COUNT(*) FROM notas_fiscais").fetchone()[0] == 0
+    conexao.close()
+    assert _descricoes(cliente) == ['CABO FILIAL']
+
+
+def test_com_segredo_o_token_e_obrigatorio(cliente, segredo):
+    assert cliente.get('/materias-primas').status_code == 401
+    assert cliente.get('/materias-primas', headers={'X-Empresa': 'matriz'}).status_code == 401
+    assert cliente.get('/materias-primas', query_string={'empresa': 'matriz'}).status_code == 401
+
+
+def test_token_adulterado_ou_expirado_e_recusado(cliente, segredo):
+    _, expira, assinatura = banco.assinar_empresa('filial').split(':')
+    assert cliente.get('/materias-primas', headers={'X-Empresa-Token': f'matriz:{expira}:{assinatura}'}).status_code == 401
+    assert cliente.get('/materias-primas', headers={'X-Empresa-Token': 'filial'}).status_code == 401
+    assert cliente.get('/materias-primas', headers=_token('filial', -1)).status_code == 401
+    assert cliente.get('/events', headers=_token('filial', -1)).status_code == 401
+
+
+def test_token_de_empresa_nao_configurada(cliente, segredo):
+    assert cliente.get('/materias-primas', headers=_token('outra')).status_code == 404
+
+
+def test_relatorio_consolidado_exige_token_da_matriz(cliente, empresas, monkeypatch):
+    # Sem segredo a requisição cai na matriz, mas isso não autentica ninguém como matriz
+    assert cliente.get('/relatorios/empresas').status_code == 403
+
+    monkeypatch.setattr(banco, 'SEGREDO_EMPRESAS', 'segredo-de-teste')
+    cliente.post('/adicionar-manual', json=NOTA, headers=_token('filial'))
+    assert cliente.get('/relatorios/empresas', headers=_token('filial')).status_code == 403
+
+    resposta = cliente.get('/relatorios/empresas', headers=_token('matriz'))
+    assert resposta.status_code == 200
+    notas = {linha['empresa']: linha['notas'] for linha in resposta.get_json()['empresas']}
+    assert notas == {'matriz': 0, 'filial': 1}
@@ -0,0 +1,81 @@
+import json
+import time
+
+import pytest
+
+import banco
+import eventos
+
+
+@pytest.fixture
+def stream_curto(monkeypatch):
+    monkeypatch.setattr(eventos, 'DURACAO_MAXIMA', 0.3)
+    monkeypatch.setattr(eventos, 'INTERVALO_CONSULTA', 0.05)
+
+
+def test_stream_entrega_eventos_e_encerra(cliente, stream_curto):
+    resposta = cliente.post('/adicionar-manual', json={'descricao': 'CABO', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 2.0})
+    assert resposta.status_code == 200
+
+    inicio = time.monotonic()
+    resposta = cliente.get('/events?desde=0')
+    corpo = resposta.get_data(as_text=True)
+
+    # O stream se encerra sozinho para liberar a thread; o cliente reconecta depois de retry
+    assert time.monotonic() - inicio < 2
+    assert resposta.mimetype == 'text/event-stream'
+    assert corpo.startswith(f'retry: {eventos.RECONEXAO_MS}\n\n')
+    assert 'event: notas_ingeridas' in corpo
+    assert '"descricao_produto": "CABO"' in corpo
+
+
+def test_reconexao_retoma_do_ultimo_id(cliente, stream_curto):
+    cliente.post('/adicionar-manual', json={'descricao': 'CABO', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 2.0})
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    ultimo = conexao.execute("SELECT MAX(seq) FROM eventos").fetchone()[0]
+    conexao.close()
+    cliente.post('/adicionar-manual', json={'descricao': 'FITA', 'unidade': 'UN', 'quantidade': 1, 'valorUnitario': 1.0})
+
+    corpo = cliente.get('/events', headers={'Last-Event-ID': str(ultimo)}).get_data(as_text=True)
+    assert corpo.count('event: notas_ingeridas') == 1
+    assert '"descricao_produto": "FITA"' in corpo
+
+
+def test_eventos_expirados_pedem_recarga(cliente, stream_curto):
+    for descricao in ('CABO', 'FITA'):
+        cliente.post('/adicionar-manual', json={'descricao': descricao, 'unidade': 'UN', 'quantidade': 1, 'valorUnitario': 1.0})
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    conexao.execute("DELETE FROM eventos WHERE seq = (SELECT MIN(seq) FROM eventos)")
+    conexao.commit()
+    conexao.close()
+
+    corpo = cliente.get('/events?desde=0').get_data(as_text=True)
+    assert 'event: recarregar' in corpo
+    assert 'event: notas_ingeridas' not in corpo
+
+
+def test_edicao_e_exclusao_da_tela_de_materiais_chegam_pelo_feed(cliente, stream_curto):
+    # A tela de matérias-primas não recarrega a lista: depende destes eventos para atualizar as linhas
+    cliente.post('/adicionar-manual', json={'descricao': 'CABO', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 2.0})
+    nota = cliente.get('/materias-primas').get_json()[0]
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    desde = conexao.execute("SELECT MAX(seq) FROM eventos").fetchone()[0]
+    conexao.close()
+
+    def eventos_desde(seq):
+        corpo = cliente.get(f'/events?desde={seq}').get_data(as_text=True)
+        ids = [int(linha[len('id: '):]) for linha in corpo.splitlines() if linha.startswith('id: ')]
+        dados = [json.loads(linha[len('data: '):]) for linha in corpo.splitlines() if linha.startswith('data: ')]
+        return ids[-1], dados
+
+    cliente.post('/mapear-atributos/lote', json={
+        'atributos': [{'descricao_produto': 'CABO', 'peso_bruto': 0.5, 'unidade_medida_padrao': 'MT'}],
+        'precos': [{'id': nota['id'], 'valor_unitario': 3.0}],
+    })
+    desde, [edicao] = eventos_desde(desde)
+    assert edicao['materiais'][0]['valor_unitario_nf'] == 3.0
+    assert edicao['materiais'][0]['peso_bruto'] == 0.5
+
+    cliente.delete(f"/materias-primas/{nota['id']}")
+    _, [exclusao] = eventos_desde(desde)
+    assert exclusao['materiais'] == [] and exclusao['materiais_removidos'] == ['CABO']
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+import banco
+import ingestao
+import materiais_canonicos
+from conftest import banco_reconstruido
+
+
+def _arquivo(nome, itens, data='2024-01-01'):
+    # itens: (descricao, quantidade, valor_unitario)
+    return (nome, pd.DataFrame([{
+        'descricao_produto': descricao, 'quantidade': quantidade, 'valor_unitario': valor_unitario,
+        'unidade_medida': 'UN', 'data_emissao_nota': data, 'origem_dados': 'XML',
+    } for descricao, quantidade, valor_unitario in itens]))
+
+
+def _estado_e_camadas(conexao):
+    estado = conexao.execute("SELECT descricao_produto, quantidade_total, ROUND(valor_total, 6) FROM estado_custo_medio ORDER BY 1").fetchall()
+    camadas = conexao.execute("SELECT nota_id, descricao_produto, quantidade_restante, valor_unitario FROM camadas_fifo ORDER BY 1").fetchall()
+    return estado, camadas
+
+
+def test_descricao_repetida_em_varios_arquivos_e_vinculada_uma_vez(banco_vazio, monkeypatch):
+    chamadas = []
+    vincular = ingestao.vincular_descricoes
+    monkeypatch.setattr(ingestao, 'vincular_descricoes', lambda cursor, descricoes, indice: chamadas.append(list(descricoes)) or vincular(cursor, descricoes, indice))
+
+    relatorio = ingestao.inserir_dados([
+        _arquivo('a.xml', [('CABO FLEX 2,5MM', 10, 1.0), ('CABO FLEX 2,5MM', 5, 2.0), ('FITA ISOLANTE', 1, 3.0)]),
+        _arquivo('b.xml', [('CABO FLEX 2,5MM', 10, 3.0), ('Cabo Flex 2.5 mm', 2, 4.0)]),
+    ])
+
+    assert relatorio['registros'] == 5
+    assert chamadas == [['CABO FLEX 2,5MM', 'FITA ISOLANTE'], ['Cabo Flex 2.5 mm']]
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    assert conexao.execute("SELECT COUNT(*) FROM descricoes_materiais").fetchone()[0] == 3
+    assert conexao.execute("SELECT COUNT(*) FROM materiais_canonicos").fetchone()[0] == 2
+    conexao.close()
+
+
+def test_arquivo_desfeito_nao_deixa_vinculos_para_os_seguintes(banco_vazio, monkeypatch):
+    finalizar = ingestao.finalizar_carga_em_lote
+    falhas = iter([True])
+
+    def finalizar_com_falha(cursor, ultimo_id):
+        if next(falhas, False):
+            raise RuntimeError('falha simulada')
+        finalizar(cursor, ultimo_id)
+    monkeypatch.setattr(ingestao, 'finalizar_carga_em_lote', finalizar_com_falha)
+
+    relatorio = ingestao.inserir_dados([
+        _arquivo('ruim.xml', [('PARAFUSO M6', 10, 1.0)]),
+        _arquivo('bom.xml', [('PARAFUSO M6', 4, 2.0)]),
+    ])
+
+    assert [r['status'] for r in relatorio['arquivos']] == ['erro', 'ok']
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    # O vínculo criado pelo arquivo desfeito sumiu com ele; o seguinte vinculou de novo
+    cursor = conexao.cursor()
+    assert materiais_canonicos.descricao_canonica(cursor, 'PARAFUSO M6') == 'PARAFUSO M6'
+    assert conexao.execute("SELECT COUNT(*) FROM materiais_canonicos").fetchone()[0] == 1
+    assert conexao.execute("SELECT quantidade_total, valor_total FROM estado_custo_medio").fetchall() == [(4, 8.0)]
+    conexao.close()
+
+
+def test_carga_em_lote_igual_a_notas_aplicadas_uma_a_uma(banco_vazio, tmp_path):
+    ingestao.inserir_dados([
+        _arquivo('a.xml', [('CABO FLEX 2,5MM', 10, 1.0), ('FITA ISOLANTE', 3, 2.0), (None, 1, 1.0)], data='2024-02-01'),
+        _arquivo('b.xml', [('Cabo Flex 2.5 mm', 5, 2.0), ('FITA ISOLANTE', 0, 2.0)], data='2024-01-01'),
+    ])
+    ingestao.inserir_dados([_arquivo('c.xml', [('CABO FLEX 2,5 MM', 7, 3.0)], data='2024-03-01')])
+
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    em_lote = _estado_e_camadas(conexao)
+    conexao.close()
+    assert em_lote == _estado_e_camadas(banco_reconstruido(banco_vazio, str(tmp_path / 'novo.db')))
+    assert em_lote[0] == [('CABO FLEX 2,5MM', 22, pytest.approx(41.0)), ('FITA ISOLANTE', 3, pytest.approx(6.0))]
@@ -0,0 +1,19 @@
+from app import MODULOS_PADRAO, criar_app
+from benchmark_inicializacao import MODULOS_PESADOS, medir
+
+
+def test_criar_app_registra_so_os_modulos_pedidos(banco_vazio):
+    assert set(criar_app('leitura').blueprints) == {'leitura'}
+    assert set(criar_app().blueprints) == set(MODULOS_PADRAO.split(','))
+
+
+def test_benchmark_mede_os_modulos_padrao_do_app(tmp_path, monkeypatch):
+    monkeypatch.delenv('BACKEND_MODULOS', raising=False)
+    _, _, carregados = medir(None, str(tmp_path / 'benchmark.db'))
+    assert carregados.split(',') == MODULOS_PADRAO.split(',')
+
+
+def test_worker_de_leitura_nao_carrega_modulos_pesados(tmp_path):
+    _, imports, carregados = medir('leitura', str(tmp_path / 'benchmark.db'))
+    assert carregados == 'leitura'
+    assert not {nome.split('.')[0] for nome, _, _ in imports} & set(MODULOS_PESADOS)
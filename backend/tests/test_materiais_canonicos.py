@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+import banco
+import materiais_canonicos
+from materiais_canonicos import fundir_materiais, vincular_descricao
+
+
+@pytest.fixture
+def conexao(banco_vazio):
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    yield conexao
+    conexao.close()
+
+
+def _vinculo(conexao, descricao):
+    return conexao.execute('''
+        SELECT dm.status, mc.id, mc.descricao FROM descricoes_materiais dm
+        LEFT JOIN materiais_canonicos mc ON mc.id = dm.material_id
+        WHERE dm.descricao_produto = ?
+    ''', (descricao,)).fetchone()
+
+
+def test_indice_e_mantido_entre_chamadas(conexao, banco_vazio):
+    vincular_descricao(conexao.cursor(), 'CABO FLEXIVEL 2.5MM AZUL')
+    conexao.commit()
+    indice = materiais_canonicos._indices_confirmados[banco_vazio]
+
+    # Material criado por outra conexão entra no mesmo índice, sem montá-lo de novo
+    outra = sqlite3.connect(banco_vazio)
+    vincular_descricao(outra.cursor(), 'FITA ISOLANTE 19MM PRETA')
+    outra.commit()
+    outra.close()
+
+    assert vincular_descricao(conexao.cursor(), 'FITA ISOLANTE 19MM PRETA.') == 'FITA ISOLANTE 19MM PRETA'
+    assert vincular_descricao(conexao.cursor(), 'CABO FLEXIVEL 2,5 MM AZUL') == 'CABO FLEXIVEL 2.5MM AZUL'
+    conexao.commit()
+    assert materiais_canonicos._indices_confirmados[banco_vazio] is indice
+    assert len(indice.trigramas) == 2
+
+
+def test_material_de_transacao_desfeita_nao_fica_no_indice(conexao, banco_vazio):
+    vincular_descricao(conexao.cursor(), 'CABO FLEXIVEL 2.5MM AZUL')
+    conexao.commit()
+    vincular_descricao(conexao.cursor(), 'PARAFUSO SEXTAVADO M6 X 20')
+    conexao.rollback()
+
+    assert vincular_descricao(conexao.cursor(), 'PARAFUSO SEXTAVADO M6X20') == 'PARAFUSO SEXTAVADO M6X20'
+    conexao.commit()
+    status, material_id, _ = _vinculo(conexao, 'PARAFUSO SEXTAVADO M6X20')
+    assert status == 'novo' and material_id is not None
+
+
+def test_fusao_refaz_o_indice(conexao, banco_vazio):
+    vincular_descricao(conexao.cursor(), 'CABO FLEXIVEL 2.5MM AZUL')
+    vincular_descricao(conexao.cursor(), 'CABO FLEXIVEL 2.5MM VERMELHO')
+    conexao.commit()
+    _, origem, _ = _vinculo(conexao, 'CABO FLEXIVEL 2.5MM VERMELHO')
+    _, destino, _ = _vinculo(conexao, 'CABO FLEXIVEL 2.5MM AZUL')
+    indice = materiais_canonicos._indices_confirmados[banco_vazio]
+
+    fundir_materiais(conexao.cursor(), origem, destino)
+    conexao.commit()
+
+    # A chave do material removido não aponta mais para ele
+    assert vincular_descricao(conexao.cursor(), 'Cabo Flexivel 2,5mm Vermelho') == 'Cabo Flexivel 2,5mm Vermelho'
+    conexao.commit()
+    assert materiais_canonicos._indices_confirmados[banco_vazio] is not indice
+    # O id do material removido pode ser reaproveitado pelo novo
+    assert _vinculo(conexao, 'Cabo Flexivel 2,5mm Vermelho')[2] == 'Cabo Flexivel 2,5mm Vermelho'
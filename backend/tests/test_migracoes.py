@@ -0,0 +1,94 @@
+import sqlite3
+
+import banco
+from conftest import banco_reconstruido
+from custeio_estoque import registrar_baixa
+from materiais_canonicos import vincular_descricao
+
+
+def _aplicar(caminho, migracoes, versao):
+    conexao = sqlite3.connect(caminho, isolation_level=None)
+    cursor = conexao.cursor()
+    cursor.execute("BEGIN")
+    for migracao in migracoes:
+        migracao(cursor)
+    cursor.execute(f"PRAGMA user_version = {versao}")
+    cursor.execute("COMMIT")
+    return conexao
+
+
+def _estado(conexao):
+    estado = conexao.execute("SELECT descricao_produto, ROUND(quantidade_total, 6), ROUND(valor_total, 6) FROM estado_custo_medio ORDER BY 1").fetchall()
+    camadas = conexao.execute("SELECT nota_id, descricao_produto, quantidade_restante FROM camadas_fifo ORDER BY 1").fetchall()
+    return estado, camadas
+
+
+def _esquema(conexao):
+    return conexao.execute("SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'view', 'index') ORDER BY 1, 2").fetchall()
+
+
+def test_banco_antigo_sem_versao_e_atualizado(banco_exemplo, tmp_path):
+    assert sqlite3.connect(banco_exemplo).execute("PRAGMA user_version").fetchone()[0] == 0
+
+    assert banco.preparar_banco() is True
+    conexao = sqlite3.connect(banco_exemplo)
+    assert conexao.execute("PRAGMA user_version").fetchone()[0] == banco.VERSAO_ESQUEMA
+
+    # O estado montado pelas migrações é o mesmo de um banco novo que recebe as notas uma a uma
+    assert _estado(conexao) == _estado(banco_reconstruido(banco_exemplo, str(tmp_path / 'novo.db')))
+    assert conexao.execute("SELECT COUNT(*) FROM materias_primas_detalhadas").fetchone()[0] > 0
+
+
+def test_atualizacao_a_partir_da_versao_4(banco_vazio):
+    conexao = _aplicar(banco_vazio, banco.MIGRACOES[:4], 4)
+    conexao.executemany(
+        "INSERT INTO notas_fiscais (descricao_produto, data_emissao_nota, quantidade, valor_unitario, unidade_medida) VALUES (?, ?, ?, ?, 'UN')",
+        [('Parafuso M6x20', '2024-01-01', 10, 1.0), ('PARAFUSO M6 X 20', '2024-02-01', 5, 4.0)]
+    )
+    conexao.commit()
+    # Na versão 4 o estado ainda é separado pelo texto da descrição
+    assert len(_estado(conexao)[0]) == 2
+
+    assert banco.preparar_banco() is True
+    assert conexao.execute("PRAGMA user_version").fetchone()[0] == banco.VERSAO_ESQUEMA
+    estado, camadas = _estado(conexao)
+    assert estado == [('Parafuso M6x20', 15.0, 30.0)]
+    assert {c[1] for c in camadas} == {'Parafuso M6x20'}
+
+    # Os triggers recriados já agrupam novas notas pelo material canônico (vinculadas como na ingestão)
+    vincular_descricao(conexao.cursor(), 'parafuso m6 x 20')
+    conexao.execute("INSERT INTO notas_fiscais (descricao_produto, data_emissao_nota, quantidade, valor_unitario) VALUES ('parafuso m6 x 20', '2024-03-01', 5, 2.0)")
+    conexao.commit()
+    assert _estado(conexao)[0] == [('Parafuso M6x20', 20.0, 40.0)]
+
+
+def test_banco_atualizado_tem_o_mesmo_esquema_de_um_novo(banco_vazio, tmp_path):
+    _aplicar(banco_vazio, banco.MIGRACOES[:4], 4).close()
+    banco.preparar_banco()
+
+    novo = str(tmp_path / 'novo.db')
+    _aplicar(novo, banco.MIGRACOES, banco.VERSAO_ESQUEMA).close()
+
+    assert _esquema(sqlite3.connect(banco_vazio)) == _esquema(sqlite3.connect(novo))
+
+
+def test_banco_atualizado_estorna_so_o_saldo_nao_baixado(banco_vazio):
+    conexao = _aplicar(banco_vazio, banco.MIGRACOES[:4], 4)
+    conexao.executemany(
+        "INSERT INTO notas_fiscais (descricao_produto, data_emissao_nota, quantidade, valor_unitario) VALUES (?, ?, ?, ?)",
+        [('CABO', '2024-01-01', 10, 1.0), ('CABO', '2024-02-01', 10, 3.0)]
+    )
+    conexao.commit()
+    banco.preparar_banco()
+
+    # Os triggers da migração 005 já são os finais: a nota consumida pela baixa não é estornada
+    registrar_baixa(conexao.cursor(), 'CABO', 15)
+    conexao.execute("DELETE FROM notas_fiscais WHERE data_emissao_nota = '2024-01-01'")
+    conexao.commit()
+    assert _estado(conexao) == ([('CABO', 5.0, 10.0)], [(2, 'CABO', 5.0)])
+
+
+def test_banco_ja_atualizado_nao_reaplica_migracoes(banco_vazio):
+    assert banco.preparar_banco() is True
+    banco._bancos_preparados.clear()
+    assert banco.preparar_banco() is False
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+import banco
+import painel
+
+
+@pytest.fixture
+def sem_atraso(monkeypatch):
+    monkeypatch.setattr(painel, 'ATRASO_ATUALIZACAO', 0)
+
+
+def _aguardar_recalculo():
+    for agendamento in threading.enumerate():
+        if isinstance(agendamento, threading.Timer):
+            agendamento.join()
+
+
+def _dashboard_so_do_cache(cliente, monkeypatch):
+    # Na requisição de leitura o painel nunca é montado
+    def falhar(cursor):
+        raise AssertionError('dashboard recalculado na leitura')
+    with monkeypatch.context() as m:
+        m.setattr(painel, 'montar_painel', falhar)
+        resposta = cliente.get('/dashboard')
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def test_escrita_recalcula_o_painel_em_segundo_plano(cliente, sem_atraso, monkeypatch):
+    assert cliente.get('/dashboard').get_json()['total_materias_primas'] == 0
+
+    resposta = cliente.post('/adicionar-manual', json={'descricao': 'CABO', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 2.0})
+    assert resposta.status_code == 200
+    _aguardar_recalculo()
+
+    dados = _dashboard_so_do_cache(cliente, monkeypatch)
+    assert dados['total_materias_primas'] == 1
+    assert dados['desatualizado'] is False
+
+
+def test_escrita_recusada_nao_agenda_recalculo(cliente, monkeypatch):
+    cliente.get('/dashboard')
+    agendadas = []
+    monkeypatch.setattr(painel, '_executar_atualizacao', agendadas.append)
+    monkeypatch.setattr(painel, 'ATRASO_ATUALIZACAO', 0)
+    assert cliente.put('/produtos-cadastrados/1/materias-primas', json=[1]).status_code == 400
+    _aguardar_recalculo()
+    assert agendadas == []
+
+
+def test_cache_desatualizado_e_servido_e_recalculado(cliente, sem_atraso, monkeypatch):
+    cliente.get('/dashboard')
+    # Escrita fora do app (sem o gancho de recálculo), como uma migração ou um script
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    conexao.execute("INSERT INTO notas_fiscais (descricao_produto, quantidade, valor_unitario) VALUES ('FITA', 1, 1.0)")
+    conexao.commit()
+    conexao.close()
+
+    dados = _dashboard_so_do_cache(cliente, monkeypatch)
+    assert dados['desatualizado'] is True
+    assert dados['total_materias_primas'] == 0
+
+    _aguardar_recalculo()
+    dados = _dashboard_so_do_cache(cliente, monkeypatch)
+    assert dados['desatualizado'] is False
+    assert dados['total_materias_primas'] == 1
@@ -0,0 +1,187 @@
+import json
+import sqlite3
+
+import pytest
+
+import banco
+import regras_custo
+from materiais_canonicos import fundir_materiais, vincular_descricao
+from regras_custo import MODELOS_REGRAS, REGRAS_PADRAO, compilar_regras, validar_regras
+
+# CASE fixo da view antiga, aplicado às mesmas notas escolhidas pela view atual: isola o
+# motor de regras do agrupamento por material canônico
+_TOTAIS_CASE_ORIGINAL = '''
+    SELECT p.id, SUM(pmp.quantidade_utilizada * COALESCE(
+        CASE
+            WHEN mpd.unidade_medida_padrao IN ('UN', 'MT', 'KG') THEN mpd.valor_unitario_nf
+            WHEN mpd.unidade_medida_padrao IN ('LT') AND mpd.peso_bruto IS NOT NULL AND mpd.peso_bruto > 0
+            THEN (mpd.valor_unitario_nf * 1.0) / mpd.peso_bruto
+            ELSE NULL
+        END, 0))
+    FROM produtos p
+    JOIN produto_materias_primas pmp ON p.id = pmp.produto_id
+    JOIN notas_fiscais_canonicas nfc ON nfc.id = pmp.materia_prima_id
+    JOIN materias_primas_detalhadas mpd ON mpd.descricao_produto = nfc.descricao_canonica
+    GROUP BY p.id
+'''
+
+
+def _totais(cliente):
+    resposta = cliente.get('/produtos-cadastrados')
+    assert resposta.status_code == 200
+    return {p['ID_Produto']: p['Total_Produto'] for p in resposta.get_json()}
+
+
+def test_totais_dos_produtos_iguais_ao_case_original(banco_exemplo, cliente_exemplo):
+    totais = _totais(cliente_exemplo)
+    esperado = dict(sqlite3.connect(banco_exemplo).execute(_TOTAIS_CASE_ORIGINAL).fetchall())
+    assert esperado
+
+    assert totais.keys() == esperado.keys()
+    for produto_id, total in esperado.items():
+        assert totais[produto_id] == pytest.approx(total)
+
+
+def test_banco_novo_tem_uma_versao_de_regras_igual_ao_case(banco_vazio):
+    banco.preparar_banco()
+    cursor = sqlite3.connect(banco_vazio).cursor()
+    cursor.execute("SELECT regras FROM regras_custo")
+    versoes = cursor.fetchall()
+    assert len(versoes) == 1
+    assert validar_regras(json.loads(versoes[0][0])) == REGRAS_PADRAO
+
+
+def _custos(regras):
+    import pandas as pd
+
+    notas = pd.DataFrame([
+        (1, 'ROLO', '2024-01-01', 1, 'RL', 10.0),
+        (2, 'CAIXA', '2024-01-01', 1, 'CX', 8.0),
+        (3, 'GRAMAS', '2024-01-01', 1, 'G', 3.0),
+        (4, 'TINTA', '2024-01-01', 1, 'UN', 10.0),
+        (5, 'TINTA SEM PESO', '2024-01-01', 1, 'UN', 10.0),
+        (6, 'MINUSCULA', '2024-01-01', 1, 'UN', 7.0),
+        (7, 'SEM ATRIBUTO', '2024-01-01', 1, 'UN', 7.0),
+    ], columns=['id', 'descricao_produto', 'data_emissao_nota', 'quantidade', 'unidade_medida_nf', 'valor_unitario_nf'])
+    atributos = pd.DataFrame([
+        ('ROLO', 2.0, 'MT'), ('CAIXA', 4.0, 'UN'), ('GRAMAS', None, 'KG'),
+        ('TINTA', 2.0, 'LT'), ('TINTA SEM PESO', None, 'LT'), ('MINUSCULA', None, 'un'),
+    ], columns=['descricao_produto', 'peso_bruto', 'unidade_medida_padrao'])
+    estado = pd.DataFrame(columns=['descricao_produto', 'custo_medio', 'custo_fifo'])
+
+    custos = compilar_regras(0, json.dumps(regras))(notas, atributos, estado)
+    return {d: (None if c != c else c) for d, c in zip(custos['descricao_produto'], custos['custo_por_unidade_padrao'])}
+
+
+def test_regras_padrao_seguem_o_case_original():
+    assert _custos(REGRAS_PADRAO) == {
+        'ROLO': 10.0, 'CAIXA': 8.0, 'GRAMAS': 3.0, 'TINTA': 5.0,
+        'TINTA SEM PESO': None, 'MINUSCULA': None, 'SEM ATRIBUTO': None,
+    }
+
+
+def test_modelo_de_embalagem_converte_caixa_rolo_e_grama():
+    custos = _custos(MODELOS_REGRAS['conversoes_embalagem'])
+    assert custos['ROLO'] == 5.0
+    assert custos['CAIXA'] == 2.0
+    assert custos['GRAMAS'] == pytest.approx(3000.0)
+    assert custos['TINTA'] == 5.0
+
+
+def test_modelo_e_publicado_pelo_put(cliente):
+    modelos = cliente.get('/regras-custo/modelos').get_json()
+    assert modelos == MODELOS_REGRAS
+
+    resposta = cliente.put('/regras-custo', json=modelos['conversoes_embalagem'])
+    assert resposta.status_code == 200
+    assert cliente.get('/regras-custo').get_json()['regras'] == MODELOS_REGRAS['conversoes_embalagem']
+
+
+@pytest.mark.parametrize('regras', [
+    {'conversoes': ['CX']},
+    {'conversoes': [None]},
+    {'conversoes': [{'de': 'CX', 'para': 5}]},
+    {'conversoes': [{'de': '*', 'para': 'UN', 'divisor': 'x'}]},
+    {'conversoes': [{'de': '*', 'para': 'UN', 'divisor': True}]},
+    {'conversoes': {'de': '*'}},
+    {'rateio': [1, 2]},
+    {'rateio': {'frete_percentual': -1}},
+    {'politica_preco': 'maior'},
+    {'ultimas_n': 0},
+    ['recente'],
+])
+def test_regras_invalidas_sao_recusadas_com_400(cliente, regras):
+    resposta = cliente.put('/regras-custo', json=regras)
+    assert resposta.status_code == 400
+    assert 'error' in resposta.get_json()
+
+
+def _custos_gravados(caminho):
+    conexao = sqlite3.connect(caminho)
+    custos = dict(conexao.execute("SELECT descricao_produto, custo_por_unidade_padrao FROM custos_materias_primas").fetchall())
+    conexao.close()
+    return custos
+
+
+@pytest.mark.parametrize('politica', ['recente', 'fifo', 'media_ultimas_n'])
+def test_escritas_atualizam_so_os_custos_tocados(cliente, banco_vazio, monkeypatch, politica):
+    assert cliente.put('/regras-custo', json=dict(REGRAS_PADRAO, politica_preco=politica)).status_code == 200
+    cliente.post('/adicionar-manual', json=[
+        {'descricao': 'CABO', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 2.0},
+        {'descricao': 'FITA', 'unidade': 'UN', 'quantidade': 5, 'valorUnitario': 1.0},
+    ])
+    cliente.get('/materias-primas')
+
+    passadas = []
+    recalcular = regras_custo.recalcular_custos
+    monkeypatch.setattr(regras_custo, 'recalcular_custos', lambda conexao: passadas.append(1) or recalcular(conexao))
+
+    cliente.post('/adicionar-manual', json=[
+        {'descricao': 'CABO', 'unidade': 'MT', 'quantidade': 10, 'valorUnitario': 3.0},
+        {'descricao': 'PARAFUSO', 'unidade': 'UN', 'quantidade': 1, 'valorUnitario': 5.0},
+    ])
+    materiais = {m['descricao_produto']: m for m in cliente.get('/materias-primas').get_json()}
+    assert materiais['PARAFUSO']['custo_por_unidade_padrao'] is None
+    cliente.post('/mapear-atributos', json={'descricao_produto': 'PARAFUSO', 'peso_bruto': 2, 'unidade_medida_padrao': 'LT'})
+    cliente.post('/mapear-atributos/lote', json={'atributos': [{'descricao_produto': 'CABO', 'unidade_medida_padrao': 'MT'}]})
+    assert cliente.post('/materias-primas/baixa', json={'descricao_produto': 'CABO', 'quantidade': 12}).status_code == 200
+    materiais = {m['descricao_produto']: m for m in cliente.get('/materias-primas').get_json()}
+    assert materiais['PARAFUSO']['custo_por_unidade_padrao'] == 2.5
+    # A nota muda de material: o de origem some e o de destino é recalculado
+    cliente.put(f"/materias-primas/{materiais['PARAFUSO']['id']}", json={'descricao_produto': 'FITA'})
+    cliente.delete(f"/materias-primas/{materiais['CABO']['id']}")
+    cliente.get('/materias-primas')
+
+    assert passadas == []
+    incrementais = _custos_gravados(banco_vazio)
+    assert 'PARAFUSO' not in incrementais
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    recalcular(conexao)
+    conexao.close()
+    assert incrementais == _custos_gravados(banco_vazio)
+
+
+def test_fusao_de_materiais_atualiza_os_dois_custos(banco_vazio):
+    conexao = banco.conectar(banco.EMPRESA_PADRAO)
+    cursor = conexao.cursor()
+    for descricao, valor in (('CABO AZUL', 2.0), ('CABO VERDE', 4.0)):
+        vincular_descricao(cursor, descricao)
+        cursor.execute(
+            "INSERT INTO notas_fiscais (descricao_produto, data_emissao_nota, quantidade, valor_unitario) VALUES (?, '2024-01-01', 1, ?)",
+            (descricao, valor)
+        )
+    cursor.execute("INSERT INTO atributos_materias_primas (descricao_produto, unidade_medida_padrao) VALUES ('CABO AZUL', 'UN')")
+    conexao.commit()
+    regras_custo.recalcular_custos(conexao)
+    assert _custos_gravados(banco_vazio) == {'CABO AZUL': 2.0, 'CABO VERDE': None}
+    origem, destino = (cursor.execute("SELECT id FROM materiais_canonicos WHERE descricao = ?", (d,)).fetchone()[0]
+                       for d in ('CABO VERDE', 'CABO AZUL'))
+
+    assert regras_custo.custos_em_dia(cursor)
+    fundir_materiais(cursor, origem, destino)
+    regras_custo.atualizar_custos(cursor, ['CABO VERDE'])
+    conexao.commit()
+
+    assert regras_custo.custos_em_dia(cursor)
+    assert _custos_gravados(banco_vazio) == {'CABO AZUL': 2.0}
+    conexao.close()
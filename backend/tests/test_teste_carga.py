@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import teste_carga
+
+
+@pytest.mark.parametrize('p, esperado', [(50, 5), (95, 10), (99, 10), (10, 1), (11, 2), (0, 1)])
+def test_percentil_nearest_rank(p, esperado):
+    assert teste_carga.percentil(list(range(1, 11)), p) == esperado
+
+
+def test_percentil_poucas_medicoes():
+    assert teste_carga.percentil([], 95) is None
+    assert teste_carga.percentil([7.0], 99) == 7.0
+    assert teste_carga.percentil([1.0, 2.0], 50) == 1.0
+
+
+def test_sugestoes_medidas_por_rota():
+    assert teste_carga.OPERACOES['sugestoes_emissores'](random.Random(0), None, None)[1] == '/sugestoes/emissores_cnpj'
+    assert teste_carga.OPERACOES['sugestoes_codigos'](random.Random(0), None, None)[1] == '/sugestoes/codigos_produto'
+    assert set(teste_carga.MIX_PADRAO) <= set(teste_carga.OPERACOES)
+
+    resumo = teste_carga.resumir([('sugestoes_emissores', 200, 10.0, False), ('sugestoes_codigos', 200, 90.0, False)], 1)
+    assert resumo['sugestoes_emissores']['p99_ms'] == 10.0
+    assert resumo['sugestoes_codigos']['p99_ms'] == 90.0
+
+
+def test_recusas_ficam_fora_das_latencias_e_tem_slo_proprio():
+    medicoes = [('upload_xml', 429, 1.0, False)] * 90 + [('upload_xml', 200, 4000.0, False)] * 10
+    resumo = teste_carga.resumir(medicoes, 1)['upload_xml']
+    assert resumo['p50_ms'] == resumo['p95_ms'] == 4000.0
+    assert resumo['taxa_erros'] == 0
+    assert resumo['taxa_recusadas'] == 0.9
+
+    violacoes = teste_carga.verificar_slo({'upload_xml': resumo}, teste_carga.SLO_PADRAO)
+    assert violacoes == ['upload_xml: taxa_recusadas = 0.9 (limite 0.05)']
+
+
+def test_rota_so_com_recusas():
+    resumo = teste_carga.resumir([('upload_xml', 429, 1.0, False)], 1)['upload_xml']
+    assert resumo['p95_ms'] is None and resumo['max_ms'] is None
+    teste_carga.imprimir({'upload_xml': resumo}, 1, 1)
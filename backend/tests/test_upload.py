@@ -0,0 +1,73 @@
+import io
+import threading
+
+import pytest
+
+import ingestao
+import upload_seguro
+from conftest import gerar_nfe
+from upload_seguro import detectar_tipo
+
+
+def _enviar(cliente, *arquivos):
+    dados = {'files[]': [(io.BytesIO(conteudo), nome) for nome, conteudo in arquivos]}
+    return cliente.post('/upload-xml', data=dados, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize('conteudo, tipo', [
+    (b'%PDF-1.7\n...', 'pdf'),
+    (b'\xef\xbb\xbf\r\n  %PDF-1.4', 'pdf'),
+    (b'GIF89a ... %PDF-1.4', None),
+    (b'<html>%PDF-1.4</html>', None),
+    (gerar_nfe([('CABO', 'MT', 1, 2.0)]), 'xml'),
+    (b'\xef\xbb\xbf<NFe xmlns="http://www.portalfiscal.inf.br/nfe">', 'xml'),
+    (b'<?xml version="1.0"?><!-- lote --><nfe:nfeProc xmlns:nfe="http://www.portalfiscal.inf.br/nfe">', 'xml'),
+    (b'<?xml version="1.0"?><enviNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">', 'xml'),
+    (b'<?xml version="1.0"?><svg xmlns="http://www.w3.org/2000/svg"></svg>', None),
+    (b'<?xml version="1.0"?><!DOCTYPE x [<!ENTITY a "b">]><nfeProc>', None),
+    (b'', None),
+])
+def test_detectar_tipo(conteudo, tipo):
+    assert detectar_tipo(io.BytesIO(conteudo)) == tipo
+
+
+def test_nfe_valida_e_gravada(cliente):
+    resposta = _enviar(cliente, ('nota.xml', gerar_nfe([('CABO FLEX 2,5MM', 'MT', 100, 1.5), ('FITA ISOLANTE', 'UN', 10, 4.0)])))
+    assert resposta.status_code == 200
+    assert resposta.get_json()['registros'] == 2
+
+
+def test_tipo_nao_suportado_e_recusado_antes_do_parsing(cliente):
+    resposta = _enviar(cliente, ('nota.xml', gerar_nfe([('CABO', 'MT', 1, 2.0)])),
+                       ('planilha.xml', b'<?xml version="1.0"?><Workbook></Workbook>'),
+                       ('nota.pdf', b'xx%PDF-1.4'))
+    assert resposta.status_code == 415
+    assert resposta.get_json()['arquivos'] == ['planilha.xml', 'nota.pdf']
+    assert cliente.get('/materias-primas').get_json() == []
+
+
+def test_arquivo_acima_do_limite(cliente, monkeypatch):
+    monkeypatch.setattr(upload_seguro, 'LIMITE_ARQUIVO', 1024)
+    resposta = _enviar(cliente, ('grande.pdf', b'%PDF-1.4' + b'0' * 4096))
+    assert resposta.status_code == 413
+
+
+def test_requisicao_acima_do_limite(cliente, monkeypatch):
+    monkeypatch.setattr(upload_seguro, 'LIMITE_REQUISICAO', 2048)
+    resposta = _enviar(cliente, *[(f'nota{i}.pdf', b'%PDF-1.4' + b'0' * 900) for i in range(4)])
+    assert resposta.status_code == 413
+
+
+def test_arquivos_demais(cliente, monkeypatch):
+    monkeypatch.setattr(ingestao, 'MAX_ARQUIVOS', 2)
+    resposta = _enviar(cliente, *[(f'nota{i}.pdf', b'%PDF-1.4') for i in range(3)])
+    assert resposta.status_code == 413
+
+
+def test_ingestoes_simultaneas_acima_do_limite(cliente, monkeypatch):
+    fila = threading.BoundedSemaphore(1)
+    fila.acquire()
+    monkeypatch.setattr(ingestao, 'fila_ingestao', fila)
+    resposta = _enviar(cliente, ('nota.pdf', b'%PDF-1.4'))
+    assert resposta.status_code == 429
+    assert resposta.headers['Retry-After']
@@ -0,0 +1,77 @@
+# Limites e validações aplicados aos uploads antes de qualquer parsing:
+# arquivos grandes vão para disco (SpooledTemporaryFile), cada arquivo e a requisição
+# têm tamanho máximo, o tipo é conferido pelos bytes iniciais e o número de
+# ingestões simultâneas por worker é limitado.
+import os
+import re
+import threading
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+MB = 1024 * 1024
+
+LIMITE_ARQUIVO = int(float(os.environ.get('UPLOAD_LIMITE_ARQUIVO_MB', 10)) * MB)
+LIMITE_REQUISICAO = int(float(os.environ.get('UPLOAD_LIMITE_REQUISICAO_MB', 50)) * MB)
+MAX_ARQUIVOS = int(os.environ.get('UPLOAD_MAX_ARQUIVOS', 50))
+# Acima deste tamanho a parte do multipart deixa a memória e vai para um arquivo temporário
+LIMITE_MEMORIA_ARQUIVO = int(os.environ.get('UPLOAD_LIMITE_MEMORIA_KB', 512)) * 1024
+MAX_INGESTOES_SIMULTANEAS = int(os.environ.get('MAX_INGESTOES_SIMULTANEAS', 2))
+RETRY_AFTER_SEGUNDOS = int(os.environ.get('UPLOAD_RETRY_AFTER_SEGUNDOS', 5))
+
+fila_ingestao = threading.BoundedSemaphore(MAX_INGESTOES_SIMULTANEAS)
+
+
+class ArquivoTemporarioLimitado(SpooledTemporaryFile):
+    # Interrompe o recebimento assim que um único arquivo passa do limite,
+    # sem esperar o multipart inteiro chegar
+    def __init__(self, limite, **kwargs):
+        super().__init__(max_size=LIMITE_MEMORIA_ARQUIVO, mode='w+b', **kwargs)
+        self._limite = limite
+        self._escrito = 0
+
+    def write(self, dados):
+        self._escrito += len(dados)
+        if self._escrito > self._limite:
+            raise RequestEntityTooLarge(
+                f"Arquivo acima do limite de {self._limite / MB:g} MB por arquivo."
+            )
+        return super().write(dados)
+
+
+class RequisicaoComUploadLimitado(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return ArquivoTemporarioLimitado(LIMITE_ARQUIVO)
+
+
+def aplicar_limites(requisicao):
+    # Precisa rodar antes do primeiro acesso a request.files
+    requisicao.max_content_length = LIMITE_REQUISICAO
+    requisicao.max_form_parts = MAX_ARQUIVOS + 100
+
+
+# Antes do elemento raiz do XML só podem vir a declaração, comentários e instruções de processamento
+_PROLOGO_XML = re.compile(rb'(?:\s+|<\?.*?\?>|<!--.*?-->)*', re.S)
+_RAIZ_XML = re.compile(rb'<(?:[\w.-]+:)?([\w.-]+)([^>]*)>')
+RAIZES_NFE = (b'nfeProc', b'NFe')
+NAMESPACE_NFE = b'http://www.portalfiscal.inf.br/nfe'
+
+
+def detectar_tipo(arquivo):
+    # Confere os bytes iniciais; extensão e Content-Type enviados pelo cliente não são confiáveis
+    arquivo.seek(0)
+    inicio = arquivo.read(4096)
+    arquivo.seek(0)
+
+    # Só espaços ou BOM são tolerados antes da assinatura
+    inicio = inicio.lstrip().removeprefix(b'\xef\xbb\xbf').lstrip()
+    if inicio.startswith(b'%PDF-'):
+        return 'pdf'
+
+    # XML só é aceito se for uma NF-e: raiz nfeProc/NFe ou no namespace do portal fiscal
+    raiz = _RAIZ_XML.match(inicio, _PROLOGO_XML.match(inicio).end())
+    if raiz and (raiz.group(1) in RAIZES_NFE or NAMESPACE_NFE in raiz.group(2)):
+        return 'xml'
+
+    return None
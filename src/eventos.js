@@ -0,0 +1,64 @@
+import { useEffect, useRef } from 'react';
+const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
+
+const TIPOS_EVENTO = ['materiais_alterados', 'produtos_alterados', 'notas_ingeridas', 'recarregar'];
+
+// Um único EventSource por aba, compartilhado por todos os componentes inscritos: cada stream
+// aberto ocupa uma thread do servidor enquanto dura (ver backend/gunicorn.conf.py)
+const inscritos = new Set();
+let fonte = null;
+let fechamentoAgendado = null;
+// Último evento recebido nesta aba: um stream aberto depois retoma daqui
+let ultimoSeq = null;
+
+function abrirFonte() {
+    const url = ultimoSeq !== null ? `${API_URL}/events?desde=${ultimoSeq}` : `${API_URL}/events`;
+    fonte = new EventSource(url);
+    TIPOS_EVENTO.forEach((tipo) => {
+        fonte.addEventListener(tipo, (evento) => {
+            ultimoSeq = Number(evento.lastEventId);
+            const dados = JSON.parse(evento.data);
+            inscritos.forEach((tratadoresRef) => {
+                const tratador = tratadoresRef.current[tipo];
+                if (tratador) tratador(dados);
+            });
+        });
+    });
+}
+
+// Inscreve o componente no feed /events e chama tratadores[tipo](dados) a cada alteração no servidor.
+// O servidor encerra o stream de tempos em tempos; o EventSource reconecta sozinho e envia
+// Last-Event-ID, então nada se perde entre conexões.
+export function useEventos(tratadores) {
+    const tratadoresRef = useRef(tratadores);
+    tratadoresRef.current = tratadores;
+
+    useEffect(() => {
+        inscritos.add(tratadoresRef);
+        clearTimeout(fechamentoAgendado);
+        if (!fonte) abrirFonte();
+        return () => {
+            inscritos.delete(tratadoresRef);
+            // Na troca de página a próxima se inscreve logo em seguida e reaproveita o stream
+            if (inscritos.size === 0) {
+                fechamentoAgendado = setTimeout(() => {
+                    if (inscritos.size === 0 && fonte) {
+                        fonte.close();
+                        fonte = null;
+                    }
+                }, 5000);
+            }
+        };
+    }, []);
+}
+
+// Troca as linhas que vieram no evento (mantendo a posição), tira as removidas e acrescenta as novas
+export function mesclarAlteracoes(lista, atualizados = [], removidos = [], chave) {
+    const porChave = new Map(atualizados.map(item => [item[chave], item]));
+    const excluidos = new Set(removidos);
+    const existentes = new Set(lista.map(item => item[chave]));
+    return [
+        ...lista.filter(item => !excluidos.has(item[chave])).map(item => porChave.get(item[chave]) || item),
+        ...atualizados.filter(item => !existentes.has(item[chave])),
+    ];
+}
@@ -43,29 +43,30 @@ export default function Dashboard() {
     );
   };
 
-  const [products, setProducts] = useState([]);
-  const [materials, setMaterials] = useState([]);
+  const [painel, setPainel] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [consultasHistorico, setConsultasHistorico] = useState([]);
   const [isClearModalOpen, setIsClearModalOpen] = useState(false);
 
   useEffect(() => {
+    let tentativas = 0;
+    let timer = null;
     const fetchDashboardData = async () => {
       try {
-        setLoading(true);
-        const [productsResponse, materialsResponse] = await Promise.all([
-          fetch(`${API_URL}/produtos-cadastrados`),
-          fetch(`${API_URL}/materias-primas`),
-        ]);
-        if (!productsResponse.ok || !materialsResponse.ok) {
+        // Indicadores já agregados no servidor: o tamanho da resposta não cresce com o catálogo
+        const response = await fetch(`${API_URL}/dashboard`);
+        if (!response.ok) {
           throw new Error("Falha ao buscar dados do servidor.");
         }
-        const productsData = await productsResponse.json();
-        const materialsData = await materialsResponse.json();
-        setProducts(productsData);
-        setMaterials(materialsData);
+        const dados = await response.json();
+        setPainel(dados);
         setError(null);
+        // O servidor recalcula o painel em segundo plano depois de uma escrita; busca de novo em seguida
+        if (dados.desatualizado && tentativas < 5) {
+          tentativas += 1;
+          timer = setTimeout(fetchDashboardData, 2000);
+        }
       } catch (err) {
         setError(err.message);
         console.error("Erro ao carregar dados do dashboard:", err);
@@ -74,6 +75,7 @@ export default function Dashboard() {
       }
     };
     fetchDashboardData();
+    return () => clearTimeout(timer);
   }, []);
 
   useEffect(() => {
@@ -86,22 +88,25 @@ export default function Dashboard() {
         }
   }, []);
 
-  const somaTotalProdutos = products.reduce(
-    (acc, p) => acc + (p.Total_Produto || 0),
-    0
-  );
-  const totalProdutos = products.length;
-  const precoMedioProduto =
-    totalProdutos > 0 ? somaTotalProdutos / totalProdutos : 0;
-  const totalMateriasPrimas = materials.length;
-  const chartData = products.map((p) => ({
+  const somaTotalProdutos = painel?.custo_total_produtos || 0;
+  const totalProdutos = painel?.total_produtos || 0;
+  const precoMedioProduto = painel?.custo_medio_produto || 0;
+  const totalMateriasPrimas = painel?.total_materias_primas || 0;
+  const produtosMaiorCusto = painel?.produtos_maior_custo || [];
+  const chartData = produtosMaiorCusto.map((p) => ({
     nome: p.Produto,
     custo: p.Total_Produto || 0,
   }));
-  const chartPizza = products.map((p) => ({
-    nome: p.Produto,
-    valor: somaTotalProdutos > 0 ? ((p.Total_Produto || 0) / somaTotalProdutos) * 100 : 0,
+  const fatiasPizza = painel?.custo_outros_produtos > 0
+    ? [...chartData, { nome: "Outros", custo: painel.custo_outros_produtos }]
+    : chartData;
+  const chartPizza = fatiasPizza.map((p) => ({
+    nome: p.nome,
+    valor: somaTotalProdutos > 0 ? (p.custo / somaTotalProdutos) * 100 : 0,
   }));
+  const materiaisPorUnidade = painel?.materiais_por_unidade || [];
+  const materiasNaoMapeadas = painel?.materias_primas_nao_mapeadas || [];
+  const variacoesPreco = painel?.variacoes_preco_recentes || [];
   const COLORS = ["#b91c1c", "#ef4444", "#fca5a5", "#4b5563", "#9ca3af", "#e5e7eb"];
 
   const handleLimparConsultas = () => {
@@ -171,7 +176,7 @@ export default function Dashboard() {
         <div className="grid grid-cols-1 md:grid-cols-2 gap-6 mb-6 w-full">
           <div className="bg-white dark:bg-gray-800 p-6 rounded-xl shadow-md border border-gray-200 dark:border-gray-700">
             <h4 className="text-lg font-semibold text-red-600 dark:text-red-500 mb-2">
-              Custo por Produto
+              Custo por Produto (maiores custos)
             </h4>
             {chartData.length === 0 ? (
               <p className="text-gray-500 dark:text-gray-400 text-center py-12">Nenhum produto para exibir</p>
@@ -234,6 +239,60 @@ export default function Dashboard() {
             )}
           </div>
         </div>
+        <div className="grid grid-cols-1 md:grid-cols-3 gap-6 mb-6 w-full">
+          <div className="bg-white dark:bg-gray-800 p-6 rounded-xl shadow-lg border border-gray-200 dark:border-gray-700">
+            <h4 className="text-lg font-semibold mb-4 text-red-600 dark:text-red-500">
+              Matérias-Primas por Unidade
+            </h4>
+            {materiaisPorUnidade.length === 0 ? (
+              <p className="text-gray-500 dark:text-gray-400 text-center py-6">Nenhuma matéria-prima cadastrada</p>
+            ) : (
+              <ul className="space-y-2">
+                {materiaisPorUnidade.map((u) => (
+                  <li key={u.unidade} className="flex justify-between text-gray-700 dark:text-gray-300">
+                    <span>{u.unidade}</span>
+                    <span className="font-semibold">{u.quantidade}</span>
+                  </li>
+                ))}
+              </ul>
+            )}
+          </div>
+          <div className="bg-white dark:bg-gray-800 p-6 rounded-xl shadow-lg border border-gray-200 dark:border-gray-700">
+            <h4 className="text-lg font-semibold mb-4 text-red-600 dark:text-red-500">
+              Sem Mapeamento ({painel?.total_nao_mapeadas || 0})
+            </h4>
+            {materiasNaoMapeadas.length === 0 ? (
+              <p className="text-gray-500 dark:text-gray-400 text-center py-6">Todas as matérias-primas estão mapeadas</p>
+            ) : (
+              <ul className="space-y-2">
+                {materiasNaoMapeadas.map((m) => (
+                  <li key={m.id} className="text-gray-700 dark:text-gray-300 truncate" title={m.descricao_produto}>
+                    {m.descricao_produto}
+                  </li>
+                ))}
+              </ul>
+            )}
+          </div>
+          <div className="bg-white dark:bg-gray-800 p-6 rounded-xl shadow-lg border border-gray-200 dark:border-gray-700">
+            <h4 className="text-lg font-semibold mb-4 text-red-600 dark:text-red-500">
+              Variações de Preço Recentes
+            </h4>
+            {variacoesPreco.length === 0 ? (
+              <p className="text-gray-500 dark:text-gray-400 text-center py-6">Nenhuma variação registrada</p>
+            ) : (
+              <ul className="space-y-2">
+                {variacoesPreco.map((v, index) => (
+                  <li key={`${v.descricao_produto}-${index}`} className="flex justify-between gap-2 text-gray-700 dark:text-gray-300">
+                    <span className="truncate" title={v.descricao_produto}>{v.descricao_produto}</span>
+                    <span className={`font-semibold whitespace-nowrap ${v.variacao_percentual > 0 ? 'text-red-600' : 'text-green-600'}`}>
+                      {v.variacao_percentual > 0 ? '+' : ''}{v.variacao_percentual.toFixed(1)}%
+                    </span>
+                  </li>
+                ))}
+              </ul>
+            )}
+          </div>
+        </div>
         <div className="mt-10 bg-white dark:bg-gray-800 p-6 rounded-xl shadow-lg border border-gray-200 dark:border-gray-700">
           <div className="flex justify-between items-center mb-4">
             <h4 className="text-lg font-semibold text-red-600 dark:text-red-500">
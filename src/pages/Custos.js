@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import * as XLSX from 'xlsx';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
+import { mesclarAlteracoes, useEventos } from '../eventos';
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
 function Custos() {
@@ -16,24 +17,45 @@ function Custos() {
     const [validationMessage, setValidationMessage] = useState('');
     const [isSaveQueryModalOpen, setIsSaveQueryModalOpen] = useState(false);
 
-    useEffect(() => {
-        const fetchAllProducts = async () => {
-            try {
-                const response = await fetch(`${API_URL}/produtos-cadastrados`);
-                if (!response.ok) {
-                    throw new Error('Erro ao buscar a lista de produtos.');
-                }
-                const data = await response.json();
-                setProducts(data);
-                setLoading(false);
-            } catch (err) {
-                setError(err.message);
-                setLoading(false);
+    const fetchAllProducts = async () => {
+        try {
+            const response = await fetch(`${API_URL}/produtos-cadastrados`);
+            if (!response.ok) {
+                throw new Error('Erro ao buscar a lista de produtos.');
             }
-        };
+            const data = await response.json();
+            setProducts(data);
+            setLoading(false);
+        } catch (err) {
+            setError(err.message);
+            setLoading(false);
+        }
+    };
+
+    useEffect(() => {
         fetchAllProducts();
     }, []);
 
+    // Totais recalculados no servidor chegam pelo feed; o produto selecionado é recarregado se mudou
+    const aplicarProdutos = (dados) => {
+        if (!dados.produtos && !dados.produtos_removidos) return;
+        setProducts(prev => mesclarAlteracoes(prev, dados.produtos, dados.produtos_removidos, 'ID_Produto'));
+        if (selectedProduct) {
+            const atualizado = (dados.produtos || []).find(p => p.ID_Produto === selectedProduct.ID_Produto);
+            if (atualizado) {
+                setSelectedProduct(atualizado);
+            } else if ((dados.produtos_removidos || []).includes(selectedProduct.ID_Produto)) {
+                setSelectedProduct(null);
+            }
+        }
+    };
+    useEventos({
+        materiais_alterados: aplicarProdutos,
+        produtos_alterados: aplicarProdutos,
+        notas_ingeridas: aplicarProdutos,
+        recarregar: fetchAllProducts,
+    });
+
     useEffect(() => {
         if (!selectedProduct) {
             setRawMaterials([]);
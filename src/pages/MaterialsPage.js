@@ -1,4 +1,5 @@
 import React, { createContext, useContext, useEffect, useState } from "react";
+import { mesclarAlteracoes, useEventos } from "../eventos";
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
 const fakeUser = { uid: "mock-user-id" };
@@ -26,6 +27,15 @@ export function MaterialsProvider({ children }) {
         }
     };
     useEffect(() => { loadMaterials(); }, [user]);
+    // Alterações feitas por qualquer usuário chegam pelo feed e atualizam só as linhas afetadas
+    const aplicarMateriais = (dados) => {
+        setMaterials(prev => mesclarAlteracoes(prev, dados.materiais, dados.materiais_removidos, 'descricao_produto'));
+    };
+    useEventos({
+        materiais_alterados: aplicarMateriais,
+        notas_ingeridas: aplicarMateriais,
+        recarregar: loadMaterials,
+    });
     return (
         <MaterialsContext.Provider value={{ materials, setMaterials, reloadMaterials: loadMaterials }}>
             {children}
@@ -35,7 +45,7 @@ export function MaterialsProvider({ children }) {
 export function useMaterials() { return useContext(MaterialsContext); }
 
 export default function MaterialsPage() {
-    const { materials, reloadMaterials } = useMaterials();
+    const { materials } = useMaterials();
     const [editingId, setEditingId] = useState(null);
     const [editForm, setEditForm] = useState({});
     const [modalOpen, setModalOpen] = useState(false);
@@ -90,34 +100,30 @@ export default function MaterialsPage() {
         if (!savePayload) return;
         const { materialId, originalDescription } = savePayload;
         try {
-            const promessas = [];
-            promessas.push(fetch(`${API_URL}/mapear-atributos`, {
+            // Atributos e correção de preço vão juntos, numa única transação no backend
+            const response = await fetch(`${API_URL}/mapear-atributos/lote`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
-                    descricao_produto: originalDescription,
-                    peso_bruto: parseFloat(editForm.peso_bruto) || null,
-                    unidade_medida_padrao: editForm.unidade_medida_padrao,
-                }),
-            }));
-            promessas.push(fetch(`${API_URL}/materias-primas/${materialId}`, {
-                method: "PUT",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    descricao_produto: editForm.descricao_produto,
-                    unidade_medida: editForm.unidade_medida_nf,
-                    valor_unitario: parseFloat(editForm.valor_unitario_nf) || 0,
+                    atributos: [{
+                        descricao_produto: originalDescription,
+                        peso_bruto: parseFloat(editForm.peso_bruto) || null,
+                        unidade_medida_padrao: editForm.unidade_medida_padrao,
+                    }],
+                    precos: [{
+                        id: materialId,
+                        descricao_produto: editForm.descricao_produto,
+                        unidade_medida: editForm.unidade_medida_nf,
+                        valor_unitario: parseFloat(editForm.valor_unitario_nf) || 0,
+                    }],
                 }),
-            }));
-            const responses = await Promise.all(promessas);
-            for (const response of responses) {
-                if (!response.ok) {
-                    const errorData = await response.json().catch(() => ({}));
-                    throw new Error(`Falha ao salvar. Erro: ${errorData.error || response.statusText}`);
-                }
+            });
+            if (!response.ok) {
+                const errorData = await response.json().catch(() => ({}));
+                throw new Error(`Falha ao salvar. Erro: ${errorData.error || response.statusText}`);
             }
+            // A linha atualizada chega pelo feed /events (materiais_alterados), sem recarregar a lista
             setEditingId(null);
-            await reloadMaterials();
         } catch (error) {
             console.error("Erro ao salvar:", error);
             alert(error.message || "Erro ao salvar as alterações.");
@@ -146,8 +152,8 @@ export default function MaterialsPage() {
         try {
             const response = await fetch(`${API_URL}/materias-primas/${materialToDelete.id}`, { method: "DELETE" });
             if (!response.ok) throw new Error("Erro ao excluir material.");
+            // O feed traz a nota que passa a representar o material, ou o remove da lista
             setModalOpen(false);
-            await reloadMaterials();
         } catch (error) {
             alert(`Erro: ${error.message}`);
         }
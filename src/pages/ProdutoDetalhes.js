@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
+import { mesclarAlteracoes, useEventos } from '../eventos';
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
 function ProdutoDetalhes() {
@@ -89,6 +90,31 @@ function ProdutoDetalhes() {
         fetchDados();
     }, [id]);
 
+    // Só este produto é buscado de novo, e apenas se o evento o afetou e ninguém está editando
+    const buscarProduto = async () => {
+        const response = await fetch(`${API_URL}/produtos-cadastrados/${id}`);
+        if (!response.ok) return;
+        const produtoData = await response.json();
+        setProduto(produtoData);
+        setOriginalProduto(JSON.parse(JSON.stringify(produtoData)));
+        setNomeProdutoEditado(produtoData.nome_produto);
+    };
+    const aplicarEvento = (dados) => {
+        if (dados.materiais || dados.materiais_removidos) {
+            setMateriasPrimasDisponiveis(prev => mesclarAlteracoes(prev, dados.materiais, dados.materiais_removidos, 'descricao_produto'));
+        }
+        const afetados = [...(dados.produtos || []).map(p => p.ID_Produto), ...(dados.produtos_removidos || [])];
+        if (!isEditing && afetados.includes(Number(id))) {
+            buscarProduto();
+        }
+    };
+    useEventos({
+        materiais_alterados: aplicarEvento,
+        produtos_alterados: aplicarEvento,
+        notas_ingeridas: aplicarEvento,
+        recarregar: () => { if (!isEditing) fetchDados(); },
+    });
+
     const handleNomeProdutoChange = (e) => {
         setNomeProdutoEditado(e.target.value);
     };
@@ -101,69 +127,68 @@ function ProdutoDetalhes() {
         setIsSaveModalOpen(false);
     };
 
+    // Envia todas as alterações numa única requisição; o backend aplica tudo ou nada
+    // e devolve o produto já recalculado
+    const aplicarAlteracoes = async (alteracoes) => {
+        const response = await fetch(`${API_URL}/produtos-cadastrados/${id}/materias-primas`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(alteracoes)
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Falha ao salvar as alterações.');
+        }
+        setProduto(data.produto);
+        setOriginalProduto(JSON.parse(JSON.stringify(data.produto)));
+        setNomeProdutoEditado(data.produto.nome_produto);
+        return data.produto;
+    };
+
     const confirmSave = async () => {
-        try {
-            await fetch(`${API_URL}/produtos-cadastrados/${id}`, {
-                method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ nome_produto: nomeProdutoEditado })
-            });
-            const promessas = [];
-            for (const mpAtual of produto.materias_primas) {
-                const mpOriginal = originalProduto.materias_primas.find(m => m.id === mpAtual.id);
-                if (mpOriginal) {
-                    if (mpAtual.quantidade_utilizada !== mpOriginal.quantidade_utilizada ||
-                        mpAtual.unidade_medida !== mpOriginal.unidade_medida ||
-                        mpAtual.materia_prima_id !== mpOriginal.materia_prima_id) {
-                        promessas.push(
-                            fetch(`${API_URL}/produtos-cadastrados/${id}/editar-mp/${mpAtual.id}`, {
-                                method: 'PUT',
-                                headers: { 'Content-Type': 'application/json' },
-                                body: JSON.stringify({
-                                    materia_prima_id: mpAtual.materia_prima_id,
-                                    quantidade_utilizada: parseFloat(mpAtual.quantidade_utilizada),
-                                    unidade_medida: mpAtual.unidade_medida
-                                })
-                            })
-                        );
-                    }
-                } else {
-                    promessas.push(
-                        fetch(`${API_URL}/produtos-cadastrados/${id}/adicionar-mp`, {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({
-                                materia_prima_id: parseInt(mpAtual.materia_prima_id),
-                                quantidade_utilizada: parseFloat(mpAtual.quantidade_utilizada),
-                                unidade_medida: mpAtual.unidade_medida
-                            })
-                        })
-                    );
+        const alteracoes = { nome_produto: nomeProdutoEditado, adicionar: [], editar: [], remover: [] };
+        for (const mpAtual of produto.materias_primas) {
+            const mpOriginal = originalProduto.materias_primas.find(m => m.id === mpAtual.id);
+            if (mpOriginal) {
+                if (mpAtual.quantidade_utilizada !== mpOriginal.quantidade_utilizada ||
+                    mpAtual.unidade_medida !== mpOriginal.unidade_medida ||
+                    mpAtual.materia_prima_id !== mpOriginal.materia_prima_id) {
+                    alteracoes.editar.push({
+                        id: mpAtual.id,
+                        materia_prima_id: mpAtual.materia_prima_id,
+                        quantidade_utilizada: parseFloat(mpAtual.quantidade_utilizada),
+                        unidade_medida: mpAtual.unidade_medida
+                    });
                 }
+            } else {
+                alteracoes.adicionar.push({
+                    materia_prima_id: parseInt(mpAtual.materia_prima_id),
+                    quantidade_utilizada: parseFloat(mpAtual.quantidade_utilizada),
+                    unidade_medida: mpAtual.unidade_medida
+                });
             }
-            for (const mpOriginal of originalProduto.materias_primas) {
-                if (!produto.materias_primas.find(m => m.id === mpOriginal.id)) {
-                    promessas.push(
-                        fetch(`${API_URL}/produtos-cadastrados/${id}/remover-mp/${mpOriginal.id}`, {
-                            method: 'DELETE'
-                        })
-                    );
-                }
+        }
+        for (const mpOriginal of originalProduto.materias_primas) {
+            if (!produto.materias_primas.find(m => m.id === mpOriginal.id)) {
+                alteracoes.remover.push(mpOriginal.id);
             }
-            await Promise.all(promessas);
+        }
+        try {
+            await aplicarAlteracoes(alteracoes);
             setAlertModalMessage("Alterações salvas com sucesso!");
             setAlertModalType('success');
             setIsAlertModalOpen(true);
         } catch (err) {
             setError(err.message);
-            setAlertModalMessage("Ocorreu um erro ao salvar as alterações.");
+            setAlertModalMessage(err.message || "Ocorreu um erro ao salvar as alterações.");
             setAlertModalType('error');
             setIsAlertModalOpen(true);
+            // Nada foi gravado: volta para o estado salvo no servidor
+            setProduto(JSON.parse(JSON.stringify(originalProduto)));
+            setNomeProdutoEditado(originalProduto.nome_produto);
         } finally {
             closeSaveModal();
             setIsEditing(false);
-            setLoading(true);
-            fetchDados();
         }
     };
 
@@ -188,34 +213,19 @@ function ProdutoDetalhes() {
         closeAddMpModal();
         setLoading(true);
         try {
-            // Cria uma requisição para cada linha preenchida
-            const promessas = novasMateriasPrimas.map(novaMp =>
-                fetch(`${API_URL}/produtos-cadastrados/${id}/adicionar-mp`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        materia_prima_id: parseInt(novaMp.materia_prima_id),
-                        quantidade_utilizada: parseFloat(novaMp.quantidade_utilizada),
-                        unidade_medida: novaMp.unidade_medida
-                    })
-                })
-            );
-
-            const responses = await Promise.all(promessas);
-
-            // Verifica se todas as requisições deram certo
-            for (const response of responses) {
-                if (!response.ok) {
-                    const errorData = await response.json();
-                    throw new Error(errorData.error || 'Falha ao adicionar uma das matérias-primas.');
-                }
-            }
+            await aplicarAlteracoes({
+                adicionar: novasMateriasPrimas.map(novaMp => ({
+                    materia_prima_id: parseInt(novaMp.materia_prima_id),
+                    quantidade_utilizada: parseFloat(novaMp.quantidade_utilizada),
+                    unidade_medida: novaMp.unidade_medida
+                }))
+            });
 
             setAlertModalMessage("Matérias-primas adicionadas com sucesso!");
             setAlertModalType('success');
             setIsAlertModalOpen(true);
             setNovasMateriasPrimas([{ materia_prima_id: '', quantidade_utilizada: '', unidade_medida: '' }]); // Reseta o formulário
-            fetchDados(); // Atualiza a lista de MPs do produto
+            setLoading(false);
 
         } catch (err) {
             setAlertModalMessage(err.message);
@@ -262,14 +272,8 @@ function ProdutoDetalhes() {
         closeRemoveMpModal();
         setLoading(true);
         try {
-            const response = await fetch(`${API_URL}/produtos-cadastrados/${id}/remover-mp/${mpToRemoveId}`, {
-                method: 'DELETE'
-            });
-            if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.error || 'Falha ao remover a matéria-prima.');
-            }
-            await fetchDados();
+            await aplicarAlteracoes({ remover: [mpToRemoveId] });
+            setLoading(false);
             setAlertModalMessage("Matéria-prima removida com sucesso!");
             setAlertModalType('success');
             setIsAlertModalOpen(true);